@@ -6,7 +6,7 @@ from rest_framework import status
 from yaksh.models import (
     Question, Quiz, QuestionPaper, QuestionSet,
     AnswerPaper, Course, LearningModule, LearningUnit, StandardTestCase,
-    McqTestCase, Profile
+    McqTestCase, Profile, Answer
 )
 from api.serializers import (
     QuestionSerializer, QuizSerializer,
@@ -903,6 +903,7 @@ class AnswerValidatorTestCase(TestCase):
         if response.data.get('status') == 'done':
             result = json.loads(response.data.get('result'))
             self.assertTrue(result.get('success'))
+            self.assertIsNotNone(Answer.objects.get(pk=uid).wall_time)
         else:
             self.assertEqual(response.data.get('status'), 'running')
 
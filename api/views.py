@@ -41,6 +41,7 @@ import json
 from collections import defaultdict
 
 from yaksh.code_server import get_result as get_result_from_code_server
+from yaksh.code_server import fetch_result
 from yaksh.settings import SERVER_POOL_PORT, SERVER_HOST_NAME
 
 from api.serializers import (
@@ -996,6 +997,11 @@ class AnswerValidator(APIView):
                 json_data = question.consolidate_answer_data(user_answer, user)
 
             result = answerpaper.validate_answer(user_answer, question, json_data, ans.id)
+            if 'retry_after' in result:
+                return Response(
+                    result, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(result['retry_after'])}
+                )
 
             # Update answer object for non-code questions
             if question.type not in ['code', 'upload']:
@@ -1039,6 +1045,7 @@ class AnswerValidator(APIView):
         if result['status'] == 'done':
             final = json.loads(result['result'])
             ans.error = json.dumps(final.get('error'))
+            ans.set_resource_usage(final)
             if final.get('success'):
                 ans.correct = True
                 ans.marks = ans.question.points
@@ -3785,6 +3792,11 @@ def teacher_get_question(request, question_id):
             'solution': question.solution,
             'partial_grading': question.partial_grading,
             'grade_assignment_upload': question.grade_assignment_upload,
+            'cache_results': question.cache_results,
+            'parallel_test_cases': question.parallel_test_cases,
+            'fail_fast': question.fail_fast,
+            'time_limit': question.time_limit,
+            'cpu_limit': question.cpu_limit,
             'min_time': question.min_time,
             'test_cases': test_cases,
             'files': files  
@@ -4040,6 +4052,16 @@ def teacher_update_question(request, question_id):
             question.min_time = request.data['min_time']
         if 'grade_assignment_upload' in request.data:
             question.grade_assignment_upload = request.data['grade_assignment_upload']
+        if 'cache_results' in request.data:
+            question.cache_results = request.data['cache_results']
+        if 'parallel_test_cases' in request.data:
+            question.parallel_test_cases = request.data['parallel_test_cases']
+        if 'fail_fast' in request.data:
+            question.fail_fast = request.data['fail_fast']
+        if 'time_limit' in request.data:
+            question.time_limit = request.data['time_limit']
+        if 'cpu_limit' in request.data:
+            question.cpu_limit = request.data['cpu_limit']
 
         question.save()
 
@@ -6629,14 +6651,24 @@ def api_check_answer(request, q_id, attempt_num, module_id, questionpaper_id, co
         result = paper.validate_answer(
             user_answer, current_question, json_data, uid
         )
+
+        # The code server is too busy, ask the user to try again
+        if 'retry_after' in result:
+            return Response({
+                'error': result['error'][0],
+                'retry_after': result['retry_after'],
+                'answer_id': uid,
+                'question_id': current_question.id
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(result['retry_after'])})
         
         # Handle code question asynchronously
         if current_question.type == 'code':
             if paper.time_left() <= 0 and not paper.question_paper.quiz.is_exercise:
                 # Time is up for code question - get result synchronously
                 url = f'{SERVER_HOST_NAME}:{SERVER_POOL_PORT}'
-                result_details = get_result_from_code_server(url, uid, block=True)
-                result = json.loads(result_details.get('result'))
+                result_details = fetch_result(url, uid, block=True)
+                result = result_details.get('result')
                 
                 # Update paper with result
                 from yaksh.views import _update_paper
@@ -2,19 +2,49 @@
 from __future__ import unicode_literals
 import os
 from os.path import abspath, exists
+import math
+try:
+    import resource
+except ImportError:
+    pass
+import selectors
 import subprocess
 import stat
 import signal
+import time
 
 
 # Local imports
-from .grader import TimeoutException
+from .grader import (
+    TimeoutException, CPULimitExceeded, OutputLimitExceeded, get_exit_code
+)
+from .settings import MAX_OUTPUT_SIZE
 
 
 class BaseEvaluator(object):
     """Base Evaluator class containing generic attributes
         and callable methods"""
 
+    # Set by the grader to share compiled code between the evaluators of
+    # the test cases of a submission.
+    compile_cache = None
+
+    # Set by the grader to note the memory used by the processes started
+    # for the submission.
+    resource_usage = None
+
+    # Set on evaluators which run the code in the code server process itself,
+    # so that the grader runs them in a forked process instead.
+    run_in_fork = False
+
+    # Set on evaluators which compile the answer, so that the grader does
+    # not evaluate their test cases in parallel, each compiling it again.
+    compiles_answer = False
+
+    # Seconds of CPU time each process started for a test case may use, set
+    # by the grader. 0 for no limit.
+    cpu_limit = 0
+
     def __init__(self):
         pass
 
@@ -24,22 +54,148 @@ class BaseEvaluator(object):
     def compile_code(self):
         pass
 
-    def _run_command(self, cmd_args, *args, **kw):
+    def teardown(self):
+        """Called once the code has been checked. Files written to the
+        current directory need not be removed, the grader removes the
+        directory of the job."""
+        pass
+
+    def _set_process_limits(self):
+        """Called in a process started for a test case before it runs its
+        command. Puts it in a process group of its own and limits its CPU
+        time, in whole seconds as that is what RLIMIT_CPU allows.
+        """
+        os.setpgrp()
+        if self.cpu_limit:
+            limit = int(math.ceil(self.cpu_limit))
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+
+    def _run_command(self, cmd_args, *args, limit_cpu=True, **kw):
         """Run a command in a subprocess while blocking, the process is killed
         if it takes more than 2 seconds to run.  Return the Popen object, the
         stdout and stderr.
+
+        The CPU time of the command is limited to that of a test case unless
+        `limit_cpu` is False, as for compilers.
         """
+        preexec_fn = self._set_process_limits if limit_cpu else os.setpgrp
         try:
-            proc = subprocess.Popen(cmd_args,
-                                    preexec_fn=os.setpgrp, *args, **kw)
-            stdout, stderr = proc.communicate()
+            proc = subprocess.Popen(cmd_args, preexec_fn=preexec_fn,
+                                    *args, **kw)
+            stdout, stderr = self._communicate(proc, limit_cpu=limit_cpu)
         except TimeoutException:
-            # Runaway code, so kill it.
-            os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
+            # Runaway code, so kill it, unless it was killed for going over
+            # its CPU time limit.
+            if proc.returncode is None:
+                os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
             # Re-raise exception.
             raise
         return proc, stdout.decode('utf-8'), stderr.decode('utf-8')
 
+    def _communicate(self, proc, input=None, limit_cpu=True):
+        """Send `input` to the process and read its stdout and stderr until
+        it ends, like `proc.communicate`. The output is read as it is written
+        and once there is more than MAX_OUTPUT_SIZE bytes of it the process
+        group is killed and OutputLimitExceeded raised.
+
+        Raises CPULimitExceeded if the process, whose CPU time is limited
+        unless `limit_cpu` is False, was killed for going over its limit.
+        """
+        if not MAX_OUTPUT_SIZE:
+            output = proc.communicate(input)
+            if limit_cpu:
+                self._check_cpu_limit(proc)
+            return output
+        outputs = {}
+        size = 0
+        offset = 0
+        with selectors.DefaultSelector() as selector:
+            if proc.stdin:
+                if input:
+                    selector.register(proc.stdin, selectors.EVENT_WRITE)
+                else:
+                    proc.stdin.close()
+            for stream in (proc.stdout, proc.stderr):
+                if stream:
+                    selector.register(stream, selectors.EVENT_READ)
+                    outputs[stream] = []
+            while selector.get_map():
+                for key, events in selector.select():
+                    stream = key.fileobj
+                    if stream is proc.stdin:
+                        try:
+                            offset += os.write(stream.fileno(),
+                                               input[offset:offset + 512])
+                        except BrokenPipeError:
+                            offset = len(input)
+                        if offset >= len(input):
+                            selector.unregister(stream)
+                            stream.close()
+                        continue
+                    data = os.read(stream.fileno(), 32768)
+                    if not data:
+                        selector.unregister(stream)
+                        stream.close()
+                        continue
+                    size += len(data)
+                    if size > MAX_OUTPUT_SIZE:
+                        os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
+                        self._wait(proc)
+                        raise OutputLimitExceeded(
+                            'Output limit exceeded: the code wrote more '
+                            'than {0} bytes of output.'.format(MAX_OUTPUT_SIZE)
+                        )
+                    outputs[stream].append(data)
+        self._wait(proc)
+        if limit_cpu:
+            self._check_cpu_limit(proc)
+        stdout = b''.join(outputs[proc.stdout]) if proc.stdout else None
+        stderr = b''.join(outputs[proc.stderr]) if proc.stderr else None
+        return stdout, stderr
+
+    def _wait(self, proc):
+        """Wait for the process to end, like `proc.wait`, adding its
+        resource usage to `resource_usage`.
+        """
+        if self.resource_usage is None or proc.returncode is not None:
+            return proc.wait()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = get_exit_code(status)
+        self.resource_usage.add(rusage)
+        return proc.returncode
+
+    def _check_cpu_limit(self, proc):
+        """Raise CPULimitExceeded if the ended process was killed, with
+        SIGXCPU at its soft limit or SIGKILL at its hard limit, for using
+        more CPU time than a test case may. A shell reports the signal
+        which killed its command as an exit status of 128 plus the signal.
+        """
+        if not self.cpu_limit:
+            return
+        if proc.returncode in (-signal.SIGXCPU, -signal.SIGKILL,
+                               128 + signal.SIGXCPU):
+            raise CPULimitExceeded('Code used too much CPU time.')
+
+    def _compile_user_answer(self, cmd_args, *args, **kw):
+        """Run a command compiling the user answer, as `_run_command` does
+        but without limiting its CPU time. If the evaluator of another test
+        case of the same submission already ran it, its output is returned
+        instead of compiling again.
+        """
+        kw['limit_cpu'] = False
+        cache = self.compile_cache
+        if cache is None:
+            return self._run_command(cmd_args, *args, **kw)
+        key = str(cmd_args)
+        if key in cache.outputs:
+            output, duration = cache.outputs[key]
+            cache.time_saved += duration
+            return output
+        start = time.time()
+        output = self._run_command(cmd_args, *args, **kw)
+        cache.outputs[key] = (output, time.time() - start)
+        return output
+
     def _remove_null_substitute_char(self, string):
         """Returns a string without any null and substitute characters"""
         stripped = ""
@@ -6,7 +6,7 @@ import subprocess
 
 # local imports
 from .base_evaluator import BaseEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 
 
 class BashCodeEvaluator(BaseEvaluator):
@@ -29,17 +29,6 @@ class BashCodeEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if os.path.exists(self.test_code_path):
-            os.remove(self.test_code_path)
-        if os.path.exists(self.tc_args_path):
-            os.remove(self.tc_args_path)
-        if self.files:
-            delete_files(self.files)
-
     def check_code(self):
         """ Function validates student script using instructor script as
         reference. Test cases can optionally be provided.  The first argument
@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
 import subprocess
-import os
 from os.path import isfile
 
 # local imports
 from .stdio_evaluator import StdIOEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 
 
 class BashStdIOEvaluator(StdIOEvaluator):
@@ -25,11 +24,6 @@ class BashStdIOEvaluator(StdIOEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        os.remove(self.submit_code_path)
-        if self.files:
-            delete_files(self.files)
-
     def compile_code(self):
         self.submit_code_path = self.create_submit_code_file('Test.sh')
         if self.file_paths:
@@ -50,7 +44,7 @@ class BashStdIOEvaluator(StdIOEvaluator):
                                 stdin=subprocess.PIPE,
                                 stdout=subprocess.PIPE,
                                 stderr=subprocess.PIPE,
-                                preexec_fn=os.setpgrp
+                                preexec_fn=self._set_process_limits
                                 )
         success, err = self.evaluate_stdio(self.user_answer, proc,
                                            self.expected_input,
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Benchmark of the code server client with and without pooled connections.
+
+This starts a server pool and has a number of threads submit the same job
+and fetch its result, as Django processes do for every answer. Since the
+result is cached after the first run, the time measured is that of the
+HTTP requests. They are first sent with bare `requests.post` and
+`requests.get` calls, which open a connection for each request, and then
+with `submit` and `get_result`, which keep connections open.
+
+Usage::
+
+    $ python -m yaksh.benchmarks.bench_code_server_client -n 500 -t 8
+
+"""
+
+from __future__ import print_function
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import json
+from threading import Thread
+import time
+import urllib
+
+import requests
+
+# Local imports
+from yaksh import settings
+from yaksh.code_server import ServerPool, get_result, submit
+
+
+JOB = json.dumps({
+    'metadata': {'user_answer': 'def f(): return 1', 'language': 'python',
+                 'partial_grading': False},
+    'test_case_data': [{'test_case': 'assert f() == 1',
+                        'test_case_type': 'standardtestcase',
+                        'weight': 0.0}]
+})
+
+
+def bare_submit_and_get(url, uid):
+    requests.post(url, data=dict(uid=uid, json_data=JOB, user_dir=''))
+    r = requests.get(urllib.parse.urljoin(url, uid))
+    return json.loads(r.content.decode('utf-8'))
+
+
+def pooled_submit_and_get(url, uid):
+    submit(url, uid, JOB, '')
+    return get_result(url, uid)
+
+
+def bench(func, url, n, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.time()
+        results = list(executor.map(
+            lambda i: func(url, 'bench-%d' % i), range(n)
+        ))
+        elapsed = time.time() - start
+    assert all(result['status'] == 'done' for result in results)
+    return elapsed
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', dest='n', type=int, default=500,
+        help="Number of submissions."
+    )
+    parser.add_argument(
+        '-t', '--threads', dest='threads', type=int, default=8,
+        help="Number of threads submitting at once."
+    )
+    parser.add_argument(
+        '-p', '--port', dest='port', type=int, default=55556,
+        help="Port of the server pool started for the benchmark."
+    )
+    options = parser.parse_args(args)
+
+    settings.code_evaluators['python']['standardtestcase'] = \
+        "yaksh.python_assertion_evaluator.PythonAssertionEvaluator"
+    server_pool = ServerPool(n=1, pool_port=options.port)
+    thread = Thread(target=server_pool.run)
+    thread.start()
+    url = 'http://localhost:%d/' % options.port
+    try:
+        # Run the job once so that its result is cached.
+        submit(url, 'warmup', JOB, '')
+        get_result(url, 'warmup', block=True)
+        for name, func in (('requests', bare_submit_and_get),
+                           ('pooled session', pooled_submit_and_get)):
+            elapsed = bench(func, url, options.n, options.threads)
+            print("%-15s %8.3f s total, %8.1f us per submission" % (
+                name, elapsed, elapsed/options.n*1e6
+            ))
+    finally:
+        server_pool.stop()
+        thread.join()
+
+
+if __name__ == '__main__':
+    main()
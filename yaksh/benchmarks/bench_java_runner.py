@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Benchmark of Java evaluation with and without the Java runner.
+
+This grades a Java answer against an assertion based test case and a stdio
+based test case, first by running `javac` and `java` for each test case and
+then in the JVM kept running by `yaksh.java_runner`. A JDK is needed.
+
+Usage::
+
+    $ python -m yaksh.benchmarks.bench_java_runner -n 20
+
+"""
+
+from __future__ import print_function
+from argparse import ArgumentParser
+import shutil
+import tempfile
+from textwrap import dedent
+import time
+
+# Local imports
+from yaksh import java_runner
+from yaksh.grader import Grader
+
+
+ASSERTION_ANSWER = "class Test {\n\tint square_num(int a) {return a*a;}\n}"
+
+ASSERTION_TEST_CASE = dedent("""
+    class main
+    {
+        public static void main(String arg[])
+        {
+            Test t = new Test();
+            if (t.square_num(5) != 25) {
+                System.out.println("Incorrect:Output expected 25");
+                System.exit(1);
+            }
+        }
+    }
+    """)
+
+STDIO_ANSWER = dedent("""
+    import java.util.Scanner;
+    class Test
+    {public static void main(String[] args){
+     Scanner s = new Scanner(System.in);
+     int a = s.nextInt();
+     int b = s.nextInt();
+     System.out.print(a+b);
+    }}""")
+
+
+def get_jobs():
+    assertion = {
+        'metadata': {'user_answer': ASSERTION_ANSWER, 'file_paths': None,
+                     'partial_grading': False, 'language': 'java'},
+        'test_case_data': [{'test_case': ASSERTION_TEST_CASE,
+                            'test_case_type': 'standardtestcase',
+                            'weight': 0.0, 'hidden': False}],
+    }
+    stdio = {
+        'metadata': {'user_answer': STDIO_ANSWER, 'file_paths': None,
+                     'partial_grading': False, 'language': 'java'},
+        'test_case_data': [{'expected_output': '11',
+                            'expected_input': '5\n6',
+                            'test_case_type': 'stdiobasedtestcase',
+                            'weight': 0.0}],
+    }
+    return (('assertion', assertion), ('stdio', stdio))
+
+
+def bench(n, kwargs):
+    in_dir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        for i in range(n):
+            result = Grader(in_dir).evaluate(kwargs)
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+        return time.time() - start
+    finally:
+        shutil.rmtree(in_dir)
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', dest='n', type=int, default=20,
+        help="Number of times each answer is graded."
+    )
+    options = parser.parse_args(args)
+
+    for name, kwargs in get_jobs():
+        for use_runner in (False, True):
+            java_runner.JAVA_RUNNER = use_runner
+            if use_runner:
+                # Start the JVM before timing, a code server process does so
+                # once for all its jobs.
+                if java_runner.get_java_runner() is None:
+                    print("%-10s Java runner could not be started" % name)
+                    continue
+            elapsed = bench(options.n, kwargs)
+            label = 'runner' if use_runner else 'javac/java'
+            print("%-10s %-11s %8.3f s total, %8.1f ms per answer" % (
+                name, label, elapsed, elapsed/options.n*1e3
+            ))
+
+
+if __name__ == '__main__':
+    main()
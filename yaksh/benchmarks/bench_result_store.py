@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""Microbenchmark comparing the code server result stores.
+
+This times the life cycle of a job as seen by the result store of the server
+pool: submit, the running and done updates from a worker, a status query and
+the final fetch of the result. The old store is a `multiprocessing.Manager`
+dict where every access is a round trip to the manager process. The new
+store is a `ResultTable` in the pool process which workers report into over a
+pipe.
+
+Usage::
+
+    $ python -m yaksh.benchmarks.bench_result_store -n 2000 -q 200
+
+The `-q` option keeps that many other jobs queued in the store while
+timing, since the cost of a status query on the old store grows with it.
+
+"""
+
+from __future__ import print_function
+from argparse import ArgumentParser
+import json
+from multiprocessing import Manager, Pipe
+import time
+
+# Local imports
+from yaksh.code_server import ResultTable
+
+
+RESULT = json.dumps(dict(success=True, error=[], weight=1.0))
+
+
+def bench_manager(n, queued):
+    manager = Manager()
+    results = manager.dict()
+    for i in range(queued):
+        results['queued-%d' % i] = dict(status='not started')
+    start = time.time()
+    for i in range(n):
+        uid = str(i)
+        results[uid] = dict(status='not started')
+        results[uid] = dict(status='running', pid=0, result=None)
+        results[uid] = dict(status='done', result=RESULT)
+        sum(r['status'] == 'not started' for r in results.values())
+        sum(r['status'] == 'running' for r in results.values())
+        results.get(uid, dict(status='unknown'))
+        results.pop(uid)
+    elapsed = time.time() - start
+    manager.shutdown()
+    return elapsed
+
+
+def bench_result_table(n, queued):
+    results = ResultTable()
+    for i in range(queued):
+        results.set('queued-%d' % i, dict(status='not started'))
+    reader, writer = Pipe(duplex=False)
+    start = time.time()
+    for i in range(n):
+        uid = str(i)
+        results.set(uid, dict(status='not started'))
+        writer.send((uid, dict(status='running', pid=0, result=None)))
+        writer.send((uid, dict(status='done', result=RESULT)))
+        while reader.poll():
+            results.set(*reader.recv())
+        results.count('not started')
+        results.count('running')
+        results.get(uid, dict(status='unknown'))
+        results.pop(uid)
+    elapsed = time.time() - start
+    reader.close()
+    writer.close()
+    return elapsed
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', dest='n', type=int, default=2000,
+        help="Number of jobs to run through the result store."
+    )
+    parser.add_argument(
+        '-q', '--queued', dest='queued', type=int, default=0,
+        help="Number of other jobs waiting in the store."
+    )
+    options = parser.parse_args(args)
+
+    for name, bench in (('Manager().dict', bench_manager),
+                        ('ResultTable', bench_result_table)):
+        elapsed = bench(options.n, options.queued)
+        print("%-15s %8.3f s total, %8.1f us per job" % (
+            name, elapsed, elapsed/options.n*1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""Benchmark of evaluation in scratch directories on disk and in memory.
+
+This grades a C answer, whose test case compiles and runs files written to
+the directory of the job, first with the scratch directory of each job made
+on disk and then on a RAM backed file system. The difference is the file
+I/O saved by setting SERVER_SCRATCH_DIR to such a file system.
+
+Usage::
+
+    $ python -m yaksh.benchmarks.bench_scratch_dir -n 50 -d /dev/shm
+
+"""
+
+from __future__ import print_function
+from argparse import ArgumentParser
+import shutil
+import tempfile
+from textwrap import dedent
+import time
+
+# Local imports
+from yaksh import grader
+from yaksh.grader import Grader
+
+
+ANSWER = "int add(int a, int b)\n{return a+b;}"
+
+TEST_CASE = dedent("""
+    #include <stdio.h>
+    #include <stdlib.h>
+
+    extern int add(int, int);
+
+    int main(void)
+    {
+        if (add(2, 3) != 5) {
+            printf("Incorrect");
+            exit(1);
+        }
+        return 0;
+    }
+    """)
+
+
+def get_job():
+    return {
+        'metadata': {'user_answer': ANSWER, 'file_paths': None,
+                     'partial_grading': False, 'language': 'c'},
+        'test_case_data': [{'test_case': TEST_CASE,
+                            'test_case_type': 'standardtestcase',
+                            'weight': 0.0}],
+    }
+
+
+def bench(n, kwargs, scratch_dir):
+    in_dir = tempfile.mkdtemp()
+    grader.SERVER_SCRATCH_DIR = scratch_dir
+    try:
+        start = time.time()
+        for i in range(n):
+            result = Grader(in_dir).evaluate(kwargs)
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+        return time.time() - start
+    finally:
+        shutil.rmtree(in_dir)
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', dest='n', type=int, default=50,
+        help="Number of times the answer is graded."
+    )
+    parser.add_argument(
+        '-d', '--dir', dest='dir', default='/dev/shm',
+        help="RAM backed directory to make scratch directories in."
+    )
+    options = parser.parse_args(args)
+
+    kwargs = get_job()
+    # Compile the test case once, a code server process keeps it compiled
+    # for later jobs.
+    bench(1, kwargs, '')
+    disk = bench(options.n, kwargs, '')
+    memory = bench(options.n, kwargs, options.dir)
+    for name, elapsed in (('disk', disk), (options.dir, memory)):
+        print("%-10s %8.3f s total, %8.1f ms per answer" % (
+            name, elapsed, elapsed/options.n*1e3
+        ))
+    print("%-10s %8.3f s total, %8.1f ms per answer" % (
+        'saved', disk - memory, (disk - memory)/options.n*1e3
+    ))
+
+
+if __name__ == '__main__':
+    main()
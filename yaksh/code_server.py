@@ -13,29 +13,81 @@ run as many servers as desired.
 # Standard library imports
 from __future__ import unicode_literals
 from argparse import ArgumentParser
+import asyncio
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import json
-from multiprocessing import Process, Queue, Manager
+from functools import partial
+import gzip
+import hashlib
+import logging
+import math
+from multiprocessing import Process, Pipe
 import os
 from os.path import dirname, abspath
 try:
     import pwd
 except ImportError:
     pass
+import random
 import sys
 import time
 
 # Library imports
+import psutil
 import requests
-from tornado.ioloop import IOLoop
-from tornado.web import Application, RequestHandler
+from requests.adapters import HTTPAdapter
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import Application, HTTPError, RequestHandler
 import urllib
+from urllib3.exceptions import NewConnectionError
 
 # Local imports
-from .settings import N_CODE_SERVERS, SERVER_POOL_PORT
-from .grader import Grader
+from .settings import (
+    N_CODE_SERVERS, SERVER_POOL_PORT, SERVER_LONG_POLL_TIMEOUT,
+    SERVER_STARVATION_LIMIT, SERVER_RESULT_TTL, SERVER_MAX_RESULTS,
+    SERVER_REAPER_INTERVAL, SERVER_MAX_JOBS_PER_WORKER, SERVER_MAX_WORKER_RSS,
+    SERVER_TIMEOUT, SERVER_HUNG_GRACE, SERVER_SUPERVISOR_INTERVAL,
+    SERVER_MAX_QUEUE_DEPTH, SERVER_MAX_WAIT, SERVER_CACHE_SIZE,
+    SERVER_CACHE_TTL, SERVER_MIN_WORKERS, SERVER_MAX_WORKERS,
+    SERVER_SCALE_INTERVAL, SERVER_SCALE_UP_WAIT, SERVER_SCALE_DOWN_DELAY,
+    SERVER_BROKER_URL, SERVER_BROKER_POLL_INTERVAL, SERVER_CLIENT_POOL_SIZE,
+    SERVER_CLIENT_CONNECT_TIMEOUT, SERVER_CLIENT_READ_TIMEOUT,
+    SERVER_CLIENT_RETRIES, SERVER_CLIENT_RETRY_DELAY,
+    SERVER_CLIENT_COMPRESS_SIZE
+)
+from .grader import Grader, preload_modules
+from .java_runner import get_java_runner
+from .job_broker import choose_priority, get_broker
 
 
 MY_DIR = abspath(dirname(__file__))
+logger = logging.getLogger(__name__)
+
+# Priorities a job may be submitted with, most urgent first. Live exam
+# submissions are 'high', regrades are 'low'.
+PRIORITIES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+
+# Number of recent job durations used to estimate how long a new job waits.
+N_DURATIONS = 100
+
+# Upper bounds, in seconds, of the buckets of the job latency histograms.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class ServerBusyError(Exception):
+    """Raised when the server pool turns a submission away. The
+    `retry_after` attribute is the number of seconds after which to retry.
+    """
+    def __init__(self, retry_after):
+        super(ServerBusyError, self).__init__(
+            'Code server busy, retry after %s seconds.' % retry_after
+        )
+        self.retry_after = retry_after
 
 
 # Private Protocol ##########
@@ -47,119 +99,1066 @@ def run_as_nobody():
     os.seteuid(nobody.pw_uid)
 
 
-def check_code(pid, job_queue, results):
+def kill_children(pid):
+    """Kill the processes started by the process `pid`, such as those it
+    forked to evaluate code.
+    """
+    try:
+        children = psutil.Process(pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        return
+    for child in children:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def check_code(pid, jobs):
     """Check the code, this runs forever.
+
+    Jobs are received from the server pool over a pipe (`jobs`) as
+    `(uid, data, user_dir, queued_at)` tuples, `data` being the decoded job
+    data and `queued_at` the time the job was queued, and the result of
+    each is sent back over the same pipe as a `(uid, result)` tuple. The
+    result carries the compile statistics of the job as `stats` and the
+    resources it used, with its language, test case type and whether it
+    timed out, as `usage`, which the server pool adds up. Receiving `None`
+    instead of a job ends the process.
+
+    Python code is evaluated in a process forked from this one for each job,
+    so the modules such code commonly uses are imported up front. The Java
+    runner, if used, is started up front too and started again after a job
+    which stopped it, so that this is not done in the time given to a job.
     """
+    preload_modules()
+    get_java_runner()
     while True:
-        uid, json_data, user_dir = job_queue.get(True)
-        results[uid] = dict(status='running', pid=pid, result=None)
-        data = json.loads(json_data)
+        job = jobs.recv()
+        if job is None:
+            break
+        uid, data, user_dir, queued_at = job
+        resources = dict(queue_wait=round(time.time() - queued_at, 3))
         grader = Grader(user_dir)
         result = grader.evaluate(data)
-        results[uid] = dict(status='done', result=json.dumps(result))
+        resources.update(result['resources'])
+        result['resources'] = resources
+        test_cases = data.get('test_case_data') or [{}]
+        usage = dict(resources, language=data['metadata'].get('language'),
+                     test_case_type=test_cases[0].get('test_case_type'),
+                     timed_out=has_timed_out(result.get('error')))
+        jobs.send((uid, dict(status='done', result=result,
+                             stats=grader.compile_cache.get_stats(),
+                             usage=usage)))
+        get_java_runner()
+
+
+###############################################################################
+# `ResultTable` class.
+###############################################################################
+class ResultTable(object):
+    """Results of submitted jobs, kept in the server pool process.
+
+    Workers report into the table over pipes which are read on the IOLoop, so
+    all access happens in a single thread and needs no locking. A count of
+    jobs in each status is kept up to date so that the status of the pool can
+    be computed without looking at every result.
+
+    Results which are done are time stamped so that results nobody fetched
+    can be dropped by `expire`. If there are more than `max_results` results,
+    the oldest of those which are done are dropped.
+    """
+    def __init__(self, max_results=SERVER_MAX_RESULTS):
+        self.max_results = max_results
+        self.expired = 0
+        self.evicted = 0
+        self._results = {}
+        self._counts = {}
+        self._done = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, uid):
+        return uid in self._results
+
+    def _change_count(self, result, delta):
+        if result is not None:
+            status = result.get('status')
+            self._counts[status] = self._counts.get(status, 0) + delta
+
+    def get(self, uid, default=None):
+        return self._results.get(uid, default)
+
+    def set(self, uid, result):
+        self._change_count(self._results.get(uid), -1)
+        self._results[uid] = result
+        self._change_count(result, 1)
+        self._done.pop(uid, None)
+        if result.get('status') == 'done':
+            self._done[uid] = time.time()
+        while len(self._results) > self.max_results and self._done:
+            self.pop(next(iter(self._done)))
+            self.evicted += 1
+
+    def pop(self, uid, default=None):
+        if uid not in self._results:
+            return default
+        result = self._results.pop(uid)
+        self._change_count(result, -1)
+        self._done.pop(uid, None)
+        return result
+
+    def expire(self, max_age):
+        """Drop the results which have been done for more than `max_age`
+        seconds. Returns the number of results dropped.
+        """
+        oldest = time.time() - max_age
+        count = 0
+        while self._done and next(iter(self._done.values())) < oldest:
+            self.pop(next(iter(self._done)))
+            count += 1
+        self.expired += count
+        return count
+
+    def count(self, status):
+        """Number of results currently having the given status."""
+        return self._counts.get(status, 0)
+
+    def items(self):
+        return self._results.items()
+
+
+###############################################################################
+# `JobQueue` class.
+###############################################################################
+class JobQueue(object):
+    """Jobs waiting for a worker, kept in one lane per priority.
+
+    Jobs are taken from the most urgent lane first. A waiting lane which has
+    been passed over `starvation_limit` times in a row is served next so that
+    less urgent jobs keep moving.
+    """
+    def __init__(self, starvation_limit=SERVER_STARVATION_LIMIT):
+        self.starvation_limit = starvation_limit
+        self.lanes = OrderedDict((p, deque()) for p in PRIORITIES)
+        self.skipped = dict((p, 0) for p in PRIORITIES)
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes.values())
+
+    def put(self, job, priority=DEFAULT_PRIORITY):
+        if priority not in self.lanes:
+            raise ValueError('Unknown priority %r' % priority)
+        self.lanes[priority].append(job)
+
+    def get(self):
+        """Remove and return the next job to run."""
+        waiting = [p for p, lane in self.lanes.items() if lane]
+        chosen = choose_priority(waiting, self.skipped,
+                                 self.starvation_limit)
+        return self.lanes[chosen].popleft()
+
+    def qsize(self, priority):
+        """Number of jobs waiting in the given lane."""
+        return len(self.lanes[priority])
+
+    def ahead_of(self, priority):
+        """Number of jobs waiting which are run before a new job of the
+        given priority.
+        """
+        n = 0
+        for p, lane in self.lanes.items():
+            n += len(lane)
+            if p == priority:
+                break
+        return n
+
+
+###############################################################################
+# `ResultCache` class.
+###############################################################################
+class ResultCache(object):
+    """Results of evaluated code keyed on a hash of the job data, so that
+    identical submissions are answered without running them again.
+
+    At most `max_size` results are kept, the least recently used being
+    dropped first, and a result is not used after `ttl` seconds.
+    """
+    def __init__(self, max_size=SERVER_CACHE_SIZE, ttl=SERVER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        item = self._results.get(key)
+        if item is None:
+            return None
+        stored, result = item
+        if time.time() - stored > self.ttl:
+            del self._results[key]
+            return None
+        return result
+
+    def get(self, key):
+        """Return the result kept for `key` or None, counting the hit or
+        miss.
+        """
+        result = self._lookup(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)
+        return result
+
+    def set(self, key, result):
+        if self.max_size <= 0:
+            return
+        self._results[key] = (time.time(), result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+
+def get_cache_key(data):
+    """Return the key under which the result of a job is cached, or None if
+    the question asked for its results not to be cached. `data` is the job
+    data, decoded or as JSON.
+    """
+    if not isinstance(data, dict):
+        data = json.loads(data)
+    if not data.get('metadata', {}).get('cache_result', True):
+        return None
+    canonical = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def has_timed_out(errors):
+    """Check if the errors of a result show the code ran out of time."""
+    return any(isinstance(err, dict) and
+               err.get('exception') == 'TimeoutException'
+               for err in errors or [])
+
+
+def is_cacheable(result):
+    """Check if a result from a worker may be reused. Results of code that
+    ran out of time are not as the pool may just have been busy, nor are
+    those with errors which are not the dicts evaluators give, such as that
+    of a process evaluating the code being killed.
+    """
+    errors = result['result'].get('error') or []
+    return not (has_timed_out(errors) or
+                any(not isinstance(err, dict) for err in errors))
+
+
+def encode_result(result, version=1):
+    """Return the status or result of a job in the form sent to clients
+    using the given version of the protocol. In version 1 the result of a
+    job which is done is sent JSON encoded, in version 2 as is.
+    """
+    if version == 1 and isinstance(result.get('result'), dict):
+        result = dict(result, result=json.dumps(result['result']))
+    return result
+
+
+###############################################################################
+# `Histogram` class.
+###############################################################################
+class Histogram(object):
+    """Counts of observed values in cumulative buckets, with their sum, kept
+    for each combination of label values as in a Prometheus histogram.
+    `buckets` are the upper bounds of the buckets, in increasing order.
+    """
+    def __init__(self, label_names, buckets=LATENCY_BUCKETS):
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        """Count `value` for the label values `labels`."""
+        labels = tuple(str(label) for label in labels)
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = dict(
+                buckets=[0] * len(self.buckets), count=0, sum=0.0
+            )
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['buckets'][idx] += 1
+        series['count'] += 1
+        series['sum'] += value
+
+    def samples(self, name):
+        """Return the samples of the histogram as `(name, labels, value)`
+        tuples.
+        """
+        samples = []
+        for labels, series in sorted(self._series.items()):
+            labels = list(zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, series['buckets']):
+                samples.append((name + '_bucket',
+                                labels + [('le', '%g' % bound)], count))
+            samples.append((name + '_bucket', labels + [('le', '+Inf')],
+                            series['count']))
+            samples.append((name + '_sum', labels, series['sum']))
+            samples.append((name + '_count', labels, series['count']))
+        return samples
+
+
+def format_labels(labels):
+    """Return label `(name, value)` pairs as in the Prometheus text format."""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n')
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value))
+                             for name, value in labels)
+
+
+def format_metric(name, kind, description, samples):
+    """Return a metric in the Prometheus text format. `samples` is a list of
+    `(name, labels, value)` tuples, `labels` being a list of
+    `(name, value)` pairs.
+    """
+    lines = ['# HELP %s %s' % (name, description),
+             '# TYPE %s %s' % (name, kind)]
+    for sample_name, labels, value in samples:
+        if labels:
+            sample_name += format_labels(labels)
+        lines.append('%s %s' % (sample_name, repr(float(value))))
+    return '\n'.join(lines) + '\n'
 
 
 ###############################################################################
 # `ServerPool` class.
 ###############################################################################
 class ServerPool(object):
-    """Manages a pool of processes checking code."""
-    def __init__(self, n, pool_port=50000):
+    """Manages a pool of processes checking code.
+
+    If `max_workers` is set the number of processes is scaled between
+    `min_workers` and `max_workers`: processes are added as soon as jobs
+    pile up and idle ones are removed only after no job has waited for
+    SERVER_SCALE_DOWN_DELAY seconds, so that the pool does not keep
+    growing and shrinking.
+
+    If a `broker` is given, or SERVER_BROKER_URL is set, submitted jobs are
+    queued on the broker and the pool takes jobs from it for its idle
+    workers, so that the pools of several hosts share the work. Statuses
+    and results are published on the broker for any of the pools to
+    answer. See `job_broker`.
+    """
+    def __init__(self, n, pool_port=50000, min_workers=SERVER_MIN_WORKERS,
+                 max_workers=SERVER_MAX_WORKERS, broker=None):
         """Create a pool of servers.
 
         Parameters
         ----------
 
         n : int
-            Number of code servers to run
+            Number of code servers to start with
 
         pool_port : int
             Port at which the server pool should serve.
+
+        min_workers : int
+            Fewest code servers to scale down to.
+
+        max_workers : int
+            Most code servers to scale up to, 0 to always run `n`.
+
+        broker : MemoryBroker or RedisBroker
+            Broker shared with other server pools.
         """
+        if max_workers > 0:
+            self.min_workers = max(min(min_workers, max_workers), 1)
+            self.max_workers = max_workers
+            n = min(max(n, self.min_workers), self.max_workers)
+        else:
+            self.min_workers = self.max_workers = n
         self.n = n
-        self.manager = Manager()
-        self.results = self.manager.dict()
+        self.results = ResultTable()
+        self.cache = ResultCache()
+        self.cache_keys = {}
+        self.compile_stats = dict(harness_hits=0, harness_misses=0)
+        self.usage = {}
+        labels = ('language', 'test_case_type')
+        self.queue_wait_histogram = Histogram(labels)
+        self.run_time_histogram = Histogram(labels)
+        self.timeouts = {}
+        self.waiters = {}
+        self.stopping = False
         self.my_port = pool_port
 
-        self.job_queue = Queue()
-        processes = []
-        for i in range(n):
-            p = self._make_process(i)
-            processes.append(p)
-        self.processes = processes
+        self.job_queue = JobQueue()
+        self.broker = broker if broker is not None else get_broker(
+            SERVER_BROKER_URL, PRIORITIES
+        )
+        self.pipes = {}
+        self.worker_ends = {}
+        self.idle = []
+        self.running = {}
+        self.started = {}
+        self.durations = deque(maxlen=N_DURATIONS)
+        self.rejected = 0
+        self.jobs_done = [0] * self.max_workers
+        self.recycled = 0
+        self.restarted = 0
+        self.hung = 0
+        self.scaled_up = 0
+        self.scaled_down = 0
+        self.last_busy = time.time()
+        self.processes = [None] * self.max_workers
+        self.reaper = None
+        self.supervisor = None
+        self.scaler = None
+        self.puller = None
         self.app = self._make_app()
 
     def _make_app(self):
         app = Application([
+            (r"/batch", BatchHandler, dict(server=self)),
+            (r"/v2/(?:jobs|results)", JobsHandler, dict(server=self)),
+            (r"/metrics", MetricsHandler, dict(server=self)),
             (r"/.*", MainHandler, dict(server=self)),
-        ])
-        app.listen(self.my_port)
+        ], compress_response=True)
+        app.listen(self.my_port, decompress_request=True)
         return app
 
     def _make_process(self, pid):
-        return Process(
-            target=check_code, args=(pid, self.job_queue, self.results)
+        conn, worker_end = Pipe()
+        self._close_pipe(pid)
+        self.pipes[pid] = conn
+        self.worker_ends[pid] = worker_end
+        IOLoop.current().add_handler(
+            conn.fileno(), partial(self._on_results, pid), IOLoop.READ
         )
+        return Process(target=check_code, args=(pid, worker_end))
+
+    def _close_pipe(self, pid):
+        conn = self.pipes.pop(pid, None)
+        if conn is not None:
+            IOLoop.current().remove_handler(conn.fileno())
+            conn.close()
+
+    def _read_results(self, pid):
+        """Read the results sent by a worker into the result table."""
+        conn = self.pipes[pid]
+        try:
+            while conn.poll():
+                uid, result = conn.recv()
+                for name, value in result.pop('stats', {}).items():
+                    self.compile_stats[name] = \
+                        self.compile_stats.get(name, 0) + value
+                if 'usage' in result:
+                    self._add_usage(result.pop('usage'))
+                key = self.cache_keys.pop(uid, None)
+                if key is not None and is_cacheable(result):
+                    self.cache.set(key, result['result'])
+                self.running.pop(pid, None)
+                started = self.started.pop(pid, None)
+                if started is not None:
+                    self.durations.append(time.time() - started)
+                self.jobs_done[pid] += 1
+                if self._needs_recycling(pid):
+                    self._recycle_process(pid)
+                else:
+                    self.idle.append(pid)
+                self._set_result(uid, result)
+                if pid not in self.pipes or self.pipes[pid] is not conn:
+                    # The worker was replaced, its pipe is closed.
+                    break
+        except (EOFError, OSError):
+            # The worker is gone, stop listening on its pipe.
+            IOLoop.current().remove_handler(conn.fileno())
+
+    def _add_usage(self, usage):
+        """Add the resources used by a job to the totals for its language."""
+        totals = self.usage.setdefault(usage['language'], dict(
+            jobs=0, cpu_time=0.0, wall_time=0.0, queue_wait=0.0, max_rss=0
+        ))
+        totals['jobs'] += 1
+        for name in ('cpu_time', 'wall_time', 'queue_wait'):
+            totals[name] += usage[name]
+        totals['max_rss'] = max(totals['max_rss'], usage['max_rss'])
+        labels = (usage['language'], usage['test_case_type'])
+        self.queue_wait_histogram.observe(labels, usage['queue_wait'])
+        self.run_time_histogram.observe(labels, usage['wall_time'])
+        if usage['timed_out']:
+            self.timeouts[usage['language']] = \
+                self.timeouts.get(usage['language'], 0) + 1
+
+    def _on_results(self, pid, fd, events):
+        self._read_results(pid)
+        self._dispatch()
+
+    def _take_broker_jobs(self):
+        """Take jobs from the broker for the idle workers. The result of a
+        job is cached by this pool, which runs it, rather than by the pool
+        it was submitted to.
+        """
+        while len(self.job_queue) < len(self.idle):
+            item = self.broker.get()
+            if item is None:
+                break
+            job, priority = item
+            key = get_cache_key(job[1])
+            if key is not None:
+                self.cache_keys[job[0]] = key
+            self.job_queue.put(job, priority)
+
+    def _set_result(self, uid, result):
+        if self.broker is not None and result.get('status') == 'done':
+            # Kept on the broker only, for whichever pool is asked for it.
+            self.results.pop(uid)
+            self.broker.set_result(uid, result)
+        else:
+            self.results.set(uid, result)
+        if result.get('status') == 'done' and uid in self.waiters:
+            self._notify_waiters(uid)
+
+    def _notify_waiters(self, uid):
+        waiters = self.waiters.pop(uid)
+        result = self._pop_result(uid)
+        for future in waiters:
+            if not future.done():
+                future.set_result(result)
+
+    def _dispatch(self):
+        """Hand queued jobs to idle workers."""
+        if self.broker is not None:
+            self._take_broker_jobs()
+        while self.idle and len(self.job_queue):
+            pid = self.idle.pop()
+            job = self.job_queue.get()
+            uid = job[0]
+            self.running[pid] = uid
+            self.started[pid] = time.time()
+            self.results.set(uid, dict(status='running', pid=pid,
+                                       result=None))
+            if self.broker is not None:
+                self.broker.set_result(uid, dict(status='running',
+                                                 result=None))
+            self.pipes[pid].send(job)
+
+    def _start_process(self, pid):
+        # The process and its pipe are only made when it is started so that
+        # no other worker inherits the worker end of the pipe.
+        proc = self.processes[pid] = self._make_process(pid)
+        proc.start()
+        self.worker_ends.pop(pid).close()
+        self.jobs_done[pid] = 0
+        IOLoop.current().add_handler(
+            proc.sentinel, partial(self._process_exited, pid), IOLoop.READ
+        )
+        self.idle.append(pid)
+
+    def _needs_recycling(self, pid):
+        """Check if a worker has checked too many jobs or grown too big."""
+        if self.stopping:
+            return False
+        if (SERVER_MAX_JOBS_PER_WORKER > 0 and
+                self.jobs_done[pid] >= SERVER_MAX_JOBS_PER_WORKER):
+            return True
+        if SERVER_MAX_WORKER_RSS > 0:
+            try:
+                rss = psutil.Process(self.processes[pid].pid).memory_info().rss
+            except psutil.Error:
+                return False
+            return rss > SERVER_MAX_WORKER_RSS * 1024 * 1024
+        return False
+
+    def _end_process(self, pid):
+        """Ask an idle worker to end and wait for it to do so."""
+        proc = self.processes[pid]
+        IOLoop.current().remove_handler(proc.sentinel)
+        try:
+            self.pipes[pid].send(None)
+        except (OSError, ValueError):
+            pass
+        proc.join(1)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
+
+    def _recycle_process(self, pid):
+        """Replace an idle worker with a fresh one. Queued jobs stay in the
+        job queue and are handed to the new worker.
+        """
+        self._end_process(pid)
+        self.recycled += 1
+        self._start_process(pid)
+
+    def _add_processes(self, count):
+        """Start `count` more workers."""
+        free = [pid for pid, proc in enumerate(self.processes) if proc is None]
+        for pid in free[:count]:
+            self._start_process(pid)
+            self.n += 1
+            self.scaled_up += 1
+        self._dispatch()
+
+    def _remove_process(self):
+        """Drain an idle worker: it is ended between jobs and not
+        replaced.
+        """
+        pid = max(self.idle)
+        self.idle.remove(pid)
+        self._end_process(pid)
+        self._close_pipe(pid)
+        self.processes[pid] = None
+        self.n -= 1
+        self.scaled_down += 1
+
+    def _autoscale(self):
+        """Add workers when jobs pile up and remove idle ones once no job has
+        waited for SERVER_SCALE_DOWN_DELAY seconds.
+        """
+        if self.stopping:
+            return
+        now = time.time()
+        queued = self._count_queued(PRIORITIES[-1])
+        if queued or not self.idle:
+            self.last_busy = now
+        if queued and self.n < self.max_workers:
+            wait = self.estimate_wait()[1]
+            if queued >= self.n or wait > SERVER_SCALE_UP_WAIT:
+                count = min(queued, self.max_workers - self.n)
+                logger.info(
+                    'Adding %d code servers to %d: %d jobs queued, %.1f s '
+                    'estimated wait.', count, self.n, queued, wait
+                )
+                self._add_processes(count)
+        elif (self.n > self.min_workers and self.idle and
+                now - self.last_busy >= SERVER_SCALE_DOWN_DELAY):
+            logger.info(
+                'Removing an idle code server from %d: no job waited for '
+                '%.0f s.', self.n, now - self.last_busy
+            )
+            self._remove_process()
+
+    def _process_exited(self, pid, fd, events):
+        """Called on the IOLoop when a worker process ends."""
+        IOLoop.current().remove_handler(fd)
+        if self.stopping:
+            return
+        self._replace_dead_process(pid)
+
+    def _replace_dead_process(self, pid):
+        # The sentinel can be ready a little before the process is reaped.
+        proc = self.processes[pid]
+        proc.join(1)
+        # Collect a result sent just before the worker ended.
+        self._read_results(pid)
+        if self.processes[pid] is proc:
+            self._restart_process(pid)
+        else:
+            # The worker was already replaced on reading its last result.
+            self._dispatch()
+
+    def _restart_process(self, pid, error=None):
+        """Replace a dead worker and fail the job it was running with the
+        given `error`. Returns the result of that job, if any.
+        """
+        proc = self.processes[pid]
+        IOLoop.current().remove_handler(proc.sentinel)
+        if pid in self.idle:
+            self.idle.remove(pid)
+        uid = self.running.pop(pid, None)
+        self.cache_keys.pop(uid, None)
+        self.started.pop(pid, None)
+        self.restarted += 1
+        self._start_process(pid)
+        result = None
+        if uid is not None:
+            if error is None:
+                error = 'Process ended with exit code %s.' % proc.exitcode
+            result = dict(status='done', result=dict(
+                success=False, weight=0.0, error=[error]
+            ))
+            self._set_result(uid, result)
+        self._dispatch()
+        return result
 
     def _start_code_servers(self):
-        for proc in self.processes:
-            if proc.pid is None:
-                proc.start()
+        for pid, proc in enumerate(self.processes[:self.n]):
+            if proc is None:
+                self._start_process(pid)
+        self._dispatch()
 
-    def _handle_dead_process(self, result):
+    def _supervise(self):
+        """Replace workers which have died or hung so that the pool keeps
+        running `n` of them even if nobody asks for their results.
+        """
+        if self.stopping:
+            return
+        limit = SERVER_TIMEOUT + SERVER_HUNG_GRACE
+        now = time.time()
+        for pid, proc in enumerate(self.processes):
+            if proc is None:
+                continue
+            if not proc.is_alive():
+                self._replace_dead_process(pid)
+            elif pid in self.running and now - self.started[pid] > limit:
+                self._stop_hung_process(pid, limit)
+
+    def _stop_hung_process(self, pid, limit):
+        # Collect a result sent since the pipe was last read.
+        self._read_results(pid)
+        if pid not in self.running:
+            return
+        proc = self.processes[pid]
+        IOLoop.current().remove_handler(proc.sentinel)
+        kill_children(proc.pid)
+        proc.terminate()
+        proc.join(1)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+        self.hung += 1
+        self._restart_process(
+            pid, 'Code took more than %s seconds to run and was stopped. '
+                 'You probably have an infinite loop in your code.' % limit
+        )
+
+    def _handle_dead_process(self, uid, result):
         if result.get('status') == 'running':
             pid = result.get('pid')
             proc = self.processes[pid]
-            if not proc.is_alive():
+            if not proc.is_alive() and self.running.get(pid) == uid:
                 # If the processes is dead, something bad happened so
                 # restart that process.
-                new_proc = self._make_process(pid)
-                self.processes[pid] = new_proc
-                new_proc.start()
-                result['status'] = 'done'
-                result['result'] = json.dumps(dict(
-                    success=False, weight=0.0,
-                    error=['Process ended with exit code %s.'
-                           % proc.exitcode]
-                ))
+                result = self._restart_process(pid)
+        return result
+
+    def _reap_results(self):
+        """Drop results which were never fetched."""
+        self.results.expire(SERVER_RESULT_TTL)
 
     # Public Protocol ##########
 
+    def _count_queued(self, priority):
+        """Number of jobs waiting which are run before a new job of the
+        given priority, here and on the broker.
+        """
+        ahead = self.job_queue.ahead_of(priority)
+        if self.broker is not None:
+            ahead += self.broker.ahead_of(priority)
+        return ahead
+
     def get_status(self):
         """Returns current job queue size, total number of processes alive.
         """
-        qs = sum(r['status'] == 'not started'
-                 for r in self.results.values())
-        alive = sum(p.is_alive() for p in self.processes)
-        n_running = sum(r['status'] == 'running'
-                        for r in self.results.values())
+        qs = self._count_queued(PRIORITIES[-1])
+        alive = sum(p is not None and p.is_alive() for p in self.processes)
+        n_running = self.results.count('running')
 
         return qs, alive, n_running
 
-    def submit(self, uid, json_data, user_dir):
-        self.results[uid] = dict(status='not started')
-        self.job_queue.put((uid, json_data, user_dir))
+    def get_worker_status(self):
+        """Returns number of workers replaced after too many jobs or too
+        much memory, number restarted after dying or hanging and number
+        stopped for hanging.
+        """
+        return self.recycled, self.restarted, self.hung
 
-    def get_result(self, uid):
+    def get_result_status(self):
+        """Returns number of results kept, number of results dropped as too
+        old and number of results dropped as too many.
+        """
+        return len(self.results), self.results.expired, self.results.evicted
+
+    def estimate_wait(self, priority=DEFAULT_PRIORITY):
+        """Returns the number of jobs ahead of a new job of the given
+        priority and an estimate of the seconds it would wait for a worker,
+        based on how long recent jobs took.
+        """
+        ahead = self._count_queued(priority)
+        if not self.durations:
+            return ahead, 0.0
+        mean = sum(self.durations) / len(self.durations)
+        return ahead, mean * ahead / self.n
+
+    def check_admission(self, priority=DEFAULT_PRIORITY):
+        """Check if a new job of the given priority may be queued. Returns
+        None if it may, otherwise the number of seconds after which to retry.
+        """
+        ahead, wait = self.estimate_wait(priority)
+        mean = wait / ahead if ahead else 0.0
+        retry_after = None
+        if SERVER_MAX_QUEUE_DEPTH > 0 and ahead >= SERVER_MAX_QUEUE_DEPTH:
+            excess = ahead - SERVER_MAX_QUEUE_DEPTH + 1
+            retry_after = mean * excess
+        elif SERVER_MAX_WAIT > 0 and wait > SERVER_MAX_WAIT:
+            retry_after = wait - SERVER_MAX_WAIT
+        if retry_after is None:
+            return None
+        self.rejected += 1
+        return max(1, int(math.ceil(retry_after)))
+
+    def get_admission_status(self):
+        """Returns the estimated wait in seconds of a new job and number of
+        submissions turned away.
+        """
+        return self.estimate_wait()[1], self.rejected
+
+    def get_cache_status(self):
+        """Returns number of results cached and the fraction of
+        submissions answered from the cache.
+        """
+        return len(self.cache), self.cache.hit_rate()
+
+    def get_compile_status(self):
+        """Returns number of compiled test cases found in and missing from
+        the caches of the workers.
+        """
+        return (self.compile_stats['harness_hits'],
+                self.compile_stats['harness_misses'])
+
+    def get_usage_status(self):
+        """Returns, for each language, the number of jobs checked, the CPU
+        time, wall clock time and time spent queued by them in seconds, and
+        the peak RSS of a job in kilobytes.
+        """
+        return self.usage
+
+    def get_metrics(self):
+        """Returns the metrics of the pool in the Prometheus text format."""
+        alive = self.get_status()[1]
+        metrics = [
+            ('yaksh_queue_depth', 'gauge',
+             'Jobs waiting for a worker, by priority.',
+             [('yaksh_queue_depth', [('priority', p)],
+               self.job_queue.qsize(p) +
+               (self.broker.qsize(p) if self.broker is not None else 0))
+              for p in PRIORITIES]),
+            ('yaksh_workers', 'gauge', 'Worker processes alive.',
+             [('yaksh_workers', [], alive)]),
+            ('yaksh_jobs_running', 'gauge', 'Jobs being checked.',
+             [('yaksh_jobs_running', [], len(self.running))]),
+            ('yaksh_workers_min', 'gauge', 'Fewest workers to scale down to.',
+             [('yaksh_workers_min', [], self.min_workers)]),
+            ('yaksh_workers_max', 'gauge', 'Most workers to scale up to.',
+             [('yaksh_workers_max', [], self.max_workers)]),
+            ('yaksh_workers_added_total', 'counter',
+             'Workers added as jobs piled up.',
+             [('yaksh_workers_added_total', [], self.scaled_up)]),
+            ('yaksh_workers_removed_total', 'counter',
+             'Idle workers removed as jobs were few.',
+             [('yaksh_workers_removed_total', [], self.scaled_down)]),
+            ('yaksh_job_queue_wait_seconds', 'histogram',
+             'Time jobs waited for a worker.',
+             self.queue_wait_histogram.samples(
+                 'yaksh_job_queue_wait_seconds'
+             )),
+            ('yaksh_job_run_seconds', 'histogram',
+             'Time taken to check jobs.',
+             self.run_time_histogram.samples('yaksh_job_run_seconds')),
+            ('yaksh_job_timeouts_total', 'counter',
+             'Jobs whose code ran out of time, by language.',
+             [('yaksh_job_timeouts_total', [('language', language)], count)
+              for language, count in sorted(self.timeouts.items(),
+                                            key=lambda item: str(item[0]))]),
+            ('yaksh_worker_restarts_total', 'counter',
+             'Workers restarted after dying or hanging.',
+             [('yaksh_worker_restarts_total', [], self.restarted)]),
+            ('yaksh_workers_hung_total', 'counter',
+             'Workers stopped for running a job too long.',
+             [('yaksh_workers_hung_total', [], self.hung)]),
+            ('yaksh_workers_recycled_total', 'counter',
+             'Workers replaced after too many jobs or too much memory.',
+             [('yaksh_workers_recycled_total', [], self.recycled)]),
+            ('yaksh_jobs_rejected_total', 'counter',
+             'Submissions turned away as the pool was too busy.',
+             [('yaksh_jobs_rejected_total', [], self.rejected)]),
+            ('yaksh_cache_hits_total', 'counter',
+             'Submissions answered from the result cache.',
+             [('yaksh_cache_hits_total', [], self.cache.hits)]),
+            ('yaksh_cache_misses_total', 'counter',
+             'Submissions not found in the result cache.',
+             [('yaksh_cache_misses_total', [], self.cache.misses)]),
+            ('yaksh_harness_hits_total', 'counter',
+             'Compiled test cases found in the caches of the workers.',
+             [('yaksh_harness_hits_total', [],
+               self.compile_stats['harness_hits'])]),
+            ('yaksh_harness_misses_total', 'counter',
+             'Compiled test cases missing from the caches of the workers.',
+             [('yaksh_harness_misses_total', [],
+               self.compile_stats['harness_misses'])]),
+        ]
+        return ''.join(format_metric(*metric) for metric in metrics)
+
+    def is_cached(self, data):
+        """Check if a job would be answered from the cache."""
+        key = get_cache_key(data)
+        return key is not None and key in self.cache
+
+    def submit(self, uid, data, user_dir, priority=DEFAULT_PRIORITY):
+        """Queue a job, `data` being the decoded job data.
+
+        A job answered from the cache gets the cached result marked as
+        `cached` and without its `resources`, as it was not run again.
+        """
+        key = get_cache_key(data)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                cached = dict(cached, cached=True)
+                cached.pop('resources', None)
+                self._set_result(uid, dict(status='done', result=cached))
+                return
+            if self.broker is None:
+                self.cache_keys[uid] = key
+        job = (uid, data, user_dir, time.time())
+        if self.broker is not None:
+            self.broker.set_result(uid, dict(status='not started'))
+            self.broker.put(job, priority)
+            self._dispatch()
+            return
+        self.job_queue.put(job, priority)
+        self.results.set(uid, dict(status='not started'))
+        self._dispatch()
+
+    def _is_remote(self, uid):
+        """Check if a job is only known to the broker."""
+        return self.broker is not None and uid not in self.results
+
+    def _pop_result(self, uid):
+        if self._is_remote(uid):
+            result = self.broker.get_result(uid) or dict(status='unknown')
+            if result.get('status') == 'done':
+                self.broker.delete_result(uid)
+            return result
         result = self.results.get(uid, dict(status='unknown'))
-        self._handle_dead_process(result)
+        result = self._handle_dead_process(uid, result)
         if result.get('status') == 'done':
             self.results.pop(uid)
-        return json.dumps(result)
+            if self.broker is not None:
+                self.broker.delete_result(uid)
+        return result
+
+    def get_result(self, uid):
+        return json.dumps(encode_result(self._pop_result(uid)))
+
+    def get_results(self, uids, version=1):
+        """Return the results of the given jobs as a jsonized dict keyed on
+        the uid, for the given version of the protocol.
+        """
+        return json.dumps(dict((uid, encode_result(self._pop_result(uid),
+                                                   version))
+                               for uid in uids))
+
+    @gen.coroutine
+    def _wait_for_result(self, uid, timeout):
+        if self._is_remote(uid):
+            result = yield self._wait_for_broker_result(uid, timeout)
+            raise gen.Return(result)
+        result = self.results.get(uid, dict(status='unknown'))
+        result = self._handle_dead_process(uid, result)
+        if result.get('status') in ('not started', 'running'):
+            future = Future()
+            waiters = self.waiters.setdefault(uid, [])
+            waiters.append(future)
+            try:
+                result = yield gen.with_timeout(
+                    timedelta(seconds=timeout), future
+                )
+                raise gen.Return(result)
+            except gen.TimeoutError:
+                waiters.remove(future)
+                if not waiters and self.waiters.get(uid) is waiters:
+                    self.waiters.pop(uid)
+        raise gen.Return(self._pop_result(uid))
+
+    @gen.coroutine
+    def _wait_for_broker_result(self, uid, timeout):
+        """Poll the broker for the result of a job run by another pool."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            result = self.broker.get_result(uid)
+            if result is None or result.get('status') == 'done':
+                break
+            yield gen.sleep(SERVER_BROKER_POLL_INTERVAL)
+        raise gen.Return(self._pop_result(uid))
+
+    @gen.coroutine
+    def wait_for_result(self, uid, timeout):
+        """Wait till the job is done or `timeout` seconds have passed and
+        return the result as `get_result` would.
+        """
+        result = yield self._wait_for_result(uid, timeout)
+        raise gen.Return(json.dumps(encode_result(result)))
+
+    @gen.coroutine
+    def wait_for_results(self, uids, timeout, version=1):
+        """Wait till all the jobs are done or `timeout` seconds have passed
+        and return the results as `get_results` would.
+        """
+        results = yield [self._wait_for_result(uid, timeout) for uid in uids]
+        raise gen.Return(json.dumps(dict(
+            (uid, encode_result(result, version))
+            for uid, result in zip(uids, results)
+        )))
 
     def run(self):
         """Run server which returns an available server port where code
         can be executed.
         """
+        self.start()
+        IOLoop.current().start()
+
+    def start(self):
+        """Start the code servers and the periodic tasks of the pool on the
+        current IOLoop, without running the IOLoop.
+        """
         # We start the code servers here to ensure they are run as nobody.
         self._start_code_servers()
-        IOLoop.current().start()
+        self.reaper = PeriodicCallback(
+            self._reap_results, SERVER_REAPER_INTERVAL*1000
+        )
+        self.reaper.start()
+        self.supervisor = PeriodicCallback(
+            self._supervise, SERVER_SUPERVISOR_INTERVAL*1000
+        )
+        self.supervisor.start()
+        if self.max_workers > self.min_workers:
+            self.scaler = PeriodicCallback(
+                self._autoscale, SERVER_SCALE_INTERVAL*1000
+            )
+            self.scaler.start()
+        if self.broker is not None:
+            self.puller = PeriodicCallback(
+                self._dispatch, SERVER_BROKER_POLL_INTERVAL*1000
+            )
+            self.puller.start()
 
     def stop(self):
         """Stop all the code server processes.
         """
+        self.stopping = True
+        if self.reaper is not None:
+            self.reaper.stop()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        if self.scaler is not None:
+            self.scaler.stop()
+        if self.puller is not None:
+            self.puller.stop()
         for proc in self.processes:
-            proc.terminate()
+            if proc is not None:
+                kill_children(proc.pid)
+                proc.terminate()
         IOLoop.current().stop()
 
 
@@ -167,28 +1166,253 @@ class MainHandler(RequestHandler):
     def initialize(self, server):
         self.server = server
 
+    @gen.coroutine
     def get(self):
         path = self.request.path[1:]
         if len(path) == 0:
             q_size, alive, running = self.server.get_status()
-            result = "%d processes, %d running, %d queued" % (
-                alive, running, q_size
+            n_results, expired, evicted = self.server.get_result_status()
+            recycled, restarted, hung = self.server.get_worker_status()
+            wait, rejected = self.server.get_admission_status()
+            n_cached, hit_rate = self.server.get_cache_status()
+            harness_hits, harness_misses = self.server.get_compile_status()
+            result = ("%d processes, %d running, %d queued, %d results, "
+                      "%d expired, %d evicted, %d recycled, %d restarted, "
+                      "%d hung, %.1f s wait, %d rejected, %d cached, "
+                      "%.1f%% cache hits, %d harness hits, "
+                      "%d harness misses") % (
+                alive, running, q_size, n_results, expired, evicted,
+                recycled, restarted, hung, wait, rejected, n_cached,
+                hit_rate * 100, harness_hits, harness_misses
             )
+            usage = self.server.get_usage_status()
+            for language in sorted(usage, key=str):
+                totals = usage[language]
+                result += ("; %s: %d jobs, %.1f s CPU, %.1f s wall, "
+                           "%.1f s queued, %d kB peak RSS") % (
+                    language, totals['jobs'], totals['cpu_time'],
+                    totals['wall_time'], totals['queue_wait'],
+                    totals['max_rss']
+                )
             self.write(result)
         else:
             uid = path
-            json_result = self.server.get_result(uid)
+            timeout = min(float(self.get_argument('timeout', 0)),
+                          SERVER_LONG_POLL_TIMEOUT)
+            if timeout > 0:
+                json_result = yield self.server.wait_for_result(uid, timeout)
+            else:
+                json_result = self.server.get_result(uid)
             self.write(json_result)
 
     def post(self):
-        uid = self.get_argument('uid')
-        json_data = self.get_argument('json_data')
-        user_dir = self.get_argument('user_dir')
-        self.server.submit(uid, json_data, user_dir)
-        self.write('OK')
+        submit_jobs(self, [dict(
+            uid=self.get_argument('uid'),
+            data=decode_json(self.get_argument('json_data')),
+            user_dir=self.get_argument('user_dir'),
+            priority=self.get_argument('priority', None)
+        )])
+
+
+class BatchHandler(RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    @gen.coroutine
+    def get(self):
+        uids = [uid for uid in self.get_argument('uids', '').split(',') if uid]
+        timeout = min(float(self.get_argument('timeout', 0)),
+                      SERVER_LONG_POLL_TIMEOUT)
+        if timeout > 0:
+            json_results = yield self.server.wait_for_results(uids, timeout)
+        else:
+            json_results = self.server.get_results(uids)
+        self.write(json_results)
+
+    def post(self):
+        jobs = decode_json(self.request.body)
+        for job in jobs:
+            job['data'] = decode_json(job.pop('json_data'))
+        submit_jobs(self, jobs)
+
+
+class JobsHandler(RequestHandler):
+    """Version 2 of the protocol, in which jobs and results are sent as
+    plain JSON documents, the job data and results not being encoded again
+    inside them. Request bodies may be compressed with gzip.
+
+    POST /v2/jobs takes `{"jobs": [{"uid": ..., "data": {...},
+    "user_dir": ..., "priority": ...}, ...]}`.
+
+    GET /v2/results?uids=...&timeout=... returns the results keyed on the
+    uid, as `/batch` does.
+    """
+    def initialize(self, server):
+        self.server = server
+
+    @gen.coroutine
+    def get(self):
+        uids = [uid for uid in self.get_argument('uids', '').split(',') if uid]
+        timeout = min(float(self.get_argument('timeout', 0)),
+                      SERVER_LONG_POLL_TIMEOUT)
+        if timeout > 0:
+            json_results = yield self.server.wait_for_results(uids, timeout,
+                                                              version=2)
+        else:
+            json_results = self.server.get_results(uids, version=2)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_results)
+
+    def post(self):
+        submit_jobs(self, decode_json(self.request.body)['jobs'])
+
+
+class MetricsHandler(RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(self.server.get_metrics())
+
+
+def decode_json(data):
+    """Decode JSON sent by a client."""
+    try:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+    except ValueError:
+        raise HTTPError(400, 'Invalid JSON')
+
+
+def submit_jobs(handler, jobs):
+    """Queue the jobs sent to a handler, as dicts with the `uid`, decoded
+    `data`, `user_dir` and `priority` of each. The jobs are all turned away
+    if the most urgent of them may not be queued.
+    """
+    server = handler.server
+    priorities = [get_priority(job.get('priority')) for job in jobs]
+    if not all(server.is_cached(job['data']) for job in jobs):
+        urgent = min(priorities, key=PRIORITIES.index)
+        retry_after = server.check_admission(urgent)
+        if retry_after is not None:
+            reject_busy(handler, retry_after)
+            return
+    for job, priority in zip(jobs, priorities):
+        server.submit(job['uid'], job['data'], job['user_dir'], priority)
+    handler.write('OK')
+
+
+def get_priority(priority):
+    """Validate a priority sent by a client."""
+    if priority is None:
+        return DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        raise HTTPError(400, 'Unknown priority %s' % priority)
+    return priority
+
+
+def reject_busy(handler, retry_after):
+    """Turn a submission away as the server pool is too busy."""
+    handler.set_status(503)
+    handler.set_header('Retry-After', str(retry_after))
+    handler.write('Server busy, retry after %d seconds.' % retry_after)
+
+
+def check_busy(response):
+    """Raise ServerBusyError if the server pool turned a submission
+    away.
+    """
+    if response.status_code == 503:
+        retry_after = int(response.headers.get('Retry-After', 1))
+        raise ServerBusyError(retry_after)
+
+
+# The HTTP session and the threads of this process, made again in a forked
+# process as connections and threads cannot be shared with the parent.
+_session = None
+_executor = None
+_client_pid = None
+
+
+def _reset_client():
+    global _session, _executor, _client_pid
+    if _client_pid != os.getpid():
+        _session = _executor = None
+        _client_pid = os.getpid()
+
+
+def get_session():
+    """Return the HTTP session of this process for requests to server pools.
+    Connections are kept open between requests, at most
+    SERVER_CLIENT_POOL_SIZE of them to each server pool. Requests beyond
+    these do not wait for a connection to be free but open one of their
+    own, which is closed once they are done.
+    """
+    global _session
+    _reset_client()
+    if _session is None:
+        adapter = HTTPAdapter(pool_connections=SERVER_CLIENT_POOL_SIZE,
+                              pool_maxsize=SERVER_CLIENT_POOL_SIZE,
+                              pool_block=False)
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def _is_pending(result):
+    """Check if a result is of a job which is still to be done. A job the
+    server pool does not know of, with the status 'unknown', never will be.
+    """
+    return result.get('status') not in ('done', 'unknown')
+
+
+def _was_not_sent(error):
+    """Check if a failed request never reached the server pool, as when a
+    connection to it could not be made.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
 
+def get_retry_delay(attempt):
+    """Return the seconds to wait before trying a request again for the
+    `attempt`th time, counting from 0. The delay doubles with each attempt
+    and is randomized so that clients do not all retry at once.
+    """
+    return SERVER_CLIENT_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def send_request(method, url, long_poll=0, **kwargs):
+    """Send a request to a server pool over the session of this process.
+    `long_poll` is the number of seconds the server pool may hold the
+    request, which is added to the read timeout.
 
-def submit(url, uid, json_data, user_dir):
+    A GET request which cannot connect or fails is tried again up to
+    SERVER_CLIENT_RETRIES times. Other requests, which may not be safe to
+    send twice, are only tried again if they could not connect, as they
+    cannot have reached the server pool.
+    """
+    timeout = (SERVER_CLIENT_CONNECT_TIMEOUT,
+               SERVER_CLIENT_READ_TIMEOUT + long_poll)
+    attempt = 0
+    while True:
+        try:
+            return get_session().request(method, url, timeout=timeout,
+                                         **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            retry = method.upper() == 'GET' or _was_not_sent(e)
+            if not retry or attempt >= SERVER_CLIENT_RETRIES:
+                raise
+        time.sleep(get_retry_delay(attempt))
+        attempt += 1
+
+
+def submit(url, uid, json_data, user_dir, priority=DEFAULT_PRIORITY):
     '''Submit a job to the code server.
 
     Parameters
@@ -205,10 +1429,14 @@ def submit(url, uid, json_data, user_dir):
 
     user_dir : str
         User directory.
+
+    priority : str
+        One of PRIORITIES. Queued jobs with a more urgent priority are run
+        first.
+
+    Raises ServerBusyError if the server pool is too busy to take the job.
     '''
-    requests.post(
-        url, data=dict(uid=uid, json_data=json_data, user_dir=user_dir)
-    )
+    submit_batch(url, [(uid, json_data, user_dir)], priority)
 
 
 def get_result(url, uid, block=False):
@@ -229,21 +1457,187 @@ def get_result(url, uid, block=False):
         Unique ID of the submission.
 
     block : bool
-        Set to True if you wish to block till result is done.
+        Set to True if you wish to block till result is done. The server pool
+        holds each request till the job is done or for at most
+        SERVER_LONG_POLL_TIMEOUT seconds, so no polling is needed. A job
+        whose status is 'unknown' is not waited for.
 
     '''
-    def _get_data():
-        r = requests.get(urllib.parse.urljoin(url, str(uid)))
+    def _get_data(timeout=0):
+        r = send_request('GET', urllib.parse.urljoin(url, str(uid)),
+                         long_poll=timeout,
+                         params=dict(timeout=timeout) if timeout else None)
         return json.loads(r.content.decode('utf-8'))
-    data = _get_data()
     if block:
-        while data.get('status') != 'done':
-            time.sleep(0.1)
-            data = _get_data()
+        data = _get_data(SERVER_LONG_POLL_TIMEOUT)
+        while _is_pending(data):
+            data = _get_data(SERVER_LONG_POLL_TIMEOUT)
+    else:
+        data = _get_data()
 
     return data
 
 
+def submit_batch(url, jobs, priority=DEFAULT_PRIORITY):
+    '''Submit many jobs to the code server in a single request.
+
+    Parameters
+    ----------
+
+    url : str
+        URL of the server pool.
+
+    jobs : list
+        List of `(uid, json_data, user_dir)` tuples, see `submit`.
+
+    priority : str
+        Priority of all the jobs, see `submit`.
+
+    Raises ServerBusyError if the server pool is too busy to take the jobs.
+    '''
+    body = encode_jobs(jobs, priority).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if SERVER_CLIENT_COMPRESS_SIZE and len(body) > SERVER_CLIENT_COMPRESS_SIZE:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    r = send_request('POST', urllib.parse.urljoin(url, 'v2/jobs'),
+                     data=body, headers=headers)
+    check_busy(r)
+
+
+def encode_jobs(jobs, priority):
+    '''Return the body of a request submitting `(uid, json_data, user_dir)`
+    jobs with version 2 of the protocol. The job data, being JSON already,
+    is put in the body as is rather than encoded again.
+    '''
+    encoded = []
+    for uid, json_data, user_dir in jobs:
+        job = json.dumps(dict(uid=str(uid), user_dir=user_dir,
+                              priority=priority))
+        encoded.append('%s, "data": %s}' % (job[:-1], json_data))
+    return '{"jobs": [%s]}' % ', '.join(encoded)
+
+
+def get_results(url, uids, block=False):
+    '''Get the status of many jobs submitted to the code server.
+
+    Returns a dict keyed on the uid, as a string, of the results in the form
+    returned by `get_result`.
+
+    Parameters
+    ----------
+
+    url : str
+        URL of the server pool.
+
+    uids : list
+        Unique IDs of the submissions.
+
+    block : bool
+        Set to True if you wish to block till all the results are done. Jobs
+        whose status is 'unknown' are not waited for.
+
+    '''
+    def _get_data(uids, timeout=0):
+        params = dict(uids=','.join(str(uid) for uid in uids))
+        if timeout:
+            params['timeout'] = timeout
+        r = send_request('GET', urllib.parse.urljoin(url, 'batch'),
+                         long_poll=timeout, params=params)
+        return json.loads(r.content.decode('utf-8'))
+    if block:
+        data = _get_data(uids, SERVER_LONG_POLL_TIMEOUT)
+        pending = [uid for uid, result in data.items()
+                   if _is_pending(result)]
+        while pending:
+            data.update(_get_data(pending, SERVER_LONG_POLL_TIMEOUT))
+            pending = [uid for uid in pending if _is_pending(data[uid])]
+    else:
+        data = _get_data(uids)
+    return data
+
+
+def fetch_results(url, uids, block=False):
+    '''Get the status of many jobs submitted to the code server, with
+    version 2 of the protocol.
+
+    Returns a dict keyed on the uid, as a string, of the results as
+    `get_results` does, except that the result of a job which is done is
+    a dict rather than a jsonized string.
+
+    Parameters are as for `get_results`.
+    '''
+    def _get_data(uids, timeout=0):
+        params = dict(uids=','.join(str(uid) for uid in uids))
+        if timeout:
+            params['timeout'] = timeout
+        r = send_request('GET', urllib.parse.urljoin(url, 'v2/results'),
+                         long_poll=timeout, params=params)
+        return r.json()
+    data = _get_data(uids, SERVER_LONG_POLL_TIMEOUT if block else 0)
+    pending = [uid for uid, result in data.items()
+               if block and _is_pending(result)]
+    while pending:
+        data.update(_get_data(pending, SERVER_LONG_POLL_TIMEOUT))
+        pending = [uid for uid in pending if _is_pending(data[uid])]
+    return data
+
+
+def fetch_result(url, uid, block=False):
+    '''Get the status of a job submitted to the code server, with version
+    2 of the protocol. Returns the result as `get_result` does, except that
+    the result of a job which is done is a dict rather than a jsonized
+    string.
+
+    Parameters are as for `get_result`.
+    '''
+    return fetch_results(url, [uid], block)[str(uid)]
+
+
+def _run_in_thread(func, *args):
+    """Call `func` in a thread of this process, returning an asyncio
+    future for what it returns.
+    """
+    global _executor
+    _reset_client()
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SERVER_CLIENT_POOL_SIZE)
+    return asyncio.get_event_loop().run_in_executor(
+        _executor, partial(func, *args)
+    )
+
+
+async def async_submit(url, uid, json_data, user_dir,
+                       priority=DEFAULT_PRIORITY):
+    '''Coroutine submitting a job to the code server, see `submit`.'''
+    await _run_in_thread(submit, url, uid, json_data, user_dir, priority)
+
+
+async def async_get_result(url, uid, block=False):
+    '''Coroutine getting the status of a job, see `get_result`.'''
+    return await _run_in_thread(get_result, url, uid, block)
+
+
+async def async_submit_batch(url, jobs, priority=DEFAULT_PRIORITY):
+    '''Coroutine submitting many jobs, see `submit_batch`.'''
+    await _run_in_thread(submit_batch, url, jobs, priority)
+
+
+async def async_get_results(url, uids, block=False):
+    '''Coroutine getting the status of many jobs, see `get_results`.'''
+    return await _run_in_thread(get_results, url, uids, block)
+
+
+async def async_fetch_result(url, uid, block=False):
+    '''Coroutine getting the status of a job, see `fetch_result`.'''
+    return await _run_in_thread(fetch_result, url, uid, block)
+
+
+async def async_fetch_results(url, uids, block=False):
+    '''Coroutine getting the status of many jobs, see `fetch_results`.'''
+    return await _run_in_thread(fetch_results, url, uids, block)
+
+
 ###############################################################################
 def main(args=None):
     parser = ArgumentParser(description=__doc__)
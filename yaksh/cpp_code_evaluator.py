@@ -1,18 +1,61 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
+from collections import OrderedDict
+import hashlib
 import os
 from os.path import isfile
 import subprocess
 
 # Local imports
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files, get_file_digest
 from .base_evaluator import BaseEvaluator
 from .grader import CompilationError, TestCaseError
 from .error_messages import prettify_exceptions
+from .settings import HARNESS_CACHE_SIZE
+
+
+class HarnessCache(object):
+    """Compiled test cases kept by a code server process, keyed on a hash
+    of the test case, the command compiling it and the content of the files
+    given with the question, which it may include, so that a test case is
+    compiled once for all the submissions to its question. At most
+    `max_size` are kept, the least recently used being dropped first.
+    """
+    def __init__(self, max_size=HARNESS_CACHE_SIZE):
+        self.max_size = max_size
+        self._objects = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, key):
+        data = self._objects.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._objects.move_to_end(key)
+        return data
+
+    def set(self, key, data):
+        if self.max_size <= 0:
+            return
+        self._objects[key] = data
+        self._objects.move_to_end(key)
+        while len(self._objects) > self.max_size:
+            self._objects.popitem(last=False)
+
+
+harness_cache = HarnessCache()
 
 
 class CppCodeEvaluator(BaseEvaluator):
     """Tests the C code obtained from Code Server"""
+
+    compiles_answer = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.compiled_user_answer = None
@@ -21,6 +64,7 @@ class CppCodeEvaluator(BaseEvaluator):
         self.ref_output_path = ""
         self.submit_code_path = ""
         self.test_code_path = ""
+        self.test_object_path = ""
 
         # Set metadata values
         self.user_answer = metadata.get('user_answer')
@@ -32,19 +76,6 @@ class CppCodeEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if os.path.exists(self.ref_output_path):
-            os.remove(self.ref_output_path)
-        if os.path.exists(self.user_output_path):
-            os.remove(self.user_output_path)
-        if os.path.exists(self.test_code_path):
-            os.remove(self.test_code_path)
-        if self.files:
-            delete_files(self.files)
-
     def set_file_paths(self):
         user_output_path = os.getcwd() + '/output_file'
         ref_output_path = os.getcwd() + '/executable'
@@ -56,11 +87,59 @@ class CppCodeEvaluator(BaseEvaluator):
         compile_command = 'g++  {0} -c -o {1}'.format(
             self.submit_code_path, user_output_path)
         compile_main = 'g++ {0} {1} -o {2}'.format(
-            clean_ref_code_path, user_output_path,
+            self.test_object_path, user_output_path,
             ref_output_path
             )
         return compile_command, compile_main
 
+    def get_test_command(self, clean_ref_code_path):
+        return 'g++ {0} -c -o {1}'.format(clean_ref_code_path,
+                                          self.test_object_path)
+
+    def compile_test_code(self, clean_ref_code_path):
+        """Compile the test case and link it with the user answer. The
+        compiled test case is taken from the harness cache of this process if
+        it is there.
+        """
+        files = ''.join(
+            '{0} {1} {2}\n'.format(get_file_digest(file_path),
+                                   os.path.basename(file_path), extract)
+            for file_path, extract in self.file_paths or []
+        )
+        key = hashlib.sha256(
+            '{0}\n{1}{2}'.format('g++ -c', files, self.test_case)
+            .encode('utf-8')
+        ).hexdigest()
+        data = harness_cache.get(key)
+        if data is None:
+            if self.compile_cache is not None:
+                self.compile_cache.harness_misses += 1
+            compiled = self._run_command(
+                self.get_test_command(clean_ref_code_path),
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                limit_cpu=False
+            )
+            proc, stdout, stderr = compiled
+            if (proc.returncode != 0 or
+                    self._remove_null_substitute_char(stderr) != ''):
+                return compiled
+            with open(self.test_object_path, 'rb') as f:
+                harness_cache.set(key, f.read())
+        else:
+            if self.compile_cache is not None:
+                self.compile_cache.harness_hits += 1
+            with open(self.test_object_path, 'wb') as f:
+                f.write(data)
+        return self._run_command(
+            self.compile_main,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            limit_cpu=False
+        )
+
     def compile_code(self):
         if self.compiled_user_answer and self.compiled_test_code:
             return None
@@ -81,23 +160,21 @@ class CppCodeEvaluator(BaseEvaluator):
                 return False, msg
 
             self.user_output_path, self.ref_output_path = self.set_file_paths()
+            self.test_object_path = os.getcwd() + '/main.o'
             self.compile_command, self.compile_main = self.get_commands(
                 clean_ref_code_path,
                 self.user_output_path,
                 self.ref_output_path
             )
-            self.compiled_user_answer = self._run_command(
+            self.compiled_user_answer = self._compile_user_answer(
                 self.compile_command,
                 shell=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
 
-            self.compiled_test_code = self._run_command(
-                self.compile_main,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+            self.compiled_test_code = self.compile_test_code(
+                clean_ref_code_path
             )
 
             return self.compiled_user_answer, self.compiled_test_code
@@ -6,12 +6,15 @@ from os.path import isfile
 
 # Local imports
 from .stdio_evaluator import StdIOEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .grader import CompilationError
 
 
 class CppStdIOEvaluator(StdIOEvaluator):
     """Evaluates C StdIO based code"""
+
+    compiles_answer = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
 
@@ -26,16 +29,6 @@ class CppStdIOEvaluator(StdIOEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if self.files:
-            delete_files(self.files)
-        if os.path.exists(self.ref_output_path):
-            os.remove(self.ref_output_path)
-        if os.path.exists(self.user_output_path):
-            os.remove(self.user_output_path)
-
     def set_file_paths(self):
         user_output_path = os.getcwd() + '/output_file'
         ref_output_path = os.getcwd() + '/executable'
@@ -61,18 +54,15 @@ class CppStdIOEvaluator(StdIOEvaluator):
             self.user_output_path,
             self.ref_output_path
             )
-        self.compiled_user_answer = self._run_command(self.compile_command,
-                                                      shell=True,
-                                                      stdin=subprocess.PIPE,
-                                                      stdout=subprocess.PIPE,
-                                                      stderr=subprocess.PIPE
-                                                      )
-        self.compiled_test_code = self._run_command(self.compile_main,
-                                                    shell=True,
-                                                    stdin=subprocess.PIPE,
-                                                    stdout=subprocess.PIPE,
-                                                    stderr=subprocess.PIPE
-                                                    )
+        self.compiled_user_answer = self._compile_user_answer(
+            self.compile_command, shell=True, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        # Linking only needs the user answer so it is shared too.
+        self.compiled_test_code = self._compile_user_answer(
+            self.compile_main, shell=True, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
         return self.compiled_user_answer, self.compiled_test_code
 
     def check_code(self):
@@ -89,7 +79,7 @@ class CppStdIOEvaluator(StdIOEvaluator):
                                     stdin=subprocess.PIPE,
                                     stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE,
-                                    preexec_fn=os.setpgrp
+                                    preexec_fn=self._set_process_limits
                                     )
             success, err = self.evaluate_stdio(self.user_answer, proc,
                                                self.expected_input,
@@ -2,6 +2,13 @@ try:
     from itertools import zip_longest
 except ImportError:
     from itertools import izip_longest as zip_longest
+import re
+
+
+# Line boundaries as recognised by str.splitlines.
+LINE_BREAKS = re.compile(
+    '\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]'
+)
 
 
 def prettify_exceptions(exception, message, traceback=None,
@@ -30,27 +37,40 @@ def prettify_exceptions(exception, message, traceback=None,
     return err
 
 
-def _get_incorrect_user_lines(exp_lines, user_lines):
-    err_line_numbers = []
-    for line_no, (expected_line, user_line) in \
-            enumerate(zip_longest(exp_lines, user_lines)):
-        if user_line != expected_line:
-            err_line_numbers.append(line_no)
-    return err_line_numbers
+def _iter_lines(text):
+    """Yield the lines of `text` as `text.splitlines()` would return them."""
+    start = 0
+    for match in LINE_BREAKS.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    if start < len(text):
+        yield text[start:]
 
 
 def compare_outputs(expected_output, user_output, given_input=None):
-    given_lines = user_output.splitlines()
-    exp_lines = expected_output.splitlines()
+    """Compare the outputs line by line. The lines are only collected into
+    lists when they are needed to report a mismatch.
+    """
+    ng = ne = 0
+    err_line_numbers = []
+    for line_no, (expected_line, user_line) in enumerate(
+            zip_longest(_iter_lines(expected_output),
+                        _iter_lines(user_output))):
+        if expected_line is not None:
+            ne += 1
+        if user_line is not None:
+            ng += 1
+        if user_line != expected_line:
+            err_line_numbers.append(line_no)
     msg = {"type": "stdio",
            "given_input": given_input,
-           "expected_output": exp_lines,
-           "user_output": given_lines
+           "expected_output": None,
+           "user_output": None,
+           "error_line_numbers": err_line_numbers
            }
-    ng = len(given_lines)
-    ne = len(exp_lines)
-    err_line_numbers = _get_incorrect_user_lines(exp_lines, given_lines)
-    msg["error_line_numbers"] = err_line_numbers
+    if err_line_numbers:
+        msg["expected_output"] = expected_output.splitlines()
+        msg["user_output"] = user_output.splitlines()
     if ng != ne:
         msg["error_msg"] = ("Incorrect Answer: " +
                             "We had expected {} number of lines. ".format(ne) +
@@ -4,6 +4,7 @@ import os
 import shutil
 import tempfile
 from textwrap import dedent
+from unittest.mock import patch
 from psutil import Process
 
 # Local import
@@ -85,6 +86,108 @@ class CAssertionEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_answer_compiled_once_for_all_test_cases(self):
+        # Given
+        user_answer = "int add(int a, int b)\n{return a+b;}"
+        test_case_data = [dict(self.test_case_data[0], weight=1.0),
+                          dict(self.test_case_data[0], weight=2.0)]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': True,
+                    'language': 'cpp'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(result.get('weight'), 3.0)
+        self.assertEqual(len(grader.compile_cache.outputs), 1)
+        self.assertTrue(result.get('compile_time_saved') > 0)
+
+    def test_compiled_test_case_is_reused(self):
+        # Given
+        test_case_data = [dict(self.test_case_data[0],
+                               test_case=self.tc_data + "// reused\n")]
+
+        def evaluate(user_answer):
+            kwargs = {
+                      'metadata': {
+                        'user_answer': user_answer,
+                        'file_paths': self.file_paths,
+                        'partial_grading': False,
+                        'language': 'cpp'
+                        }, 'test_case_data': test_case_data,
+                      }
+            grader = Grader(self.in_dir)
+            return grader, grader.evaluate(kwargs)
+
+        # When
+        grader, result = evaluate("int add(int a, int b)\n{return a+b;}")
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(grader.compile_cache.harness_misses, 1)
+        self.assertEqual(grader.compile_cache.harness_hits, 0)
+
+        # When
+        grader, result = evaluate("int add(int a, int b)\n{return a-b;}")
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(grader.compile_cache.harness_misses, 0)
+        self.assertEqual(grader.compile_cache.harness_hits, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.in_dir, 'main.o')))
+
+    def test_compiled_test_case_follows_question_files(self):
+        # Given
+        header = os.path.join(self.in_dir, 'expected.h')
+        test_case_data = [dict(self.test_case_data[0], test_case=dedent("""
+            #include <stdlib.h>
+            #include "expected.h"
+
+            extern int add(int, int);
+
+            int main(void)
+            {
+                return add(2, 3) == EXPECTED ? 0 : 1;
+            }
+            """))]
+
+        def evaluate(expected):
+            with open(header, 'w') as f:
+                f.write('#define EXPECTED %d\n' % expected)
+            kwargs = {
+                      'metadata': {
+                        'user_answer': "int add(int a, int b)\n{return a+b;}",
+                        'file_paths': [(header, False)],
+                        'partial_grading': False,
+                        'language': 'cpp'
+                        }, 'test_case_data': test_case_data,
+                      }
+            grader = Grader(self.in_dir)
+            return grader, grader.evaluate(kwargs)
+
+        # When
+        grader, result = evaluate(5)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(grader.compile_cache.harness_misses, 1)
+
+        # When
+        grader, result = evaluate(6)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(grader.compile_cache.harness_misses, 1)
+        self.assertEqual(grader.compile_cache.harness_hits, 0)
+
     def test_incorrect_answer(self):
         # Given
         user_answer = "int add(int a, int b)\n{return a-b;}"
@@ -323,6 +426,162 @@ class CppStdIOEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_answer_compiled_once_for_all_test_cases(self):
+        # Given
+        user_answer = dedent("""
+        #include<stdio.h>
+        int main(void){
+        int a,b;
+        scanf("%d%d",&a,&b);
+        printf("%d",a+b);
+        }""")
+        test_case_data = [
+            dict(self.test_case_data[0]),
+            dict(self.test_case_data[0], expected_input='1\n2',
+                 expected_output='3'),
+            dict(self.test_case_data[0], expected_input='1\n2',
+                 expected_output='4'),
+        ]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'language': 'cpp'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(len(grader.compile_cache.outputs), 2)
+        self.assertTrue(result.get('compile_time_saved') > 0)
+
+    def test_parallel_test_cases(self):
+        # Given
+        user_answer = dedent("""
+        #include<stdio.h>
+        int main(void){
+        int a,b;
+        scanf("%d%d",&a,&b);
+        printf("%d",a+b);
+        }""")
+        test_case_data = [
+            dict(self.test_case_data[0]),
+            dict(self.test_case_data[0], expected_input='1\n2',
+                 expected_output='4'),
+            dict(self.test_case_data[0], expected_input='1\n2',
+                 expected_output='3'),
+        ]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'parallel_test_cases': True,
+                    'language': 'cpp'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertIn('4', result.get('error')[0]['expected_output'])
+        # The answer is compiled once rather than by each test case.
+        self.assertTrue(result.get('compile_time_saved') > 0)
+
+    def test_cpu_limit(self):
+        # Given
+        user_answer = dedent("""
+        #include<stdio.h>
+        int main(void){
+        while(1){}
+        }""")
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'cpu_limit': 1,
+                    'language': 'cpp'
+                    }, 'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertTrue(result.get('timings')[0]['wall_time'] < 3)
+        self.assertEqual(result.get('error')[0]['exception'],
+                         'TimeoutException')
+        self.assertEqual(result.get('error')[0]['message'],
+                         'Test case 1 used more than 1 seconds of CPU time.')
+
+    def test_cpu_limit_is_not_applied_to_compiler(self):
+        # Given
+        user_answer = dedent("""
+        #include<bits/stdc++.h>
+        using namespace std;
+        int main(void){
+        int a,b;
+        cin>>a>>b;
+        cout<<a+b;
+        }""")
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'cpu_limit': 0.01,
+                    'language': 'cpp'
+                    }, 'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+
+    @patch('yaksh.base_evaluator.MAX_OUTPUT_SIZE', 1000)
+    def test_output_limit(self):
+        # Given
+        user_answer = dedent("""
+        #include<stdio.h>
+        int main(void){
+        while(1){printf("x");}
+        }""")
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'language': 'cpp'
+                    }, 'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        error = result.get('error')[0]
+        self.assertEqual(error['exception'], 'OutputLimitExceeded')
+        self.assertIn('more than 1000 bytes', error['message'])
+        self.assertTrue(result.get('timings')[0]['wall_time'] < 3)
+
     def test_array_input(self):
         # Given
         test_case_data = [{'expected_output': '561',
@@ -441,6 +700,8 @@ class CppStdIOEvaluationTestCases(EvaluatorBaseTest):
         for error in errors:
             self.assertEqual(error['exception'], 'CompilationError')
 
+    # Without an output limit, so that the code runs until it times out.
+    @patch('yaksh.base_evaluator.MAX_OUTPUT_SIZE', 0)
     def test_infinite_loop(self):
         # Given
         user_answer = dedent("""
@@ -649,6 +910,8 @@ class CppStdIOEvaluationTestCases(EvaluatorBaseTest):
         for error in errors:
             self.assertEqual(error['exception'], 'CompilationError')
 
+    # Without an output limit, so that the code runs until it times out.
+    @patch('yaksh.base_evaluator.MAX_OUTPUT_SIZE', 0)
     def test_cpp_infinite_loop(self):
         # Given
         user_answer = dedent("""
@@ -4,6 +4,7 @@ import os
 import tempfile
 import shutil
 from textwrap import dedent
+from unittest.mock import patch
 
 # Local import
 from yaksh.grader import Grader
@@ -128,6 +129,255 @@ class PythonAssertionEvaluationTestCases(EvaluatorBaseTest):
         error_testcase_list = [tc['test_case'] for tc in result.get('error')]
         self.assertEqual(error_testcase_list, given_test_case_list)
 
+    def test_parallel_test_cases(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn abs(a) + abs(b)"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(-1,2)==1)',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==3)',
+                           'weight': 2.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case":  'assert(add(-1,-2)==-3)',
+                           'weight': 1.0, 'hidden': True}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+        expected = Grader(self.in_dir).evaluate(kwargs)
+        kwargs['metadata']['parallel_test_cases'] = True
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(result.get('weight'), expected.get('weight'))
+        self.assertEqual(result.get('error'), expected.get('error'))
+        self.assertEqual(len(result.get('error')), 2)
+        self.assertEqual(os.listdir(self.in_dir), [])
+
+    def test_code_is_evaluated_in_a_scratch_directory(self):
+        # Given
+        scratch_dir = tempfile.mkdtemp()
+        user_answer = dedent("""
+            import os
+            with open('output.txt', 'w') as f:
+                f.write('1')
+            def cwd():
+                return os.getcwd()
+            """)
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert cwd().startswith(%r)' %
+                           scratch_dir,
+                           'weight': 0.0}]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+
+        # When
+        try:
+            with patch('yaksh.grader.SERVER_SCRATCH_DIR', scratch_dir):
+                result = Grader(self.in_dir).evaluate(kwargs)
+            scratch_files = os.listdir(scratch_dir)
+        finally:
+            shutil.rmtree(scratch_dir)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(scratch_files, [])
+        self.assertEqual(os.listdir(self.in_dir), [])
+
+    def test_scratch_directory_is_removed_on_error(self):
+        # Given
+        kwargs = {'metadata': {'language': 'python'}, 'test_case_data': []}
+
+        # When
+        with patch.object(Grader, 'get_evaluator_objects',
+                          side_effect=RuntimeError('bad job')):
+            with self.assertRaises(RuntimeError):
+                Grader(self.in_dir).evaluate(kwargs)
+
+        # Then
+        self.assertEqual(os.listdir(self.in_dir), [])
+
+    def test_fail_fast(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a - b"
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'fail_fast': True,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(result.get('skipped'), 2)
+
+        # Given
+        kwargs['metadata']['partial_grading'] = True
+
+        # When
+        result = Grader(self.in_dir).evaluate(kwargs)
+
+        # Then
+        self.assertEqual(len(result.get('error')), 3)
+        self.assertEqual(result.get('skipped'), 0)
+
+    def test_parallel_test_cases_fail_fast(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==3)',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==4)',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'while True: pass',
+                           'weight': 1.0, 'hidden': False}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'parallel_test_cases': True,
+                  'fail_fast': True,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(result.get('error')[0]['exception'],
+                         'AssertionError')
+        self.assertEqual(result.get('skipped'), 1)
+
+    def test_test_case_time_limit(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==3)',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'while True: pass',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(2,2)==4)',
+                           'weight': 1.0, 'hidden': False}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'time_limit': 0.5,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(result.get('weight'), 2.0)
+        errors = result.get('error')
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['exception'], 'TimeoutException')
+        self.assertIn('Test case 2 took more than 0.5 seconds',
+                      errors[0]['message'])
+        timings = result.get('timings')
+        self.assertEqual(len(timings), 3)
+        self.assertTrue(0.5 <= timings[1]['wall_time'] < SERVER_TIMEOUT)
+
+    def test_test_case_cpu_limit(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'while True: pass',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(2,2)==4)',
+                           'weight': 1.0, 'hidden': False}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'cpu_limit': 1,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertEqual(result.get('weight'), 1.0)
+        errors = result.get('error')
+        self.assertEqual(len(errors), 1)
+        self.assertIn('Test case 1 used more than 1 seconds of CPU time',
+                      errors[0]['message'])
+        self.assertTrue(result.get('timings')[0]['cpu_time'] >= 1)
+
+    def test_parallel_test_cases_stop_at_error(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==3)',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'while True: pass',
+                           'weight': 1.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==4)',
+                           'weight': 1.0, 'hidden': False}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'parallel_test_cases': True,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(result.get('weight'), 1.0)
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(result.get('error')[0]['exception'],
+                         'TimeoutException')
+
     def test_infinite_loop(self):
         # Given
         user_answer = "def add(a, b):\n\twhile True:\n\t\tpass"
@@ -475,6 +725,77 @@ class PythonAssertionEvaluationTestCases(EvaluatorBaseTest):
         self.assertEqual(error['exception'], 'AssertionError')
         self.assertEqual(error['message'], '-1 != 3')
 
+    def test_global_state_not_kept_between_answers(self):
+        # Given
+        user_answer = dedent("""\
+                             import math
+                             math.pi = 3
+                             def add(a, b):
+                                return a + b
+                            """)
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'import math\nassert math.pi > 3.14',
+                           "weight": 0.0}]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+        Grader(self.in_dir).evaluate(kwargs)
+        kwargs['metadata']['user_answer'] = "def add(a, b):\n\treturn a + b"
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get("success"))
+
+    def test_exit_in_answer(self):
+        # Given
+        user_answer = "import sys\nsys.exit(0)"
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get("success"))
+        self.assertEqual(result.get('error'),
+                         ['Process ended with exit code 0.'])
+
+
+    def test_resources_are_reported(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        resources = result.get('resources')
+        self.assertGreater(resources['wall_time'], 0)
+        self.assertGreaterEqual(resources['cpu_time'], 0)
+        self.assertGreater(resources['max_rss'], 0)
+
 
 class PythonStdIOEvaluationTestCases(EvaluatorBaseTest):
     def setUp(self):
@@ -673,6 +994,35 @@ class PythonStdIOEvaluationTestCases(EvaluatorBaseTest):
                                    )
         self.assertFalse(result.get('success'))
 
+    @patch('yaksh.python_stdio_evaluator.MAX_OUTPUT_SIZE', 1000)
+    def test_output_limit(self):
+        # Given
+        self.test_case_data = [{
+            "test_case_type": "stdiobasedtestcase",
+            "expected_input": "",
+            "expected_output": "3",
+            "weight": 0.0
+            }]
+        user_answer = "while True:\n\tprint('x')"
+
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        error = result.get('error')[0]
+        self.assertEqual(error['exception'], 'OutputLimitExceeded')
+        self.assertIn('more than 1000 characters', error['message'])
+
     def test_unicode_literal_bug(self):
         # Given
         user_answer = dedent("""\
@@ -773,6 +1123,38 @@ class PythonHookEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_global_state_not_kept_between_answers(self):
+        # Given
+        user_answer = "import math\nmath.pi = 3\ndef add(a,b):\n\treturn a + b"
+        hook_code = dedent("""\
+                            def check_answer(user_answer):
+                                import math
+                                exec(user_answer, globals())
+                                if add(1,2) == 3 and math.pi > 3.14:
+                                    return True, "", 1.0
+                                return False, "Incorrect Answer", 0.0
+                            """
+                           )
+        test_case_data = [{"test_case_type": "hooktestcase",
+                           "hook_code": hook_code, "weight": 1.0
+                           }]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+        Grader(self.in_dir).evaluate(kwargs)
+        kwargs['metadata']['user_answer'] = "def add(a,b):\n\treturn a + b"
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+
     def test_incorrect_answer(self):
         # Given
         user_answer = "def add(a,b):\n\treturn a - b"
@@ -38,3 +38,17 @@ def test_compare_outputs():
     m = "Incorrect Answer: Line number(s) 2 did not match."
     assert not success
     assert m == error_msg
+
+
+def test_compare_outputs_line_numbers():
+    exp = "1\r\n2\n3\n4"
+    given = "1\n5\n3"
+    success, msg = compare_outputs(exp, given)
+    assert not success
+    assert msg['error_line_numbers'] == [1, 3]
+    assert msg['expected_output'] == ['1', '2', '3', '4']
+    assert msg['user_output'] == ['1', '5', '3']
+
+    success, msg = compare_outputs("1\n2\n", "1\r2")
+    assert success
+    assert msg['error_line_numbers'] == []
@@ -1,17 +1,274 @@
+import errno
+import fcntl
+import hashlib
 import shutil
 import os
+import stat
 import zipfile
 import tempfile
 import csv
 
+# Local imports
+from .settings import (
+    SERVER_FILE_CACHE_SIZE, SERVER_FILE_CACHE_DIR, SERVER_FILE_CACHE_HARDLINKS
+)
+
+# ioctl request making a file a copy on write clone of another, on Linux
+# file systems which share blocks between files such as btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def _clone(src, dst):
+    """Make `dst` a copy on write clone of `src`. Raises OSError if the file
+    system cannot clone files."""
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def _hash_file(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _tree_size(path):
+    size = 0
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+class FileCache(object):
+    """Files given with questions, and the files extracted from them, kept
+    by the code server so that each is read and extracted once rather than
+    for every test case of every submission.
+
+    Each file is kept in a directory named after the SHA-256 digest of its
+    content, as `file`, along with an `extracted` directory once it has been
+    extracted. The digest of a file is looked up in the `.paths` directory
+    by its path, size and modification time, so that it is computed once.
+    Files are put in the directory of a job as clones, hard links or copies.
+    Once the kept files take more than `max_size` bytes, those least
+    recently used are removed.
+
+    Code server processes on a host share the cache. Files are added to it
+    in a temporary directory which is then renamed in place, so a process
+    never sees a file half added by another.
+
+    The cache is only as safe as its directory: code which can write to it
+    can change the files given to every later job, see
+    SERVER_FILE_CACHE_SIZE.
+    """
+    def __init__(self, path, max_size, hardlinks=False):
+        self.path = path
+        self.max_size = max_size
+        self.hardlinks = hardlinks
+        self.can_clone = True
+        self.index = os.path.join(path, '.paths')
+        os.makedirs(self.index, exist_ok=True)
+
+    def get_digest(self, file_path):
+        """Return the SHA-256 digest of the content of `file_path`."""
+        st = os.stat(file_path)
+        key = '%s:%d:%d' % (os.path.realpath(file_path), st.st_size,
+                            st.st_mtime_ns)
+        link = os.path.join(
+            self.index, hashlib.sha256(key.encode('utf-8')).hexdigest()
+        )
+        try:
+            return os.readlink(link)
+        except OSError:
+            pass
+        digest = _hash_file(file_path)
+        try:
+            os.symlink(digest, link)
+        except FileExistsError:
+            pass
+        return digest
+
+    def get(self, file_path, extract=False):
+        """Return the directory keeping `file_path`, adding the file to the
+        cache if need be, with the files extracted from it if `extract` is
+        set and it is a zip file.
+        """
+        entry = os.path.join(self.path, self.get_digest(file_path))
+        added = False
+        if not os.path.isdir(entry):
+            tmp = tempfile.mkdtemp(prefix='.tmp', dir=self.path)
+            shutil.copy(file_path, os.path.join(tmp, 'file'))
+            self._publish(tmp, entry)
+            added = True
+        kept_file = os.path.join(entry, 'file')
+        extracted = os.path.join(entry, 'extracted')
+        if (extract and not os.path.isdir(extracted) and
+                zipfile.is_zipfile(kept_file)):
+            tmp = tempfile.mkdtemp(prefix='.tmp', dir=entry)
+            with zipfile.ZipFile(kept_file, 'r') as zip_file:
+                zip_file.extractall(tmp)
+            self._publish(tmp, extracted)
+            added = True
+        os.utime(entry)
+        if added:
+            self.evict(keep=entry)
+        return entry
+
+    def _publish(self, tmp, path):
+        """Rename the directory `tmp` to `path`, unless another process did
+        the same first."""
+        for root, dirs, names in os.walk(tmp):
+            for name in names:
+                name = os.path.join(root, name)
+                mode = stat.S_IMODE(os.lstat(name).st_mode)
+                os.chmod(name, mode & ~(stat.S_IWUSR | stat.S_IWGRP |
+                                        stat.S_IWOTH))
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+
+    def _remove(self, path):
+        tmp = tempfile.mkdtemp(prefix='.tmp', dir=self.path)
+        os.rename(path, os.path.join(tmp, 'entry'))
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self, keep=None):
+        """Remove the least recently used files until those kept take at
+        most `max_size` bytes, leaving the directory `keep` in place."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                size = _tree_size(path)
+                entries.append((os.stat(path).st_mtime, path, size))
+            except OSError:
+                continue
+            total += size
+        for mtime, path, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                self._remove(path)
+            except OSError:
+                continue
+            total -= size
+        for name in os.listdir(self.index):
+            link = os.path.join(self.index, name)
+            try:
+                if not os.path.exists(os.path.join(self.path,
+                                                   os.readlink(link))):
+                    os.remove(link)
+            except OSError:
+                continue
+
+    def link(self, src, dst):
+        """Put the kept file `src` at `dst`, as a hard link if those are
+        used and otherwise as a writable clone or copy."""
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if self.hardlinks:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        if self.can_clone:
+            try:
+                _clone(src, dst)
+            except OSError as e:
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY,
+                                   errno.EXDEV, errno.EINVAL):
+                    raise
+                self.can_clone = False
+        if not self.can_clone:
+            shutil.copyfile(src, dst)
+        mode = stat.S_IMODE(os.stat(src).st_mode)
+        os.chmod(dst, mode | stat.S_IWUSR)
+
+    def copy_to(self, file_path, extract, directory):
+        """Put `file_path`, and the files extracted from it if `extract` is
+        set, in `directory`. Returns the names of the files put there as
+        `copy_files` does."""
+        entry = self.get(file_path, extract)
+        file_name = os.path.basename(file_path)
+        self.link(os.path.join(entry, 'file'),
+                  os.path.join(directory, file_name))
+        files = [file_name]
+        extracted = os.path.join(entry, 'extracted')
+        if extract and os.path.isdir(extracted):
+            for root, dirs, names in os.walk(extracted):
+                path = os.path.relpath(root, extracted)
+                for name in dirs:
+                    name = os.path.normpath(os.path.join(path, name))
+                    os.makedirs(os.path.join(directory, name), exist_ok=True)
+                    files.append(name)
+                for name in names:
+                    name = os.path.normpath(os.path.join(path, name))
+                    self.link(os.path.join(extracted, name),
+                              os.path.join(directory, name))
+                    files.append(name)
+        return files
+
+
+_cache = None
+
+
+def get_file_cache():
+    """Return the file cache of this process, or None if it is turned off,
+    as it is unless SERVER_FILE_CACHE_SIZE is set, or cannot be used here.
+    """
+    global _cache
+    if not SERVER_FILE_CACHE_SIZE:
+        return None
+    if _cache is None:
+        path = SERVER_FILE_CACHE_DIR or os.path.join(
+            tempfile.gettempdir(), 'yaksh_file_cache'
+        )
+        try:
+            _cache = FileCache(path, SERVER_FILE_CACHE_SIZE * 1024 * 1024,
+                               SERVER_FILE_CACHE_HARDLINKS)
+        except OSError:
+            return None
+    return _cache
+
+
+def get_file_digest(file_path):
+    """Return the SHA-256 digest of the content of `file_path`, looked up
+    in the file cache when it is used."""
+    cache = get_file_cache()
+    if cache is not None:
+        try:
+            return cache.get_digest(file_path)
+        except OSError:
+            pass
+    return _hash_file(file_path)
+
 
 def copy_files(file_paths):
     """ Copy Files to current directory, takes
     tuple with file paths and extract status"""
 
+    cache = get_file_cache()
     files = []
     for src in file_paths:
         file_path, extract = src
+        if cache is not None:
+            try:
+                files.extend(cache.copy_to(file_path, extract, os.getcwd()))
+                continue
+            except OSError:
+                pass
         file_name = os.path.basename(file_path)
         files.append(file_name)
         shutil.copy(file_path, os.getcwd())
@@ -3,19 +3,43 @@ from __future__ import unicode_literals
 import sys
 import os
 import contextlib
+from functools import partial
+import importlib
+import json
+import math
 from os.path import dirname, abspath
+try:
+    import resource
+except ImportError:
+    pass
+import select
+import shutil
 import signal
+import tempfile
+import time
 import traceback
 
 
 # Local imports
-from .settings import SERVER_TIMEOUT
+from .settings import (
+    SERVER_TIMEOUT, SERVER_HUNG_GRACE, FORK_PYTHON_EVALUATION,
+    GRADER_MAX_PARALLEL, TEST_CASE_TIMEOUT, TEST_CASE_CPU_LIMIT,
+    SERVER_SCRATCH_DIR
+)
 from .language_registry import create_evaluator_instance
 from .error_messages import prettify_exceptions
 
 MY_DIR = abspath(dirname(__file__))
 registry = None
 
+# Modules imported by a code server process before it checks any code, so
+# that the processes forked to evaluate Python code start with them loaded.
+PRELOAD_MODULES = (
+    'nose.tools', 'collections', 'copy', 'datetime', 'decimal', 'fractions',
+    'functools', 'heapq', 'io', 'itertools', 'json', 'math', 'random', 're',
+    'string', 'traceback',
+)
+
 
 # Raised when the code times-out.
 # c.f. http://pguides.net/python/timeout-a-function
@@ -23,6 +47,16 @@ class TimeoutException(Exception):
     pass
 
 
+# Raised when a test case uses more CPU time than it may.
+class CPULimitExceeded(TimeoutException):
+    pass
+
+
+# Raised when the code writes more output than it may.
+class OutputLimitExceeded(Exception):
+    pass
+
+
 class CompilationError(Exception):
     pass
 
@@ -31,6 +65,38 @@ class TestCaseError(Exception):
     pass
 
 
+class CompileCache(object):
+    """Outputs of the commands compiling a submission, shared by the
+    evaluators of all its test cases so that the code is compiled once.
+    `time_saved` is the compile time, in seconds, saved by doing so.
+
+    The number of compiled test cases found in and missing from the cache of
+    the code server process are counted in `harness_hits` and
+    `harness_misses`.
+    """
+    def __init__(self):
+        self.outputs = {}
+        self.time_saved = 0.0
+        self.harness_hits = 0
+        self.harness_misses = 0
+
+    def get_stats(self):
+        return dict(harness_hits=self.harness_hits,
+                    harness_misses=self.harness_misses)
+
+
+class ResourceUsage(object):
+    """Peak resident set size, in kilobytes, of the processes started to
+    evaluate a submission, shared by the evaluators of all its test cases.
+    """
+    def __init__(self):
+        self.max_rss = 0
+
+    def add(self, rusage):
+        """Add the resource usage of a process which has been waited for."""
+        self.max_rss = max(self.max_rss, rusage.ru_maxrss)
+
+
 @contextlib.contextmanager
 def change_dir(path):
     cur_dir = abspath(dirname(MY_DIR))
@@ -46,10 +112,19 @@ def timeout_handler(signum, frame):
     raise TimeoutException('Code took too long to run.')
 
 
-def create_signal_handler():
-    """Add a new signal handler for the execution of this code."""
+def cpu_limit_handler(signum, frame):
+    """A handler for the XCPU signal."""
+    raise CPULimitExceeded('Code used too much CPU time.')
+
+
+def create_signal_handler(timeout=None):
+    """Add a new signal handler for the execution of this code. The alarm
+    goes off after `timeout` seconds, which may be fractional, or after
+    SERVER_TIMEOUT seconds if it is not given.
+    """
     prev_handler = signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(SERVER_TIMEOUT)
+    signal.setitimer(signal.ITIMER_REAL,
+                     SERVER_TIMEOUT if timeout is None else timeout)
     return prev_handler
 
 
@@ -63,10 +138,38 @@ def set_original_signal_handler(old_handler=None):
 
 
 def delete_signal_handler():
-    signal.alarm(0)
+    signal.setitimer(signal.ITIMER_REAL, 0)
     return
 
 
+def get_cpu_time():
+    """Return the CPU time used by this process and its waited for
+    children, in seconds.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime +
+            children.ru_utime + children.ru_stime)
+
+
+def get_exit_code(status):
+    """Return the exit code for a status given by `os.wait`, negative for
+    a process killed by a signal as with `Popen.returncode`.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def preload_modules(modules=PRELOAD_MODULES):
+    """Import the given modules, skipping those which are not installed."""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
 class Grader(object):
     """Tests the code obtained from Code Server"""
     def __init__(self, in_dir=None):
@@ -74,6 +177,8 @@ class Grader(object):
               'have an infinite loop in your code.' % SERVER_TIMEOUT
         self.timeout_msg = msg
         self.in_dir = in_dir if in_dir else MY_DIR
+        # Set in the child processes forked to evaluate test cases.
+        self.in_child = False
 
     def evaluate(self, kwargs):
         """Evaluates given code with the test cases based on
@@ -87,22 +192,33 @@ class Grader(object):
         If not, we assume they are relative paths w.r.t. the location of this
         code_server script.
 
-        If the optional `in_dir` keyword argument is supplied it changes the
-        directory to that directory (it does not change it back to the original
-        when done).
+        The code is evaluated in a scratch directory of its own, made in
+        SERVER_SCRATCH_DIR or, if that is not set, in `in_dir`. It is removed
+        with all the files written to it once the code has been evaluated.
 
         Returns
         -------
 
-        A tuple: (success, error, weight).
+        A dict with the success, error and weight of the submission, along
+        with the resources used to evaluate it.
         """
+        start = time.time()
+        cpu_start = get_cpu_time()
         self.setup()
-        test_case_instances = self.get_evaluator_objects(kwargs)
-        with change_dir(self.in_dir):
-            success, error, weight = self.safe_evaluate(test_case_instances)
-        self.teardown()
+        try:
+            test_case_instances = self.get_evaluator_objects(kwargs)
+            with change_dir(self.work_dir):
+                success, error, weight = self.safe_evaluate(
+                    test_case_instances
+                )
+        finally:
+            self.teardown()
 
-        result = {'success': success, 'error': error, 'weight': weight}
+        result = {'success': success, 'error': error, 'weight': weight,
+                  'compile_time_saved': round(self.compile_cache.time_saved,
+                                              3),
+                  'skipped': self.skipped, 'timings': self.timings,
+                  'resources': self._get_resources(start, cpu_start)}
         return result
 
     # Private Protocol ##########
@@ -110,14 +226,34 @@ class Grader(object):
         if self.in_dir:
             if not os.path.exists(self.in_dir):
                 os.makedirs(self.in_dir)
+        scratch_dir = SERVER_SCRATCH_DIR or self.in_dir
+        os.makedirs(scratch_dir, exist_ok=True)
+        self.work_dir = tempfile.mkdtemp(prefix='job_', dir=scratch_dir)
 
     def get_evaluator_objects(self, kwargs):
         metadata = kwargs.get('metadata')
         test_case_data = kwargs.get('test_case_data')
         test_case_instances = []
+        self.compile_cache = CompileCache()
+        self.resource_usage = ResourceUsage()
+        self.parallel = metadata.get('parallel_test_cases', False)
+        # Without partial grading a single failing test case means no marks,
+        # so the rest need not be run.
+        self.fail_fast = (metadata.get('fail_fast', False) and
+                          not metadata.get('partial_grading', False))
+        self.skipped = 0
+        # Limits for each test case, 0 for none.
+        self.time_limit = metadata.get('time_limit') or TEST_CASE_TIMEOUT
+        self.cpu_limit = metadata.get('cpu_limit') or TEST_CASE_CPU_LIMIT
+        # Wall clock and CPU time taken by each test case, None for those
+        # not run.
+        self.timings = [None] * len(test_case_data)
 
         for test_case in test_case_data:
             test_case_instance = create_evaluator_instance(metadata, test_case)
+            test_case_instance.compile_cache = self.compile_cache
+            test_case_instance.resource_usage = self.resource_usage
+            test_case_instance.cpu_limit = self.cpu_limit
             test_case_instances.append(test_case_instance)
         return test_case_instances
 
@@ -125,9 +261,339 @@ class Grader(object):
         """
         Handles code evaluation along with compilation, signal handling
         and Exception handling
+
+        Test cases whose evaluator runs the code in this process are
+        evaluated in a forked child process and the results collected from it.
+        If the question asks for it, the test cases are instead evaluated
+        concurrently, each in a child process of its own, unless the answer
+        is compiled, which is then done once for all the test cases.
+        """
+        can_fork = hasattr(os, 'fork')
+        compiles_answer = any(test_case_instance.compiles_answer
+                              for test_case_instance in test_case_instances)
+        if (self.parallel and can_fork and not compiles_answer and
+                len(test_case_instances) > 1):
+            return self._evaluate_in_parallel(test_case_instances)
+        run_in_fork = any(test_case_instance.run_in_fork
+                          for test_case_instance in test_case_instances)
+        if run_in_fork and FORK_PYTHON_EVALUATION and can_fork:
+            return self._evaluate_in_fork(test_case_instances)
+        return self._evaluate(test_case_instances)
+
+    def _evaluate_in_fork(self, test_case_instances):
+        outcome, = self._run_forked([
+            partial(self._evaluate, test_case_instances)
+        ])
+        error = self._get_fork_error(outcome)
+        if error is not None:
+            return False, [error], 0.0
+        self._add_child_stats(outcome['data'])
+        success, error, weight = outcome['data']['result']
+        return success, error, weight
+
+    def _evaluate_in_parallel(self, test_case_instances):
+        """Evaluate each test case in a child process of its own, running up
+        to GRADER_MAX_PARALLEL of them at a time. The results are merged in
+        the order of the test cases just as `_evaluate` does.
+
+        When failing fast, test cases after one which fails are not started
+        or are stopped.
+        """
+        def failed(data):
+            return self.fail_fast and not data['result'][0]
+
+        deadline = time.time() + SERVER_TIMEOUT
+        outcomes = self._run_forked(
+            [partial(self._evaluate_test_case, idx, test_case_instance,
+                     deadline)
+             for idx, test_case_instance in enumerate(test_case_instances)],
+            max_running=GRADER_MAX_PARALLEL, stop_after=failed
+        )
+        success = False
+        test_case_success_status = [False] * len(test_case_instances)
+        error = []
+        weight = 0.0
+        for outcome in outcomes:
+            if outcome is not None and outcome['data'] is not None:
+                self._add_child_stats(outcome['data'])
+
+        for idx, outcome in enumerate(outcomes):
+            fork_error = self._get_fork_error(outcome)
+            if fork_error is not None:
+                error.append(fork_error)
+                break
+            test_case_success, err, mark_fraction, aborted = \
+                outcome['data']['result']
+            if aborted:
+                error.append(err)
+                break
+            if test_case_success:
+                weight += mark_fraction * test_case_instances[idx].weight
+            else:
+                error.append(err)
+            test_case_success_status[idx] = test_case_success
+            if failed(outcome['data']):
+                self.skipped = len(test_case_instances) - idx - 1
+                break
+        else:
+            success = all(test_case_success_status)
+
+        return success, error, weight
+
+    def _get_work_dir(self, idx):
+        return os.path.join(os.getcwd(), 'test_case_%d' % idx)
+
+    def _evaluate_test_case(self, idx, test_case_instance, deadline):
+        """Evaluate a single test case, in a directory of its own so that it
+        can run alongside the others. The evaluation of the submission must
+        end by `deadline`.
+
+        Returns a tuple: (success, error, mark_fraction, aborted), `aborted`
+        being True if the test case raised an error which ends the evaluation
+        of the submission.
+        """
+        work_dir = self._get_work_dir(idx)
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        os.chdir(work_dir)
+        prev_handler = create_signal_handler()
+        try:
+            start = self._start_test_case(deadline)
+            try:
+                test_case_instance.compile_code()
+                eval_result = test_case_instance.check_code()
+            except TimeoutException as e:
+                limit_error = self._get_limit_error(idx, e, start)
+                if limit_error is None:
+                    raise
+                eval_result = False, limit_error, 0.0
+            finally:
+                self._end_test_case(idx, start)
+            test_case_success, err, mark_fraction = eval_result
+            if not isinstance(err, dict):
+                err = prettify_exceptions('Error', err)
+            err['hidden'] = test_case_instance.hidden
+            test_case_instance.teardown()
+            return test_case_success, err, mark_fraction, False
+        except TimeoutException:
+            err = prettify_exceptions("TimeoutException", self.timeout_msg)
+            return False, err, 0.0, True
+        except OutputLimitExceeded as e:
+            err = prettify_exceptions("OutputLimitExceeded", str(e))
+            return False, err, 0.0, True
+        except Exception as e:
+            return False, self._format_exception(e), 0.0, True
+        finally:
+            delete_signal_handler()
+            set_original_signal_handler(prev_handler)
+
+    def _fork(self, func):
+        """Call `func` in a forked child process. Returns the pid of the
+        child and the read end of a pipe to which the child writes what
+        `func` returns, along with its compile statistics, the number of
+        test cases it skipped and their timings, encoded as JSON.
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 1
+            self.in_child = True
+            try:
+                result = func()
+                cache = self.compile_cache
+                data = json.dumps(dict(
+                    result=result, time_saved=cache.time_saved,
+                    stats=cache.get_stats(), skipped=self.skipped,
+                    timings=self.timings
+                ))
+                with os.fdopen(write_fd, 'wb') as f:
+                    f.write(data.encode('utf-8'))
+                status = 0
+            except SystemExit as e:
+                # The code called sys.exit, end with the status it gave.
+                status = e.code if isinstance(e.code, int) else int(
+                    e.code is not None
+                )
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        os.close(write_fd)
+        return pid, read_fd
+
+    def _run_forked(self, funcs, max_running=1, stop_after=None):
+        """Call each of `funcs` in a forked child process, running at most
+        `max_running` children at a time. A child still running
+        SERVER_HUNG_GRACE seconds after SERVER_TIMEOUT is killed.
+
+        If `stop_after` is given it is called with the data sent by each
+        child. When it returns True, the functions after that child's are
+        not called, or their children are killed, and their outcome is None.
+
+        Returns a list with, for each function, a dict with the decoded
+        `data` sent by the child, or None if it sent nothing, its
+        `exit_code` and whether it `timed_out`.
+        """
+        outcomes = [None] * len(funcs)
+        pending = list(enumerate(funcs))
+        running = {}
+
+        def stop(after):
+            pending[:] = [job for job in pending if job[0] <= after]
+            for read_fd, child in list(running.items()):
+                if child[0] > after:
+                    finish(read_fd, killed=True)
+                    outcomes[child[0]] = None
+
+        def finish(read_fd, timed_out=False, killed=False):
+            idx, pid, deadline, chunks = running.pop(read_fd)
+            if timed_out or killed:
+                os.kill(pid, signal.SIGKILL)
+            os.close(read_fd)
+            _, exit_status, rusage = os.wait4(pid, 0)
+            exit_code = get_exit_code(exit_status)
+            # This includes the processes the child started.
+            self.resource_usage.add(rusage)
+            data = None
+            if chunks and not (timed_out or killed):
+                data = json.loads(b''.join(chunks).decode('utf-8'))
+            outcomes[idx] = dict(data=data, exit_code=exit_code,
+                                 timed_out=timed_out)
+            if data is not None and stop_after and stop_after(data):
+                stop(idx)
+
+        try:
+            while pending or running:
+                while pending and len(running) < max_running:
+                    idx, func = pending.pop(0)
+                    pid, read_fd = self._fork(func)
+                    deadline = time.time() + SERVER_TIMEOUT + \
+                        SERVER_HUNG_GRACE
+                    running[read_fd] = (idx, pid, deadline, [])
+                now = time.time()
+                for read_fd, child in list(running.items()):
+                    if child[2] <= now:
+                        finish(read_fd, timed_out=True)
+                if not running:
+                    continue
+                wait = min(child[2] for child in running.values()) - now
+                ready, _, _ = select.select(list(running), [], [],
+                                            max(wait, 0))
+                for read_fd in ready:
+                    if read_fd not in running:
+                        # Killed when another child asked to stop.
+                        continue
+                    chunk = os.read(read_fd, 65536)
+                    if chunk:
+                        running[read_fd][3].append(chunk)
+                    else:
+                        finish(read_fd)
+        finally:
+            for read_fd in list(running):
+                finish(read_fd, timed_out=True)
+        return outcomes
+
+    def _get_fork_error(self, outcome):
+        """Return the error for a child process which sent no result, or None
+        if it did.
+        """
+        if outcome['timed_out']:
+            return prettify_exceptions("TimeoutException", self.timeout_msg)
+        if outcome['data'] is None:
+            return 'Process ended with exit code %s.' % outcome['exit_code']
+        return None
+
+    def _add_child_stats(self, data):
+        self.skipped += data['skipped']
+        for idx, timing in enumerate(data['timings']):
+            if timing is not None:
+                self.timings[idx] = timing
+        self.compile_cache.time_saved += data['time_saved']
+        self.compile_cache.harness_hits += data['stats']['harness_hits']
+        self.compile_cache.harness_misses += data['stats']['harness_misses']
+
+    def _start_test_case(self, deadline):
+        """Set the alarm for a test case about to be run, for its time
+        limit or for what is left before `deadline` if that is sooner, and
+        limit its CPU time when in a child process. Returns what
+        `_end_test_case` needs to time the test case, and whether the alarm
+        is for its own time limit as `limited`.
+        """
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutException('Code took too long to run.')
+        limited = bool(self.time_limit) and self.time_limit < remaining
+        signal.setitimer(signal.ITIMER_REAL,
+                         self.time_limit if limited else remaining)
+        if self.cpu_limit and self.in_child:
+            # The limit is on the CPU time the process has used so far, in
+            # whole seconds.
+            signal.signal(signal.SIGXCPU, cpu_limit_handler)
+            soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            limit = int(math.ceil(get_cpu_time() + self.cpu_limit))
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+        return dict(limited=limited, wall_time=time.time(),
+                    cpu_time=get_cpu_time())
+
+    def _end_test_case(self, idx, start):
+        self.timings[idx] = dict(
+            wall_time=round(time.time() - start['wall_time'], 3),
+            cpu_time=round(get_cpu_time() - start['cpu_time'], 3)
+        )
+
+    def _get_resources(self, start, cpu_start):
+        """Return the wall clock and CPU time, in seconds, taken to evaluate
+        the submission since `start` and `cpu_start`, and the peak RSS, in
+        kilobytes, of the processes started for it. If it started none, the
+        peak RSS of this process is given.
         """
+        max_rss = self.resource_usage.max_rss
+        if not max_rss:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return dict(wall_time=round(time.time() - start, 3),
+                    cpu_time=round(get_cpu_time() - cpu_start, 3),
+                    max_rss=max_rss)
+
+    def _get_limit_error(self, idx, e, start):
+        """Return the error for test case `idx` going over its own limits,
+        or None if `e` is for the whole submission taking too long.
+        """
+        if not (start['limited'] or isinstance(e, CPULimitExceeded)):
+            return None
+        if isinstance(e, CPULimitExceeded):
+            msg = 'Test case {0} used more than {1:g} seconds of CPU time.'\
+                .format(idx + 1, self.cpu_limit)
+        else:
+            msg = ('Test case {0} took more than {1:g} seconds to run. You '
+                   'probably have an infinite loop in your code.').format(
+                       idx + 1, self.time_limit)
+        return prettify_exceptions('TimeoutException', msg)
+
+    def _format_exception(self, e):
+        """Return the error for the exception `e` being handled."""
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        tb_list = traceback.format_exception(exc_type, exc_value, exc_tb)
+        try:
+            line_no = e.lineno
+        except AttributeError:
+            line_no = traceback.extract_tb(exc_tb)[-1][1]
+        if len(tb_list) > 2:
+            del tb_list[1:3]
+        try:
+            exc_value = str(exc_value)
+        except UnicodeEncodeError:
+            exc_value = unicode(exc_value)
+        return prettify_exceptions(
+            exc_type.__name__, exc_value, "".join(tb_list), line_no=line_no
+        )
+
+    def _evaluate(self, test_case_instances):
         # Add a new signal handler for the execution of this code.
         prev_handler = create_signal_handler()
+        deadline = time.time() + SERVER_TIMEOUT
         success = False
         test_case_success_status = [False]
         if len(test_case_instances) != 0:
@@ -140,8 +606,19 @@ class Grader(object):
             # Run evaluator selection registry here
             for idx, test_case_instance in enumerate(test_case_instances):
                 test_case_success = False
-                test_case_instance.compile_code()
-                eval_result = test_case_instance.check_code()
+                start = self._start_test_case(deadline)
+                try:
+                    test_case_instance.compile_code()
+                    eval_result = test_case_instance.check_code()
+                except TimeoutException as e:
+                    # Only the test case fails if it went over its own
+                    # limits, the others still get their turn.
+                    limit_error = self._get_limit_error(idx, e, start)
+                    if limit_error is None:
+                        raise
+                    eval_result = False, limit_error, 0.0
+                finally:
+                    self._end_test_case(idx, start)
                 test_case_success, err, mark_fraction = eval_result
                 if not isinstance(err, dict):
                     err = prettify_exceptions('Error', err)
@@ -151,35 +628,24 @@ class Grader(object):
                 else:
                     error.append(err)
                 test_case_success_status[idx] = test_case_success
+                if not test_case_success and self.fail_fast:
+                    self.skipped = len(test_case_instances) - idx - 1
+                    break
 
             success = all(test_case_success_status)
 
-            for test_case_instance in test_case_instances:
+            n_run = len(test_case_instances) - self.skipped
+            for test_case_instance in test_case_instances[:n_run]:
                 test_case_instance.teardown()
 
         except TimeoutException:
             error.append(
                 prettify_exceptions("TimeoutException", self.timeout_msg)
                 )
+        except OutputLimitExceeded as e:
+            error.append(prettify_exceptions("OutputLimitExceeded", str(e)))
         except Exception as e:
-            exc_type, exc_value, exc_tb = sys.exc_info()
-            tb_list = traceback.format_exception(exc_type, exc_value, exc_tb)
-            try:
-                line_no = e.lineno
-            except AttributeError:
-                line_no = traceback.extract_tb(exc_tb)[-1][1]
-            if len(tb_list) > 2:
-                del tb_list[1:3]
-            try:
-                exc_value = str(exc_value)
-            except UnicodeEncodeError:
-                exc_value = unicode(exc_value)
-            error.append(
-                prettify_exceptions(
-                    exc_type.__name__, exc_value,
-                    "".join(tb_list), line_no=line_no
-                    )
-                )
+            error.append(self._format_exception(e))
         finally:
             # Set back any original signal handler.
             set_original_signal_handler(prev_handler)
@@ -189,3 +655,5 @@ class Grader(object):
     def teardown(self):
         # Cancel the signal
         delete_signal_handler()
+        # Remove every file written while evaluating the code.
+        shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -5,13 +5,16 @@ import os
 import psutil
 
 # Local imports
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .base_evaluator import BaseEvaluator
 from .grader import TimeoutException
 from .error_messages import prettify_exceptions
 
 
 class HookEvaluator(BaseEvaluator):
+    # The hook code, and any code of the user it runs, is run with exec.
+    run_in_fork = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.assign_files = []
@@ -27,13 +30,6 @@ class HookEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if self.files:
-            delete_files(self.files)
-        if self.assign_files:
-            delete_files(self.assign_files)
-
     def check_code(self):
         """ Function evaluates user answer by running a python based hook code
         against it.
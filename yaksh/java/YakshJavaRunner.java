@@ -0,0 +1,425 @@
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.EOFException;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URI;
+import java.nio.charset.Charset;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import java.util.concurrent.atomic.AtomicLong;
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileManager;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Compiles and runs Java code for a yaksh code server process in a JVM which
+ * is kept running. See yaksh/java_runner.py for the protocol.
+ *
+ * Code is compiled in memory and each run loads it with a new class loader,
+ * so no state is left from earlier runs. If the code calls System.exit the
+ * output of the run is sent from a shutdown hook and the JVM ends, the
+ * exit status being that of the process. If threads the code started are
+ * still running when its main method returns, the JVM ends once the reply
+ * is sent so that they cannot reach later runs.
+ *
+ * Replies are written to the standard output the JVM started with, which
+ * System.out never points to once the runner has started: code which is
+ * run writes to a buffer of its run or to nowhere.
+ */
+public class YakshJavaRunner {
+    private static final Charset UTF_8 = StandardCharsets.UTF_8;
+
+    private static final Map<String, String> sources =
+        new LinkedHashMap<String, String>();
+    private static final Map<String, byte[]> classes =
+        new HashMap<String, byte[]>();
+
+    private static final PrintStream discard =
+        new PrintStream(new OutputStream() {
+            @Override
+            public void write(int b) {
+            }
+        });
+
+    private static InputStream in;
+    private static OutputStream out;
+    private static volatile boolean running = false;
+    private static ByteArrayOutputStream runOut;
+    private static ByteArrayOutputStream runErr;
+
+    // Bytes written by the code being run so far, and the most it may
+    // write, 0 for no limit.
+    private static final AtomicLong outputSize = new AtomicLong();
+    private static volatile long maxOutput = 0;
+    private static volatile boolean overflowed = false;
+
+    public static void main(String[] args) throws Exception {
+        in = System.in;
+        out = System.out;
+        System.setIn(new ByteArrayInputStream(new byte[0]));
+        System.setOut(discard);
+        System.setErr(discard);
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            writeLine("unsupported");
+            return;
+        }
+        DiagnosticCollector<JavaFileObject> diagnostics =
+            new DiagnosticCollector<JavaFileObject>();
+        StandardJavaFileManager fileManager =
+            compiler.getStandardFileManager(diagnostics, Locale.ROOT, UTF_8);
+
+        Runtime.getRuntime().addShutdownHook(new Thread() {
+            @Override
+            public void run() {
+                if (!running) {
+                    return;
+                }
+                running = false;
+                System.out.flush();
+                System.err.flush();
+                try {
+                    writeLine("exit");
+                    writeField(runOut.toByteArray());
+                    writeField(runErr.toByteArray());
+                } catch (IOException e) {
+                    // The server process is gone, nobody to tell.
+                }
+            }
+        });
+
+        writeLine("ready");
+        String command;
+        while ((command = readLine()) != null) {
+            if (command.equals("reset")) {
+                sources.clear();
+                classes.clear();
+                writeLine("ok");
+            } else if (command.equals("compile")) {
+                String name = readString();
+                String source = readString();
+                compile(compiler, fileManager, name, source);
+            } else if (command.equals("run")) {
+                String mainClass = readString();
+                byte[] input = readField();
+                long timeout = Long.parseLong(readString());
+                long limit = Long.parseLong(readString());
+                run(mainClass, input, timeout, limit);
+            } else {
+                writeLine("error");
+                writeField(("Unknown command " + command).getBytes(UTF_8));
+            }
+        }
+    }
+
+    /**
+     * Compile the given source together with those compiled before it since
+     * the last reset, so that it can use their classes.
+     */
+    private static void compile(JavaCompiler compiler,
+                                StandardJavaFileManager fileManager,
+                                String name, String source)
+            throws IOException {
+        sources.put(name, source);
+        List<JavaFileObject> units = new ArrayList<JavaFileObject>();
+        for (Map.Entry<String, String> entry : sources.entrySet()) {
+            units.add(new SourceFile(entry.getKey(), entry.getValue()));
+        }
+        DiagnosticCollector<JavaFileObject> diagnostics =
+            new DiagnosticCollector<JavaFileObject>();
+        Map<String, byte[]> compiled = new HashMap<String, byte[]>();
+        JavaFileManager manager = new ClassFileManager(fileManager, compiled);
+        boolean success = compiler.getTask(
+            null, manager, diagnostics, null, null, units
+        ).call();
+
+        StringBuilder messages = new StringBuilder();
+        for (Diagnostic<? extends JavaFileObject> d :
+                 diagnostics.getDiagnostics()) {
+            if (d.getSource() != null) {
+                messages.append(d.getSource().getName()).append(':')
+                    .append(d.getLineNumber()).append(": ");
+            }
+            if (d.getKind() == Diagnostic.Kind.ERROR) {
+                messages.append("error: ");
+            } else if (d.getKind() == Diagnostic.Kind.NOTE) {
+                messages.append("Note: ");
+            } else {
+                messages.append("warning: ");
+            }
+            messages.append(d.getMessage(Locale.ROOT)).append('\n');
+        }
+        if (success) {
+            classes.clear();
+            classes.putAll(compiled);
+        } else {
+            sources.remove(name);
+        }
+        writeLine(success ? "ok" : "error");
+        writeField(messages.toString().getBytes(UTF_8));
+    }
+
+    /**
+     * Run the main method of the given class with the given standard input.
+     * If it does not finish in `timeout` milliseconds, or writes more than
+     * `limit` bytes of output, the JVM is halted.
+     */
+    private static void run(String mainClass, byte[] input, long timeout,
+                            long limit)
+            throws Exception {
+        final ClassLoader loader =
+            new MemoryClassLoader(new HashMap<String, byte[]>(classes));
+        final String name = mainClass;
+        final int[] status = {0};
+        outputSize.set(0);
+        maxOutput = limit;
+        overflowed = false;
+        runOut = new RunOutput();
+        runErr = new RunOutput();
+        final PrintStream stdout = new PrintStream(runOut, true, "UTF-8");
+        final PrintStream stderr = new PrintStream(runErr, true, "UTF-8");
+
+        // Threads the code starts belong to this group, so that those still
+        // running once it returns can be found.
+        ThreadGroup group = new ThreadGroup("run");
+        Thread thread = new Thread(group, new Runnable() {
+            public void run() {
+                try {
+                    Class<?> cls = Class.forName(name, true, loader);
+                    Method method = cls.getMethod("main", String[].class);
+                    method.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                    status[0] = 1;
+                    stderr.print("Exception in thread \"main\" ");
+                    e.getCause().printStackTrace(stderr);
+                } catch (Throwable e) {
+                    status[0] = 1;
+                    e.printStackTrace(stderr);
+                }
+            }
+        }, "main");
+        thread.setDaemon(true);
+        thread.setContextClassLoader(loader);
+
+        System.setOut(stdout);
+        System.setErr(stderr);
+        System.setIn(new ByteArrayInputStream(input));
+        running = true;
+        thread.start();
+        long deadline = System.currentTimeMillis() + timeout;
+        long remaining = timeout;
+        while (thread.isAlive() && !overflowed && remaining > 0) {
+            thread.join(Math.min(remaining, 10));
+            remaining = deadline - System.currentTimeMillis();
+        }
+        running = false;
+
+        if (overflowed) {
+            writeLine("toolong");
+            Runtime.getRuntime().halt(1);
+        }
+        if (thread.isAlive()) {
+            writeLine("timeout");
+            Runtime.getRuntime().halt(1);
+        }
+        boolean leftOver = group.activeCount() > 0;
+        if (!leftOver) {
+            System.setOut(discard);
+            System.setErr(discard);
+            System.setIn(new ByteArrayInputStream(new byte[0]));
+        }
+        writeLine(leftOver ? "stopped" : "ok");
+        writeField(Integer.toString(status[0]).getBytes(UTF_8));
+        writeField(runOut.toByteArray());
+        writeField(runErr.toByteArray());
+        if (leftOver) {
+            Runtime.getRuntime().halt(1);
+        }
+    }
+
+    private static String readLine() throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != '\n') {
+            if (c == -1) {
+                if (line.size() == 0) {
+                    return null;
+                }
+                break;
+            }
+            line.write(c);
+        }
+        return new String(line.toByteArray(), UTF_8);
+    }
+
+    private static byte[] readField() throws IOException {
+        String header = readLine();
+        if (header == null) {
+            throw new EOFException();
+        }
+        int length = Integer.parseInt(header.trim());
+        byte[] data = new byte[length];
+        int read = 0;
+        while (read < length) {
+            int n = in.read(data, read, length - read);
+            if (n == -1) {
+                throw new EOFException();
+            }
+            read += n;
+        }
+        return data;
+    }
+
+    private static String readString() throws IOException {
+        return new String(readField(), UTF_8);
+    }
+
+    private static synchronized void writeLine(String line)
+            throws IOException {
+        out.write((line + "\n").getBytes(UTF_8));
+        out.flush();
+    }
+
+    private static synchronized void writeField(byte[] data)
+            throws IOException {
+        out.write((data.length + "\n").getBytes(UTF_8));
+        out.write(data);
+        out.flush();
+    }
+
+    /**
+     * Buffer of the output of a run. Output beyond the limit of the run, for
+     * its stdout and stderr together, is dropped and the run marked as
+     * having overflowed.
+     */
+    private static class RunOutput extends ByteArrayOutputStream {
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            long limit = maxOutput;
+            if (limit > 0 && outputSize.addAndGet(len) > limit) {
+                overflowed = true;
+                return;
+            }
+            super.write(b, off, len);
+        }
+    }
+
+    /** Java source held in memory. */
+    private static class SourceFile extends SimpleJavaFileObject {
+        private final String code;
+
+        SourceFile(String name, String code) {
+            super(URI.create("string:///" + name + Kind.SOURCE.extension),
+                  Kind.SOURCE);
+            this.code = code;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return code;
+        }
+    }
+
+    /** Compiled class written to memory. */
+    private static class ClassFile extends SimpleJavaFileObject {
+        private final String className;
+        private final Map<String, byte[]> store;
+
+        ClassFile(String className, Map<String, byte[]> store) {
+            super(URI.create("bytes:///" + className.replace('.', '/') +
+                             Kind.CLASS.extension), Kind.CLASS);
+            this.className = className;
+            this.store = store;
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return new ByteArrayOutputStream() {
+                @Override
+                public void close() throws IOException {
+                    super.close();
+                    store.put(className, toByteArray());
+                }
+            };
+        }
+    }
+
+    /** File manager writing compiled classes to memory. */
+    private static class ClassFileManager
+            extends ForwardingJavaFileManager<StandardJavaFileManager> {
+        private final Map<String, byte[]> store;
+
+        ClassFileManager(StandardJavaFileManager manager,
+                         Map<String, byte[]> store) {
+            super(manager);
+            this.store = store;
+        }
+
+        @Override
+        public JavaFileObject getJavaFileForOutput(
+                JavaFileManager.Location location, String className,
+                JavaFileObject.Kind kind, FileObject sibling) {
+            return new ClassFile(className, store);
+        }
+    }
+
+    /** Class loader for compiled classes, looked up before its parent. */
+    private static class MemoryClassLoader extends ClassLoader {
+        private final Map<String, byte[]> classes;
+
+        MemoryClassLoader(Map<String, byte[]> classes) {
+            super(YakshJavaRunner.class.getClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> loadClass(String name, boolean resolve)
+                throws ClassNotFoundException {
+            synchronized (getClassLoadingLock(name)) {
+                Class<?> cls = findLoadedClass(name);
+                if (cls == null && classes.containsKey(name)) {
+                    cls = findClass(name);
+                }
+                if (cls == null) {
+                    return super.loadClass(name, resolve);
+                }
+                if (resolve) {
+                    resolveClass(cls);
+                }
+                return cls;
+            }
+        }
+
+        @Override
+        protected Class<?> findClass(String name)
+                throws ClassNotFoundException {
+            byte[] bytes = classes.get(name);
+            if (bytes == null) {
+                throw new ClassNotFoundException(name);
+            }
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+}
@@ -6,17 +6,22 @@ import subprocess
 
 # Local imports
 from .base_evaluator import BaseEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .grader import CompilationError, TestCaseError
 from .error_messages import prettify_exceptions
+from .java_runner import get_java_runner, JavaRunnerError
 
 
 class JavaCodeEvaluator(BaseEvaluator):
     """Tests the Java code obtained from Code Server"""
+
+    compiles_answer = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.compiled_user_answer = None
         self.compiled_test_code = None
+        self.runner = None
         self.submit_code_path = ""
         self.user_output_path = ""
         self.ref_output_path = ""
@@ -30,19 +35,6 @@ class JavaCodeEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if os.path.exists(self.user_output_path):
-            os.remove(self.user_output_path)
-        if os.path.exists(self.ref_output_path):
-            os.remove(self.ref_output_path)
-        if os.path.exists(self.test_code_path):
-            os.remove(self.test_code_path)
-        if self.files:
-            delete_files(self.files)
-
     def get_commands(self, clean_ref_code_path, user_code_directory):
         compile_command = 'javac  {0}'.format(self.submit_code_path),
         compile_main = ('javac {0} -classpath '
@@ -88,26 +80,59 @@ class JavaCodeEvaluator(BaseEvaluator):
                 clean_ref_code_path,
                 user_code_directory
             )
+            self.compile_command = compile_command
+            self.ref_class_name = ref_file_name
             self.run_command_args = "java -cp {0} {1}".format(
                 user_code_directory,
                 ref_file_name
             )
 
-            self.compiled_user_answer = self._run_command(
-                compile_command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-
-            self.compiled_test_code = self._run_command(
-                self.compile_main,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-
-            return self.compiled_user_answer, self.compiled_test_code
+            # Files given with the question are read relative to the
+            # directory java is started in, which the runner cannot change.
+            self.runner = None if self.file_paths else get_java_runner()
+            if self.runner is not None:
+                try:
+                    self.runner.reset()
+                    self.compiled_user_answer = self.runner.compile(
+                        'Test', self.user_answer
+                    )
+                    self.compiled_test_code = self.runner.compile(
+                        ref_file_name, self.test_case
+                    )
+                    return self.compiled_user_answer, self.compiled_test_code
+                except JavaRunnerError:
+                    self.runner = None
+            return self._compile_with_javac()
+
+    def _compile_with_javac(self):
+        self.compiled_user_answer = self._compile_user_answer(
+            self.compile_command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+        self.compiled_test_code = self._run_command(
+            self.compile_main,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            limit_cpu=False
+        )
+
+        return self.compiled_user_answer, self.compiled_test_code
+
+    def _run_test_code(self):
+        if self.runner is not None:
+            try:
+                return self.runner.run(self.ref_class_name)
+            except JavaRunnerError:
+                self.runner = None
+                self._compile_with_javac()
+        return self._run_command(self.run_command_args, shell=True,
+                                 stdin=None,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
 
     def check_code(self):
         """ Function validates student code using instructor code as
@@ -142,10 +167,7 @@ class JavaCodeEvaluator(BaseEvaluator):
             main_err = self._remove_null_substitute_char(main_err)
 
             if main_err == '':
-                ret = self._run_command(self.run_command_args, shell=True,
-                                        stdin=None,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
+                ret = self._run_test_code()
                 proc, stdout, stderr = ret
                 if proc.returncode == 0:
                     success, err = True, None
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""A Java virtual machine kept running by a code server process to compile
+and run Java code, so that a new JVM is not started for every test case.
+
+The JVM runs `java/YakshJavaRunner.java` and is sent commands over its
+standard input. A command is a line with its name followed by its
+arguments, each sent as a line with its length in bytes and then the bytes
+themselves. Replies are sent back the same way: a status line followed by
+fields.
+
+    reset                          -> ok
+    compile <name> <source>        -> ok|error <messages>
+    run <class> <stdin> <timeout> <max output>
+                                   -> ok <exit status> <stdout> <stderr>
+                                   -> stopped <exit status> <stdout> <stderr>
+                                   -> exit <stdout> <stderr>
+                                   -> timeout
+                                   -> toolong
+
+`exit` is sent when the code calls System.exit, the JVM then ends and its
+exit status is that of the code. `stopped` is sent when threads the code
+started are still running once its main method returns, the JVM is then
+halted so that they cannot touch later jobs. `timeout` is sent when the code
+does not finish in time and `toolong` when it writes more than MAX_OUTPUT_SIZE
+bytes of output, the JVM is then halted. In all these cases the runner is
+started again for the next job.
+
+The runner is used when JAVA_RUNNER is set. If it cannot be used, for
+instance because there is no JDK, the evaluators fall back to running
+`javac` and `java`.
+"""
+from __future__ import unicode_literals
+from collections import namedtuple
+import os
+from os.path import abspath, dirname, join
+import shutil
+import subprocess
+import tempfile
+
+# Local imports
+from .grader import TimeoutException, OutputLimitExceeded
+from .settings import JAVA_RUNNER, SERVER_TIMEOUT, MAX_OUTPUT_SIZE
+
+
+RUNNER_SOURCE = join(abspath(dirname(__file__)), 'java',
+                     'YakshJavaRunner.java')
+
+# Stands in for the Popen object of a command run in the runner.
+RunResult = namedtuple('RunResult', ['returncode'])
+
+
+class JavaRunnerError(Exception):
+    pass
+
+
+class JavaRunner(object):
+    """Client of a JVM running YakshJavaRunner."""
+    def __init__(self):
+        self.proc = None
+        self.class_dir = None
+        self.failed = False
+
+    def _build(self):
+        self.class_dir = tempfile.mkdtemp(prefix='yaksh_java_runner_')
+        proc = None
+        try:
+            proc = subprocess.Popen(
+                ['javac', '-d', self.class_dir, RUNNER_SOURCE],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            stdout, stderr = proc.communicate()
+            if proc.returncode != 0:
+                raise JavaRunnerError(stderr.decode('utf-8', 'replace'))
+        except BaseException as e:
+            # Interrupted, for instance by a timeout, or failed, so do not
+            # keep a runner which may be half built.
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            shutil.rmtree(self.class_dir, ignore_errors=True)
+            self.class_dir = None
+            if isinstance(e, OSError):
+                raise JavaRunnerError(str(e))
+            raise
+
+    def start(self):
+        if self.class_dir is None:
+            self._build()
+        try:
+            self.proc = subprocess.Popen(
+                ['java', '-cp', self.class_dir, 'YakshJavaRunner'],
+                cwd=self.class_dir, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                preexec_fn=os.setpgrp
+            )
+            status = self._read_line()
+        except BaseException as e:
+            # The reply to the next command would otherwise be read as the
+            # runner being ready.
+            self.stop()
+            if isinstance(e, (OSError, ValueError)):
+                raise JavaRunnerError(str(e))
+            raise
+        if status != 'ready':
+            self.stop()
+            raise JavaRunnerError('Java runner did not start: %s' % status)
+
+    def stop(self):
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+            self.proc = None
+
+    def close(self):
+        self.stop()
+        if self.class_dir is not None:
+            shutil.rmtree(self.class_dir, ignore_errors=True)
+            self.class_dir = None
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def _read_line(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            return None
+        return line.decode('utf-8').rstrip('\n')
+
+    def _read_field(self):
+        try:
+            header = self._read_line()
+            if header is None:
+                raise JavaRunnerError('Java runner ended unexpectedly.')
+            return self.proc.stdout.read(int(header))
+        except (OSError, ValueError) as e:
+            # The reply is not the one expected, the runner is out of step.
+            self.stop()
+            raise JavaRunnerError('Bad reply from the Java runner: %s' % e)
+
+    def _read_text(self):
+        try:
+            return self._read_field().decode('utf-8')
+        except UnicodeDecodeError as e:
+            self.stop()
+            raise JavaRunnerError('Bad reply from the Java runner: %s' % e)
+
+    def _request(self, command, *fields):
+        """Send a command and return the status of the reply."""
+        if not self.is_running():
+            raise JavaRunnerError('Java runner is not running.')
+        try:
+            data = [command.encode('utf-8'), b'\n']
+            for field in fields:
+                if not isinstance(field, bytes):
+                    field = str(field).encode('utf-8')
+                data.extend([str(len(field)).encode('utf-8'), b'\n', field])
+            self.proc.stdin.write(b''.join(data))
+            self.proc.stdin.flush()
+            status = self._read_line()
+        except TimeoutException:
+            # Runaway code, so stop the runner.
+            self.stop()
+            raise
+        except (OSError, ValueError) as e:
+            self.stop()
+            raise JavaRunnerError(str(e))
+        if status is None:
+            self.stop()
+            raise JavaRunnerError('Java runner ended unexpectedly.')
+        return status
+
+    def reset(self):
+        """Forget the code compiled so far."""
+        status = self._request('reset')
+        if status != 'ok':
+            self.stop()
+            raise JavaRunnerError('Java runner did not reset: %s' % status)
+
+    def compile(self, name, source):
+        """Compile `source`, the contents of `<name>.java`, along with the
+        code compiled since the last reset. Returns a `(proc, stdout, stderr)`
+        tuple like `BaseEvaluator._run_command` with the compiler messages as
+        stderr.
+        """
+        status = self._request('compile', name, source.lstrip())
+        if status not in ('ok', 'error'):
+            self.stop()
+            raise JavaRunnerError('Java runner did not compile: %s' % status)
+        messages = self._read_text()
+        return RunResult(0 if status == 'ok' else 1), '', messages
+
+    def run(self, main_class, stdin=None, timeout=SERVER_TIMEOUT):
+        """Run the main method of `main_class` with the bytes `stdin` as its
+        standard input. Returns a `(proc, stdout, stderr)` tuple like
+        `BaseEvaluator._run_command`.
+        """
+        status = self._request('run', main_class, stdin or b'',
+                               int(timeout * 1000), MAX_OUTPUT_SIZE)
+        try:
+            if status in ('ok', 'stopped'):
+                returncode = int(self._read_text())
+                stdout = self._read_field()
+                stderr = self._read_field()
+                if status == 'stopped':
+                    self.stop()
+            elif status == 'exit':
+                stdout = self._read_field()
+                stderr = self._read_field()
+                returncode = self.proc.wait()
+                self.stop()
+            elif status == 'timeout':
+                self.stop()
+                raise TimeoutException('Code took too long to run.')
+            elif status == 'toolong':
+                self.stop()
+                raise OutputLimitExceeded(
+                    'Output limit exceeded: the code wrote more than {0} '
+                    'bytes of output.'.format(MAX_OUTPUT_SIZE)
+                )
+            else:
+                raise JavaRunnerError(self._read_text())
+        except TimeoutException:
+            self.stop()
+            raise
+        except ValueError as e:
+            self.stop()
+            raise JavaRunnerError('Bad reply from the Java runner: %s' % e)
+        return (RunResult(returncode), stdout.decode('utf-8'),
+                stderr.decode('utf-8'))
+
+
+_runner = None
+
+
+def get_java_runner():
+    """Return the Java runner of this process, started if need be, or None if
+    it is turned off or cannot be started here.
+
+    Code server processes call this before each job, so that the runner is
+    built and started outside the time limit of any submission.
+    """
+    global _runner
+    if not JAVA_RUNNER:
+        return None
+    if _runner is None:
+        _runner = JavaRunner()
+    if _runner.failed:
+        return None
+    if not _runner.is_running():
+        try:
+            _runner.start()
+        except JavaRunnerError:
+            _runner.failed = True
+            return None
+    return _runner
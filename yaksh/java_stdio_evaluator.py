@@ -6,14 +6,20 @@ from os.path import isfile
 
 # Local imports
 from .stdio_evaluator import StdIOEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .grader import CompilationError
+from .java_runner import get_java_runner, JavaRunnerError
 
 
 class JavaStdIOEvaluator(StdIOEvaluator):
     """Evaluates Java StdIO based code"""
+
+    compiles_answer = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
+        self.user_output_path = ""
+        self.runner = None
 
         # Set metadata values
         self.user_answer = metadata.get('user_answer')
@@ -26,12 +32,6 @@ class JavaStdIOEvaluator(StdIOEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if self.files:
-            delete_files(self.files)
-
     def set_file_paths(self, directory, file_name):
         output_path = "{0}{1}.class".format(directory, file_name)
         return output_path
@@ -53,31 +53,67 @@ class JavaStdIOEvaluator(StdIOEvaluator):
                                                     'Test'
                                                     )
         self.compile_command = self.get_commands()
-        self.compiled_user_answer = self._run_command(self.compile_command,
-                                                      shell=True,
-                                                      stdout=subprocess.PIPE,
-                                                      stderr=subprocess.PIPE
-                                                      )
+        # Files given with the question are read relative to the directory
+        # java is started in, which the runner cannot change.
+        self.runner = None if self.file_paths else get_java_runner()
+        if self.runner is not None:
+            try:
+                self.runner.reset()
+                self.compiled_user_answer = self.runner.compile(
+                    'Test', self.user_answer
+                )
+                return self.compiled_user_answer
+            except JavaRunnerError:
+                self.runner = None
+        return self._compile_with_javac()
+
+    def _compile_with_javac(self):
+        self.compiled_user_answer = self._compile_user_answer(
+            self.compile_command, shell=True, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
         return self.compiled_user_answer
 
+    def _run_in_runner(self):
+        """Run the user answer in the Java runner and return its output, or
+        None if the runner is not used or fails. The answer is then compiled
+        with javac to be run as usual.
+        """
+        if self.runner is None:
+            return None
+        try:
+            proc, stdout, stderr = self.runner.run(
+                'Test', self.get_stdin(self.expected_input)
+            )
+            return stdout
+        except JavaRunnerError:
+            self.runner = None
+            self._compile_with_javac()
+            return None
+
     def check_code(self):
         success = False
         mark_fraction = 0.0
         proc, stdnt_out, stdnt_stderr = self.compiled_user_answer
         stdnt_stderr = self._remove_null_substitute_char(stdnt_stderr)
         if stdnt_stderr == '' or "error" not in stdnt_stderr:
-            proc = subprocess.Popen("java Test",
-                                    shell=True,
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    preexec_fn=os.setpgrp
-                                    )
-            success, err = self.evaluate_stdio(self.user_answer, proc,
-                                               self.expected_input,
-                                               self.expected_output
-                                               )
-            os.remove(self.user_output_path)
+            user_output = self._run_in_runner()
+            if user_output is not None:
+                success, err = self.compare_stdio(user_output,
+                                                  self.expected_input,
+                                                  self.expected_output)
+            else:
+                proc = subprocess.Popen("java Test",
+                                        shell=True,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        preexec_fn=self._set_process_limits
+                                        )
+                success, err = self.evaluate_stdio(self.user_answer, proc,
+                                                   self.expected_input,
+                                                   self.expected_output
+                                                   )
         else:
             err = "Compilation Error:"
             try:
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Shared queue of jobs and store of results through which several server
+pools, on one or more hosts, check code together.
+
+A server pool given a broker queues the jobs submitted to it on the broker
+instead of keeping them, takes jobs from the broker whenever it has idle
+workers and publishes the status and result of the jobs it runs there. Any
+server pool sharing the broker can then answer for any job.
+
+Jobs are kept in one lane per priority and taken from the most urgent lane
+first, except that a lane passed over `starvation_limit` times in a row is
+served next, as the job queue of a server pool does. Results are dropped
+after `result_ttl` seconds.
+"""
+from __future__ import unicode_literals
+from collections import deque
+import json
+import threading
+import time
+
+# Local imports
+from .settings import SERVER_RESULT_TTL, SERVER_STARVATION_LIMIT
+
+
+def choose_priority(waiting, skipped, starvation_limit):
+    """Return the priority whose job is run next out of `waiting`, the
+    priorities with jobs waiting from the most urgent, and count the others
+    as passed over in `skipped`. A priority passed over `starvation_limit`
+    times in a row is chosen before more urgent ones.
+    """
+    starved = [p for p in waiting if skipped.get(p, 0) >= starvation_limit]
+    chosen = starved[0] if starved else waiting[0]
+    for priority in waiting:
+        skipped[priority] = skipped.get(priority, 0) + 1
+    skipped[chosen] = 0
+    return chosen
+
+
+class MemoryBroker(object):
+    """Broker kept in memory, for server pools running in one process such
+    as in tests.
+    """
+    def __init__(self, priorities, result_ttl=SERVER_RESULT_TTL,
+                 starvation_limit=SERVER_STARVATION_LIMIT):
+        self.priorities = tuple(priorities)
+        self.result_ttl = result_ttl
+        self.starvation_limit = starvation_limit
+        self._lock = threading.Lock()
+        self._lanes = dict((p, deque()) for p in self.priorities)
+        self._skipped = dict((p, 0) for p in self.priorities)
+        self._results = {}
+
+    def put(self, job, priority):
+        """Queue `job`, a `(uid, data, user_dir, queued_at)` tuple."""
+        with self._lock:
+            self._lanes[priority].append(job)
+
+    def get(self):
+        """Remove and return the next job to run and its priority, or None
+        if no job is waiting.
+        """
+        with self._lock:
+            waiting = [p for p in self.priorities if self._lanes[p]]
+            if not waiting:
+                return None
+            priority = choose_priority(waiting, self._skipped,
+                                       self.starvation_limit)
+            return self._lanes[priority].popleft(), priority
+
+    def qsize(self, priority):
+        """Number of jobs waiting in the given lane."""
+        return len(self._lanes[priority])
+
+    def ahead_of(self, priority):
+        """Number of jobs waiting which are run before a new job of the
+        given priority.
+        """
+        index = self.priorities.index(priority)
+        return sum(self.qsize(p) for p in self.priorities[:index + 1])
+
+    def set_result(self, uid, result):
+        with self._lock:
+            self._results[str(uid)] = (time.time(), result)
+
+    def get_result(self, uid):
+        """Return the status or result of a job, or None if it is not
+        known.
+        """
+        with self._lock:
+            item = self._results.get(str(uid))
+            if item is None:
+                return None
+            stored, result = item
+            if time.time() - stored > self.result_ttl:
+                del self._results[str(uid)]
+                return None
+            return result
+
+    def delete_result(self, uid):
+        with self._lock:
+            self._results.pop(str(uid), None)
+
+
+class RedisBroker(object):
+    """Broker kept in Redis. Each lane is a list and each result a key
+    expiring after `result_ttl` seconds, all named with `prefix`. The number
+    of times each lane has been passed over is kept in a hash, updated
+    without locking so that with many pools taking jobs at once it is only
+    roughly kept.
+    """
+    def __init__(self, priorities, url, result_ttl=SERVER_RESULT_TTL,
+                 prefix='yaksh:code_server:',
+                 starvation_limit=SERVER_STARVATION_LIMIT):
+        import redis
+        self.priorities = tuple(priorities)
+        self.result_ttl = result_ttl
+        self.starvation_limit = starvation_limit
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(url)
+
+    def _lane(self, priority):
+        return '%sjobs:%s' % (self.prefix, priority)
+
+    def _result_key(self, uid):
+        return '%sresult:%s' % (self.prefix, uid)
+
+    def _skipped_key(self):
+        return '%sskipped' % self.prefix
+
+    def put(self, job, priority):
+        """Queue `job`, a `(uid, data, user_dir, queued_at)` tuple."""
+        self.redis.lpush(self._lane(priority), json.dumps(job))
+
+    def get(self):
+        """Remove and return the next job to run and its priority, or None
+        if no job is waiting.
+        """
+        pipe = self.redis.pipeline()
+        for priority in self.priorities:
+            pipe.llen(self._lane(priority))
+        pipe.hmget(self._skipped_key(), self.priorities)
+        replies = pipe.execute()
+        counts = replies[-1]
+        waiting = [p for p, n in zip(self.priorities, replies) if n]
+        if not waiting:
+            return None
+        skipped = dict((p, int(n or 0))
+                       for p, n in zip(self.priorities, counts))
+        chosen = choose_priority(waiting, skipped, self.starvation_limit)
+        self.redis.hmset(self._skipped_key(),
+                         dict((p, skipped[p]) for p in waiting))
+        # Another pool may have emptied the chosen lane meanwhile.
+        for priority in [chosen] + [p for p in waiting if p != chosen]:
+            data = self.redis.rpop(self._lane(priority))
+            if data is not None:
+                return tuple(json.loads(data.decode('utf-8'))), priority
+        return None
+
+    def qsize(self, priority):
+        """Number of jobs waiting in the given lane."""
+        return self.redis.llen(self._lane(priority))
+
+    def ahead_of(self, priority):
+        """Number of jobs waiting which are run before a new job of the
+        given priority.
+        """
+        index = self.priorities.index(priority)
+        return sum(self.qsize(p) for p in self.priorities[:index + 1])
+
+    def set_result(self, uid, result):
+        self.redis.set(self._result_key(uid), json.dumps(result),
+                       ex=self.result_ttl)
+
+    def get_result(self, uid):
+        """Return the status or result of a job, or None if it is not
+        known.
+        """
+        data = self.redis.get(self._result_key(uid))
+        if data is None:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def delete_result(self, uid):
+        self.redis.delete(self._result_key(uid))
+
+
+def get_broker(url, priorities):
+    """Return the broker for `url`, `memory://` for one kept in memory or a
+    `redis://` URL, or None if `url` is empty.
+    """
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryBroker(priorities)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(priorities, url)
+    raise ValueError('Unknown job broker %s' % url)
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0035_quiz_question_paper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='cache_results',
+            field=models.BooleanField(default=True),
+        ),
+    ]
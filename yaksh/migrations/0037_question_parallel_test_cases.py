@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0036_question_cache_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='parallel_test_cases',
+            field=models.BooleanField(default=False),
+        ),
+    ]
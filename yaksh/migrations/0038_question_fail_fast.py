@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0037_question_parallel_test_cases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='fail_fast',
+            field=models.BooleanField(default=False),
+        ),
+    ]
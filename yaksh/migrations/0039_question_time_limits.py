@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0038_question_fail_fast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='cpu_limit',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='time_limit',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0039_question_time_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='max_rss',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='queue_wait',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='wall_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -50,7 +50,8 @@ from django.db.models.fields.files import FieldFile
 from django.core.files.base import ContentFile
 # Local Imports
 from yaksh.code_server import (
-    submit, get_result as get_result_from_code_server
+    submit, fetch_result as get_result_from_code_server, submit_batch,
+    fetch_results as get_results_from_code_server, ServerBusyError
 )
 from yaksh.settings import SERVER_POOL_PORT, SERVER_HOST_NAME
 from .file_utils import extract_files, delete_files
@@ -1410,6 +1411,25 @@ class Question(models.Model):
     # Check assignment upload based question
     grade_assignment_upload = models.BooleanField(default=False)
 
+    # Can results of evaluating an answer be reused for identical answers.
+    # Turn off if the files or hooks of the question do not always give the
+    # same result.
+    cache_results = models.BooleanField(default=True)
+
+    # Evaluate the test cases of an answer at the same time rather than one
+    # after the other. Only for test cases which do not depend on each other.
+    # Has no effect for languages whose answers are compiled.
+    parallel_test_cases = models.BooleanField(default=False)
+
+    # Stop evaluating an answer at its first failing test case. Has no effect
+    # with partial grading, where the other test cases still give marks.
+    fail_fast = models.BooleanField(default=False)
+
+    # Wall clock and CPU time in seconds each test case of the question may
+    # take, 0 for the limits set for the code server.
+    time_limit = models.FloatField(default=0)
+    cpu_limit = models.FloatField(default=0)
+
     min_time = models.IntegerField("time in minutes", default=0)
 
     # Solution for the question.
@@ -1469,6 +1489,11 @@ class Question(models.Model):
         metadata['user_answer'] = user_answer
         metadata['language'] = self.language
         metadata['partial_grading'] = self.partial_grading
+        metadata['cache_result'] = self.cache_results
+        metadata['parallel_test_cases'] = self.parallel_test_cases
+        metadata['fail_fast'] = self.fail_fast
+        metadata['time_limit'] = self.time_limit
+        metadata['cpu_limit'] = self.cpu_limit
         files = FileUpload.objects.filter(question=self)
         if files:
             if settings.USE_AWS:
@@ -1754,6 +1779,13 @@ class Answer(models.Model):
 
     comment = models.TextField(null=True, blank=True)
 
+    # Resources used by the code server to check the answer: CPU time, wall
+    # clock time and time spent queued in seconds and peak RSS in kilobytes.
+    cpu_time = models.FloatField(null=True, blank=True)
+    wall_time = models.FloatField(null=True, blank=True)
+    queue_wait = models.FloatField(null=True, blank=True)
+    max_rss = models.IntegerField(null=True, blank=True)
+
     def set_marks(self, marks):
         if marks > self.question.points:
             self.marks = self.question.points
@@ -1763,6 +1795,17 @@ class Answer(models.Model):
     def set_comment(self, comments):
         self.comment = comments
 
+    def set_resource_usage(self, result):
+        """Note the resources used to check the answer, from the result sent
+        by the code server.
+        """
+        resources = result.get('resources')
+        if resources:
+            self.cpu_time = resources.get('cpu_time')
+            self.wall_time = resources.get('wall_time')
+            self.queue_wait = resources.get('queue_wait')
+            self.max_rss = resources.get('max_rss')
+
     def __str__(self):
         return "Answer for question {0}".format(self.question.summary)
 
@@ -2227,6 +2270,60 @@ class AnswerPaperManager(models.Manager):
                 question_attempted[ap[0]] = len(ap[1]["question_id"].unique())
             return question_attempted
 
+    def regrade(self, regrade_list, server_port=SERVER_POOL_PORT):
+        """Regrade a list of (answerpaper, question_id) tuples.
+
+        All code answers are sent to the code server in a single batch and
+        their results fetched together. Returns a list of (success, message)
+        tuples in the same order as `regrade_list`.
+        """
+        details = []
+        code_answers = []
+        jobs = []
+        for answerpaper, question_id in regrade_list:
+            question, user_answer, answer, msg = \
+                answerpaper._get_regrade_answer(question_id)
+            if question is None:
+                details.append((False, msg))
+                continue
+            if question.type == 'code':
+                json_data = question.consolidate_answer_data(
+                    answer, answerpaper.user, True
+                )
+                user_dir = answerpaper.user.profile.get_user_dir()
+                jobs.append((user_answer.id, json_data, user_dir))
+                code_answers.append((len(details), answerpaper, question,
+                                     user_answer))
+            else:
+                result = answerpaper.validate_answer(
+                    answer, question, None, user_answer.id,
+                    server_port=server_port, priority='low'
+                )
+                answerpaper._save_regrade_result(question, user_answer, result)
+            details.append((True, msg))
+        if jobs:
+            url = '{0}:{1}'.format(SERVER_HOST_NAME, server_port)
+            try:
+                submit_batch(url, jobs, priority='low')
+            except ServerBusyError as e:
+                for index, answerpaper, question, user_answer in code_answers:
+                    details[index] = (False, f'{details[index][1]} {e}')
+                return details
+            results = get_results_from_code_server(
+                url, [uid for uid, json_data, user_dir in jobs], block=True
+            )
+            for index, answerpaper, question, user_answer in code_answers:
+                result = results.get(str(user_answer.id), {})
+                status = result.get('status')
+                if status != 'done':
+                    details[index] = (False, f'{details[index][1]} No result '
+                                      f'from the code server, status: '
+                                      f'{status}.')
+                    continue
+                answerpaper._save_regrade_result(question, user_answer,
+                                                 result['result'])
+        return details
+
 
 ###############################################################################
 class AnswerPaper(models.Model):
@@ -2537,7 +2634,7 @@ class AnswerPaper(models.Model):
         return dict(category_question_map)
 
     def validate_answer(self, user_answer, question, json_data=None, uid=None,
-                        server_port=SERVER_POOL_PORT):
+                        server_port=SERVER_POOL_PORT, priority=None):
         """
             Checks whether the answer submitted by the user is right or wrong.
             If right then returns correct = True, success and
@@ -2545,6 +2642,10 @@ class AnswerPaper(models.Model):
             success is True for MCQ's and multiple correct choices because
             only one attempt are allowed for them.
             For code questions success is True only if the answer is correct.
+            Code is run with the given code server priority, by default
+            'high' for a quiz and 'normal' for a trial quiz. If the code
+            server is too busy to take the code, the result asks the user to
+            try again and gives the seconds to wait as retry_after.
         """
 
         result = {'success': False, 'error': ['Incorrect answer'],
@@ -2609,11 +2710,26 @@ class AnswerPaper(models.Model):
             elif question.type == 'code' or question.type == "upload":
                 user_dir = self.user.profile.get_user_dir()
                 url = '{0}:{1}'.format(SERVER_HOST_NAME, server_port)
-                submit(url, uid, json_data, user_dir)
-                result = {'uid': uid, 'status': 'running'}
+                if priority is None:
+                    priority = 'normal' if self.question_paper.quiz.is_trial \
+                        else 'high'
+                try:
+                    submit(url, uid, json_data, user_dir, priority)
+                except ServerBusyError as e:
+                    result['error'] = [
+                        'The code server is busy right now. Please try '
+                        'again in {0} seconds.'.format(e.retry_after)
+                    ]
+                    result['retry_after'] = e.retry_after
+                else:
+                    result = {'uid': uid, 'status': 'running'}
         return result
 
-    def regrade(self, question_id, server_port=SERVER_POOL_PORT):
+    def _get_regrade_answer(self, question_id):
+        """Return a tuple (question, user_answer, answer, msg) with the
+        question and latest answer to regrade. The question is None if there
+        is nothing to regrade, msg then says why.
+        """
         try:
             question = self.questions.get(id=question_id)
             msg = 'User: {0}; Quiz: {1}; Question: {2}.\n'.format(
@@ -2623,33 +2739,27 @@ class AnswerPaper(models.Model):
                 self.user, self.question_paper.quiz.description,
                 question_id
             )
-            return False, f'{msg} Question not in the answer paper.'
+            return None, None, None, f'{msg} Question not in the answer paper.'
         user_answer = self.answers.filter(question=question).last()
         if not user_answer or not user_answer.answer:
-            return False, f'{msg} Did not answer.'
+            return None, None, None, f'{msg} Did not answer.'
         if question.type in ['mcc', 'arrange']:
             try:
                 answer = literal_eval(user_answer.answer)
                 if type(answer) is not list:
-                    return (False, f'{msg} {question.type} answer not a list.')
+                    return (None, None, None,
+                            f'{msg} {question.type} answer not a list.')
             except Exception:
-                return (False, f'{msg} {question.type} answer submission error')
+                return (None, None, None,
+                        f'{msg} {question.type} answer submission error')
         else:
             answer = user_answer.answer
-        json_data = question.consolidate_answer_data(answer, self.user, True) \
-            if question.type == 'code' else None
-        result = self.validate_answer(answer, question,
-                                      json_data, user_answer.id,
-                                      server_port=server_port
-                                      )
-        if question.type == "code":
-            url = '{0}:{1}'.format(SERVER_HOST_NAME, server_port)
-            check_result = get_result_from_code_server(url, result['uid'],
-                                                       block=True
-                                                       )
-            result = json.loads(check_result.get('result'))
+        return question, user_answer, answer, msg
+
+    def _save_regrade_result(self, question, user_answer, result):
         user_answer.correct = result.get('success')
         user_answer.error = json.dumps(result.get('error'))
+        user_answer.set_resource_usage(result)
         if result.get('success'):
             if question.partial_grading and question.type == 'code':
                 max_weight = question.get_maximum_test_case_weight()
@@ -2666,6 +2776,32 @@ class AnswerPaper(models.Model):
                 user_answer.marks = 0
         user_answer.save()
         self.update_marks('completed')
+
+    def regrade(self, question_id, server_port=SERVER_POOL_PORT):
+        question, user_answer, answer, msg = \
+            self._get_regrade_answer(question_id)
+        if question is None:
+            return False, msg
+        json_data = question.consolidate_answer_data(answer, self.user, True) \
+            if question.type == 'code' else None
+        result = self.validate_answer(answer, question,
+                                      json_data, user_answer.id,
+                                      server_port=server_port,
+                                      priority='low'
+                                      )
+        if 'retry_after' in result:
+            return False, f'{msg} {result["error"][0]}'
+        if question.type == "code":
+            url = '{0}:{1}'.format(SERVER_HOST_NAME, server_port)
+            check_result = get_result_from_code_server(url, result['uid'],
+                                                       block=True
+                                                       )
+            status = check_result.get('status')
+            if status != 'done':
+                return False, (f'{msg} No result from the code server, '
+                               f'status: {status}.')
+            result = check_result.get('result')
+        self._save_regrade_result(question, user_answer, result)
         return True, msg
 
     def __str__(self):
@@ -3,7 +3,7 @@ import sys
 import traceback
 
 # Local imports
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .base_evaluator import BaseEvaluator
 from .grader import TimeoutException
 from .error_messages import prettify_exceptions
@@ -11,6 +11,7 @@ from .error_messages import prettify_exceptions
 
 class PythonAssertionEvaluator(BaseEvaluator):
     """Tests the Python code obtained from Code Server"""
+    run_in_fork = True
 
     def __init__(self, metadata, test_case_data):
         self.exec_scope = None
@@ -26,11 +27,6 @@ class PythonAssertionEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if self.files:
-            delete_files(self.files)
-
     def compile_code(self):
         if self.file_paths:
             self.files = copy_files(self.file_paths)
@@ -7,14 +7,35 @@ except ImportError:
     from io import StringIO
 
 # Local imports
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .base_evaluator import BaseEvaluator
 from .error_messages import compare_outputs
+from .grader import OutputLimitExceeded
+from .settings import MAX_OUTPUT_SIZE
+
+
+class BoundedStringIO(StringIO):
+    """A StringIO raising OutputLimitExceeded once more than `max_size`
+    characters are written to it. There is no limit if `max_size` is 0.
+    """
+    def __init__(self, max_size=0):
+        StringIO.__init__(self)
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, s):
+        self.size += len(s)
+        if self.max_size and self.size > self.max_size:
+            raise OutputLimitExceeded(
+                'Output limit exceeded: the code wrote more than {0} '
+                'characters of output.'.format(self.max_size)
+            )
+        return StringIO.write(self, s)
 
 
 @contextmanager
 def redirect_stdout():
-    new_target = StringIO()
+    new_target = BoundedStringIO(MAX_OUTPUT_SIZE)
     old_target, sys.stdout = sys.stdout, new_target  # replace sys.stdout
     try:
         yield new_target  # run some code with the replaced stdout
@@ -24,6 +45,8 @@ def redirect_stdout():
 
 class PythonStdIOEvaluator(BaseEvaluator):
     """Tests the Python code obtained from Code Server"""
+    run_in_fork = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
 
@@ -38,11 +61,6 @@ class PythonStdIOEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if self.files:
-            delete_files(self.files)
-
     def compile_code(self):
         if self.file_paths:
             self.files = copy_files(self.file_paths)
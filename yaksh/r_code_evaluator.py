@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
-import os
 import subprocess
 import re
 
 # Local imports
 from .base_evaluator import BaseEvaluator
-from .file_utils import copy_files, delete_files
+from .file_utils import copy_files
 from .error_messages import prettify_exceptions
 
 
@@ -26,15 +25,6 @@ class RCodeEvaluator(BaseEvaluator):
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
-    def teardown(self):
-        # Delete the created file.
-        if os.path.exists(self.submit_code_path):
-            os.remove(self.submit_code_path)
-        if os.path.exists(self.test_code_path):
-            os.remove(self.test_code_path)
-        if self.files:
-            delete_files(self.files)
-
     def check_code(self):
         self.submit_code_path = self.create_submit_code_file('function.r')
         self.test_code_path = self.create_submit_code_file('main.r')
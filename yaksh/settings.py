@@ -18,6 +18,196 @@ SERVER_HOST_NAME = config('SERVER_HOST_NAME', default='http://localhost')
 # Timeout for the code to run in seconds.  This is an integer!
 SERVER_TIMEOUT = config('SERVER_TIMEOUT', default=4, cast=int)
 
+# Longest time in seconds that a request for a result is held by the server
+# pool while waiting for the job to finish.
+SERVER_LONG_POLL_TIMEOUT = config(
+    'SERVER_LONG_POLL_TIMEOUT', default=30, cast=int
+)
+
+# Most connections to the server pool kept open by each process submitting
+# code. Requests beyond this open connections which are not kept.
+SERVER_CLIENT_POOL_SIZE = config('SERVER_CLIENT_POOL_SIZE', default=10,
+                                 cast=int)
+
+# Seconds to wait for a connection to, and a reply from, the server pool.
+# Requests held by the server pool for a result are given
+# SERVER_LONG_POLL_TIMEOUT seconds more.
+SERVER_CLIENT_CONNECT_TIMEOUT = config(
+    'SERVER_CLIENT_CONNECT_TIMEOUT', default=5, cast=float
+)
+SERVER_CLIENT_READ_TIMEOUT = config(
+    'SERVER_CLIENT_READ_TIMEOUT', default=30, cast=float
+)
+
+# Requests submitting jobs whose body is larger than this many bytes are
+# compressed. Set to 0 to never compress them.
+SERVER_CLIENT_COMPRESS_SIZE = config(
+    'SERVER_CLIENT_COMPRESS_SIZE', default=65536, cast=int
+)
+
+# Times a request to the server pool is tried again when it cannot connect,
+# or when a request for results times out, after a random delay around
+# SERVER_CLIENT_RETRY_DELAY seconds which doubles with each try.
+SERVER_CLIENT_RETRIES = config('SERVER_CLIENT_RETRIES', default=3, cast=int)
+SERVER_CLIENT_RETRY_DELAY = config(
+    'SERVER_CLIENT_RETRY_DELAY', default=0.1, cast=float
+)
+
+# Number of times in a row that queued jobs of a priority may be passed over
+# for more urgent jobs before one of them is run.
+SERVER_STARVATION_LIMIT = config(
+    'SERVER_STARVATION_LIMIT', default=4, cast=int
+)
+
+# Results which are done but not fetched are dropped after this many seconds.
+SERVER_RESULT_TTL = config('SERVER_RESULT_TTL', default=1800, cast=int)
+
+# Most results the server pool keeps. Beyond this the oldest results which
+# are done are dropped.
+SERVER_MAX_RESULTS = config('SERVER_MAX_RESULTS', default=10000, cast=int)
+
+# Interval in seconds at which old results are looked for and dropped.
+SERVER_REAPER_INTERVAL = config('SERVER_REAPER_INTERVAL', default=60, cast=int)
+
+# A code server process is replaced by a fresh one once it has checked this
+# many jobs, so that memory leaked by the evaluators is given back. Set to 0
+# to never replace a process for the number of jobs it has checked.
+SERVER_MAX_JOBS_PER_WORKER = config(
+    'SERVER_MAX_JOBS_PER_WORKER', default=500, cast=int
+)
+
+# A code server process whose resident memory grows beyond this many
+# megabytes is replaced by a fresh one after its current job. Set to 0 to
+# never replace a process for its memory use.
+SERVER_MAX_WORKER_RSS = config('SERVER_MAX_WORKER_RSS', default=512, cast=int)
+
+# A code server process still checking a job this many seconds after
+# SERVER_TIMEOUT is taken to be hung, it is stopped and replaced.
+SERVER_HUNG_GRACE = config('SERVER_HUNG_GRACE', default=10, cast=int)
+
+# Interval in seconds at which code server processes are checked for being
+# dead or hung.
+SERVER_SUPERVISOR_INTERVAL = config(
+    'SERVER_SUPERVISOR_INTERVAL', default=5, cast=int
+)
+
+# Fewest and most code server processes the server pool scales between
+# with the number of jobs waiting. Set SERVER_MAX_WORKERS to 0 to always run
+# N_CODE_SERVERS processes.
+SERVER_MIN_WORKERS = config('SERVER_MIN_WORKERS', default=1, cast=int)
+SERVER_MAX_WORKERS = config('SERVER_MAX_WORKERS', default=0, cast=int)
+
+# Interval in seconds at which the server pool decides whether to add or
+# remove code server processes.
+SERVER_SCALE_INTERVAL = config('SERVER_SCALE_INTERVAL', default=5, cast=int)
+
+# Processes are added when jobs are waiting and either more jobs are waiting
+# than processes are running or a new job would wait for more than this many
+# seconds.
+SERVER_SCALE_UP_WAIT = config('SERVER_SCALE_UP_WAIT', default=10, cast=int)
+
+# An idle process is removed once no job has been left waiting for this many
+# seconds.
+SERVER_SCALE_DOWN_DELAY = config(
+    'SERVER_SCALE_DOWN_DELAY', default=60, cast=int
+)
+
+# Most jobs that may be waiting ahead of a new submission. Beyond this new
+# submissions are turned away and asked to retry later. Set to 0 to accept
+# any number.
+SERVER_MAX_QUEUE_DEPTH = config(
+    'SERVER_MAX_QUEUE_DEPTH', default=1000, cast=int
+)
+
+# Longest estimated wait in seconds, based on how long recent jobs took, for
+# which a new submission is accepted. Set to 0 to accept any wait.
+SERVER_MAX_WAIT = config('SERVER_MAX_WAIT', default=120, cast=int)
+
+# Broker through which the server pools of several hosts share jobs and
+# results, a redis:// URL. Leave empty for each server pool to check the
+# jobs submitted to it on its own.
+SERVER_BROKER_URL = config('SERVER_BROKER_URL', default='')
+
+# Interval in seconds at which a server pool with a broker looks for jobs
+# and for results of jobs run by other server pools.
+SERVER_BROKER_POLL_INTERVAL = config(
+    'SERVER_BROKER_POLL_INTERVAL', default=0.1, cast=float
+)
+
+# Most results of evaluated code the server pool keeps to answer identical
+# submissions without running them again. Set to 0 to not keep any.
+SERVER_CACHE_SIZE = config('SERVER_CACHE_SIZE', default=5000, cast=int)
+
+# Kept results of evaluated code are not used after this many seconds.
+SERVER_CACHE_TTL = config('SERVER_CACHE_TTL', default=3600, cast=int)
+
+# Megabytes of files given with questions, and of the files extracted from
+# them, each code server host keeps so that they are read and extracted once
+# rather than for every test case. Set to 0, the default, to copy them every
+# time.
+#
+# The kept files are written by the code server processes, so code being
+# evaluated, which runs as the same user, can change them and with them the
+# files every later job of the question is given. Only turn this on where
+# the evaluated code cannot reach SERVER_FILE_CACHE_DIR, for example when it
+# runs in a container or as a user of its own which does not see it.
+SERVER_FILE_CACHE_SIZE = config(
+    'SERVER_FILE_CACHE_SIZE', default=0, cast=int
+)
+
+# Directory in which the files are kept. Defaults to a directory in the
+# system temporary directory.
+SERVER_FILE_CACHE_DIR = config('SERVER_FILE_CACHE_DIR', default='')
+
+# Kept files are put in the directory of a job as copy on write clones where
+# the file system allows it, and otherwise copied. Set this to put them
+# there as read only hard links instead, which is faster but lets code
+# which changes the permissions of a file change the kept copy.
+SERVER_FILE_CACHE_HARDLINKS = config(
+    'SERVER_FILE_CACHE_HARDLINKS', default=False, cast=bool
+)
+
+# Number of compiled C/C++ test cases each code server process keeps so
+# that a test case is not compiled again for every submission.
+HARNESS_CACHE_SIZE = config('HARNESS_CACHE_SIZE', default=200, cast=int)
+
+# Compile and run Java code in a JVM kept running by each code server
+# process instead of starting javac and java for every test case. Needs a
+# JDK, if the runner cannot start javac and java are used as before.
+JAVA_RUNNER = config('JAVA_RUNNER', default=False, cast=bool)
+
+# Evaluate Python code in a process forked from the code server process for
+# each submission, so that nothing the code changes is left for later jobs.
+FORK_PYTHON_EVALUATION = config(
+    'FORK_PYTHON_EVALUATION', default=True, cast=bool
+)
+
+# Directory in which each job is given a scratch directory of its own to be
+# evaluated in, removed once it is done. A RAM backed file system such as
+# /dev/shm saves writing the files of each job to disk. Leave empty to make
+# the scratch directories in the directory of the user.
+SERVER_SCRATCH_DIR = config('SERVER_SCRATCH_DIR', default='')
+
+# Most test cases of a submission evaluated at the same time, for questions
+# whose test cases are run in parallel.
+GRADER_MAX_PARALLEL = config('GRADER_MAX_PARALLEL', default=4, cast=int)
+
+# Longest time in seconds, which may be fractional, a single test case may
+# take. A test case taking longer fails while the others are still run, as
+# long as the whole submission finishes within SERVER_TIMEOUT. Questions may
+# set their own limit. Set to 0 for no limit of its own.
+TEST_CASE_TIMEOUT = config('TEST_CASE_TIMEOUT', default=0, cast=float)
+
+# Seconds of CPU time a single test case may use. Processes started for a
+# test case are limited with RLIMIT_CPU, which counts in whole seconds.
+# Questions may set their own limit. Set to 0 for no limit.
+TEST_CASE_CPU_LIMIT = config('TEST_CASE_CPU_LIMIT', default=0, cast=float)
+
+# Most bytes of output, stdout and stderr together, that a process run to
+# check code may write. It is killed if it writes more. Set to 0 for no
+# limit.
+MAX_OUTPUT_SIZE = config('MAX_OUTPUT_SIZE', default=2097152, cast=int)
+
 # The root of the URL, for example you might be in the situation where you
 # are not hosted as host.org/exam/  but as host.org/foo/exam/ for whatever
 # reason set this to the root you have to serve at.  In the above example
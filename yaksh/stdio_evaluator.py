@@ -9,25 +9,28 @@ from .error_messages import compare_outputs
 
 
 class StdIOEvaluator(BaseEvaluator):
+    def get_stdin(self, expected_input):
+        """Return the bytes sent to the program as its standard input."""
+        if not expected_input:
+            return None
+        ip = expected_input.replace(",", " ")
+        return '{0}\n'.format(ip).encode('utf-8')
+
+    def compare_stdio(self, user_output, expected_input, expected_output):
+        expected_output = expected_output.replace("\r", "")
+        return compare_outputs(expected_output, user_output, expected_input)
+
     def evaluate_stdio(self, user_answer, proc,
                        expected_input, expected_output):
-        success = False
         try:
-            if expected_input:
-                ip = expected_input.replace(",", " ")
-                encoded_input = '{0}\n'.format(ip).encode('utf-8')
-                user_output_bytes, output_err_bytes = proc.communicate(
-                                                           encoded_input
-                                                           )
-            else:
-                user_output_bytes, output_err_bytes = proc.communicate()
+            encoded_input = self.get_stdin(expected_input)
+            user_output_bytes, output_err_bytes = self._communicate(
+                proc, encoded_input
+            )
             user_output = user_output_bytes.decode('utf-8')
         except TimeoutException:
-            os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+            if proc.returncode is None:
+                os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
             raise
-        expected_output = expected_output.replace("\r", "")
-        success, err = compare_outputs(expected_output,
-                                       user_output,
-                                       expected_input
-                                       )
-        return success, err
+        return self.compare_stdio(user_output, expected_input,
+                                  expected_output)
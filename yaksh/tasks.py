@@ -24,8 +24,28 @@ from .models import (
 from notifications_plugin.models import NotificationMessage, Notification
 
 
+def _get_regrade_failures(regrade_list, details):
+    """Return the messages of the (answerpaper, question_id) tuples in
+    `regrade_list` which could not be regraded, for instance as the code
+    server was busy, leaving out those with nothing to regrade.
+    """
+    failures = []
+    for (answerpaper, question_id), (success, msg) in zip(
+            regrade_list, details):
+        if success:
+            continue
+        question = answerpaper._get_regrade_answer(question_id)[0]
+        if question is not None:
+            failures.append(msg)
+    return failures
+
+
 @shared_task
 def regrade_papers(data):
+    """Regrade the answers given by `data` and notify the user who asked
+    for it. Returns the messages of the answers which could not be
+    regraded, which are also listed in the notification.
+    """
     question_id = data.get("question_id")
     questionpaper_id = data.get("questionpaper_id")
     answerpaper_id = data.get("answerpaper_id")
@@ -36,6 +56,8 @@ def regrade_papers(data):
     course_name = data.get("course_name")
 
     url = reverse("yaksh:grade_user", args=[quiz_id, course_id])
+    regrade_list = []
+    details = []
 
     try:
         if answerpaper_id is not None and question_id is None:
@@ -43,19 +65,21 @@ def regrade_papers(data):
             answerpaper = AnswerPaper.objects.get(id=answerpaper_id)
             url = reverse("yaksh:grade_user",
                           args=[quiz_id, answerpaper.user_id, course_id])
-            for question in answerpaper.questions.all():
-                answerpaper.regrade(question.id)
-                course_status = CourseStatus.objects.filter(
-                    user=answerpaper.user, course=answerpaper.course)
-                if course_status.exists():
-                    course_status.first().set_grade()
+            regrade_list = [(answerpaper, question.id)
+                            for question in answerpaper.questions.all()]
+            details = AnswerPaper.objects.regrade(regrade_list)
+            course_status = CourseStatus.objects.filter(
+                user=answerpaper.user, course=answerpaper.course)
+            if course_status.exists():
+                course_status.first().set_grade()
 
         elif answerpaper_id is not None and question_id is not None:
             # Regrade specific user for a specific question
             answerpaper = AnswerPaper.objects.get(pk=answerpaper_id)
             url = reverse("yaksh:grade_user",
                           args=[quiz_id, answerpaper.user_id, course_id])
-            answerpaper.regrade(question_id)
+            regrade_list = [(answerpaper, question_id)]
+            details = [answerpaper.regrade(question_id)]
             course_status = CourseStatus.objects.filter(
                 user=answerpaper.user, course=answerpaper.course)
             if course_status.exists():
@@ -66,20 +90,34 @@ def regrade_papers(data):
             answerpapers = AnswerPaper.objects.filter(
                 questions=question_id,
                 question_paper_id=questionpaper_id, course_id=course_id)
+            regrade_list = [(answerpaper, question_id)
+                            for answerpaper in answerpapers]
+            details = AnswerPaper.objects.regrade(regrade_list)
             for answerpaper in answerpapers:
-                answerpaper.regrade(question_id)
                 course_status = CourseStatus.objects.filter(
                     user=answerpaper.user, course=answerpaper.course)
                 if course_status.exists():
                     course_status.first().set_grade()
 
-        message = dedent("""
-            Quiz re-evaluation is complete.
-            Click <a href="{0}">here</a> to view
-            """.format(url)
-            )
-        notification_type = "success"
+        failures = _get_regrade_failures(regrade_list, details)
+        if failures:
+            message = dedent("""
+                Quiz re-evaluation is complete, but {0} answers could not
+                be regraded. Please try again for these.
+                Click <a href="{1}">here</a> to view
+                <br><br>{2}
+                """.format(len(failures), url, "\n".join(failures))
+                )
+            notification_type = "warning"
+        else:
+            message = dedent("""
+                Quiz re-evaluation is complete.
+                Click <a href="{0}">here</a> to view
+                """.format(url)
+                )
+            notification_type = "success"
     except Exception as e:
+        failures = [str(e)]
         message = dedent("""
             Unable to regrade please try again.
             Click <a href="{0}">here</a> to view""".format(url)
@@ -92,6 +130,7 @@ def regrade_papers(data):
     notification = Notification.objects.add_single_notification(
         user_id, nm.id
     )
+    return failures
 
 
 @shared_task
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -8,6 +9,8 @@ from yaksh.models import User, Profile, Question, Quiz, QuestionPaper,\
     LearningModule, LearningUnit, Lesson, LessonFile, CourseStatus, \
     create_group, legend_display_types, Post, Comment, MicroManager, QRcode, \
     QRcodeHandler
+from yaksh.tasks import regrade_papers
+from notifications_plugin.models import Notification
 from yaksh.code_server import (
     ServerPool, get_result as get_result_from_code_server
     )
@@ -1589,6 +1592,116 @@ class AnswerPaperTestCases(unittest.TestCase):
         self.assertEqual(self.answer.marks, 0)
         self.assertFalse(self.answer.correct)
 
+    def test_regrade_many_answers_in_a_batch(self):
+        # Given
+        code_answer = Answer(question=self.question1,
+                             answer=dedent("""
+                                           def add(a,b):
+                                               return a-b
+                                           """),
+                             correct=True, marks=1)
+        code_answer.save()
+        self.answerpaper.answers.add(code_answer)
+        mcc_answer = Answer(question=self.question3,
+                            answer=['a', 'b'], correct=True, marks=1)
+        mcc_answer.save()
+        self.answerpaper.answers.add(mcc_answer)
+
+        # When
+        details = AnswerPaper.objects.regrade(
+            [(self.answerpaper, self.question1.id),
+             (self.answerpaper, self.question3.id),
+             (self.answerpaper, 0)],
+            self.SERVER_POOL_PORT
+        )
+
+        # Then
+        self.assertTrue(details[0][0])
+        self.assertTrue(details[1][0])
+        self.assertFalse(details[2][0])
+        self.assertIn('Question not in the answer paper', details[2][1])
+        code_answer.refresh_from_db()
+        mcc_answer.refresh_from_db()
+        self.assertFalse(code_answer.correct)
+        self.assertEqual(code_answer.marks, 0)
+        self.assertFalse(mcc_answer.correct)
+        self.assertEqual(mcc_answer.marks, 0)
+
+    def test_regrade_batch_with_unknown_result(self):
+        # Given
+        code_answer = Answer(question=self.question1,
+                             answer=dedent("""
+                                           def add(a,b):
+                                               return a-b
+                                           """),
+                             correct=True, marks=1)
+        code_answer.save()
+        self.answerpaper.answers.add(code_answer)
+        mcc_answer = Answer(question=self.question3,
+                            answer=['a', 'b'], correct=True, marks=1)
+        mcc_answer.save()
+        self.answerpaper.answers.add(mcc_answer)
+        results = {str(code_answer.id): {'status': 'unknown'}}
+
+        # When
+        with patch('yaksh.models.get_results_from_code_server',
+                   return_value=results):
+            details = AnswerPaper.objects.regrade(
+                [(self.answerpaper, self.question1.id),
+                 (self.answerpaper, self.question3.id)],
+                self.SERVER_POOL_PORT
+            )
+
+        # Then
+        self.assertFalse(details[0][0])
+        self.assertIn('status: unknown', details[0][1])
+        self.assertTrue(details[1][0])
+        code_answer.refresh_from_db()
+        mcc_answer.refresh_from_db()
+        self.assertTrue(code_answer.correct)
+        self.assertEqual(code_answer.marks, 1)
+        self.assertFalse(mcc_answer.correct)
+
+        # When
+        with patch('yaksh.models.get_result_from_code_server',
+                   return_value={'status': 'unknown'}):
+            success, msg = self.answerpaper.regrade(self.question1.id,
+                                                    self.SERVER_POOL_PORT)
+
+        # Then
+        self.assertFalse(success)
+        self.assertIn('status: unknown', msg)
+        code_answer.refresh_from_db()
+        self.assertTrue(code_answer.correct)
+
+    def test_regrade_task_reports_failures(self):
+        # Given
+        code_answer = Answer(question=self.question1,
+                             answer='def add(a, b): return a + b',
+                             correct=False, marks=0)
+        code_answer.save()
+        self.answerpaper.answers.add(code_answer)
+        data = {'answerpaper_id': self.answerpaper.id,
+                'question_id': self.question1.id,
+                'quiz_id': self.quiz.id, 'course_id': self.course.id,
+                'user_id': self.user.id, 'quiz_name': 'demo quiz 1'}
+
+        # When
+        with patch('yaksh.models.get_result_from_code_server',
+                   return_value={'status': 'unknown'}), \
+                patch('yaksh.models.AnswerPaper.validate_answer',
+                      return_value={'uid': code_answer.id,
+                                    'status': 'running'}):
+            failures = regrade_papers(data)
+
+        # Then
+        self.assertEqual(len(failures), 1)
+        self.assertIn('status: unknown', failures[0])
+        notification = Notification.objects.filter(
+            receiver=self.user).last()
+        self.assertEqual(notification.message.message_type, 'warning')
+        self.assertIn('1 answers could not', notification.message.description)
+
     def test_validate_and_regrade_mcq_correct_answer(self):
         # Given
         mcq_answer = str(self.mcq_based_testcase.id)
@@ -1819,6 +1932,17 @@ class AnswerPaperTestCases(unittest.TestCase):
         self.answer_wrong.set_marks(10.0)
         self.assertEqual(self.answer_wrong.marks, 1.0)
 
+    def test_set_resource_usage(self):
+        result = {'success': True, 'resources': {
+            'cpu_time': 0.25, 'wall_time': 0.5, 'queue_wait': 1.5,
+            'max_rss': 10240
+        }}
+        self.answer_wrong.set_resource_usage(result)
+        self.assertEqual(self.answer_wrong.cpu_time, 0.25)
+        self.assertEqual(self.answer_wrong.wall_time, 0.5)
+        self.assertEqual(self.answer_wrong.queue_wait, 1.5)
+        self.assertEqual(self.answer_wrong.max_rss, 10240)
+
     def test_get_latest_answer(self):
         latest_answer = self.answerpaper.get_latest_answer(self.question1.id)
         self.assertEqual(latest_answer.id, self.answer1.id)
@@ -2202,6 +2326,20 @@ class TestCaseTestCases(unittest.TestCase):
                          exp_data['metadata']['user_answer'])
         self.assertEqual(actual_data['test_case_data'],
                          exp_data['test_case_data'])
+        self.assertTrue(actual_data['metadata']['cache_result'])
+        self.assertFalse(actual_data['metadata']['parallel_test_cases'])
+        self.assertFalse(actual_data['metadata']['fail_fast'])
+        self.assertEqual(actual_data['metadata']['time_limit'], 0)
+        self.assertEqual(actual_data['metadata']['cpu_limit'], 0)
+
+        # When
+        self.question1.cache_results = False
+        result = self.question1.consolidate_answer_data(
+            user_answer="demo_answer"
+        )
+
+        # Then
+        self.assertFalse(json.loads(result)['metadata']['cache_result'])
 
 
 class AssignmentUploadTestCases(unittest.TestCase):
@@ -1,17 +1,393 @@
 from __future__ import unicode_literals
+import asyncio
 import json
 try:
     from Queue import Queue
 except ImportError:
     from queue import Queue
 from threading import Thread
+import time
 import unittest
+from unittest.mock import MagicMock, patch
 import urllib
 
-from yaksh.code_server import ServerPool, SERVER_POOL_PORT, submit, get_result
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from yaksh.code_server import (
+    ServerPool, ResultTable, JobQueue, ResultCache, Histogram,
+    ServerBusyError, PRIORITIES, SERVER_POOL_PORT, get_cache_key,
+    format_metric, submit, get_result, submit_batch, get_results,
+    async_submit, async_get_result, get_retry_delay, send_request,
+    encode_jobs, fetch_result, fetch_results, get_session, is_cacheable
+)
+from yaksh.job_broker import MemoryBroker
 from yaksh import settings
 
 
+class TestResultTable(unittest.TestCase):
+
+    def test_status_counts_follow_updates(self):
+        # Given
+        results = ResultTable()
+
+        # When
+        results.set('0', dict(status='not started'))
+        results.set('1', dict(status='not started'))
+        results.set('0', dict(status='running', pid=0, result=None))
+
+        # Then
+        self.assertEqual(results.count('not started'), 1)
+        self.assertEqual(results.count('running'), 1)
+
+        # When
+        results.set('0', dict(status='done', result='{}'))
+        results.pop('0')
+        results.pop('unknown')
+
+        # Then
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results.count('running'), 0)
+        self.assertEqual(results.count('done'), 0)
+        self.assertEqual(results.count('not started'), 1)
+
+    def test_expire_old_results(self):
+        # Given
+        results = ResultTable()
+        results.set('0', dict(status='done', result='{}'))
+        results.set('1', dict(status='running', pid=0, result=None))
+        time.sleep(0.2)
+        results.set('2', dict(status='done', result='{}'))
+
+        # When
+        count = results.expire(0.1)
+
+        # Then
+        self.assertEqual(count, 1)
+        self.assertEqual(results.expired, 1)
+        self.assertNotIn('0', results)
+        self.assertIn('1', results)
+        self.assertIn('2', results)
+        self.assertEqual(results.count('done'), 1)
+
+    def test_evict_results_over_limit(self):
+        # Given
+        results = ResultTable(max_results=2)
+        results.set('0', dict(status='done', result='{}'))
+        results.set('1', dict(status='not started'))
+
+        # When
+        results.set('2', dict(status='not started'))
+
+        # Then
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results.evicted, 1)
+        self.assertNotIn('0', results)
+
+        # When
+        results.set('3', dict(status='not started'))
+
+        # Then
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results.evicted, 1)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def test_urgent_jobs_run_first(self):
+        # Given
+        jobs = JobQueue(starvation_limit=10)
+
+        # When
+        jobs.put('regrade', 'low')
+        jobs.put('trial', 'normal')
+        jobs.put('exam', 'high')
+
+        # Then
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(jobs.qsize('high'), 1)
+        self.assertEqual([jobs.get() for i in range(3)],
+                         ['exam', 'trial', 'regrade'])
+        self.assertEqual(len(jobs), 0)
+
+    def test_waiting_jobs_are_not_starved(self):
+        # Given
+        jobs = JobQueue(starvation_limit=2)
+        for i in range(6):
+            jobs.put('exam%d' % i, 'high')
+        jobs.put('regrade', 'low')
+
+        # When
+        order = [jobs.get() for i in range(7)]
+
+        # Then
+        self.assertEqual(order, ['exam0', 'exam1', 'regrade', 'exam2',
+                                 'exam3', 'exam4', 'exam5'])
+
+    def test_jobs_ahead_of_priority(self):
+        # Given
+        jobs = JobQueue()
+
+        # When
+        jobs.put('regrade', 'low')
+        jobs.put('trial', 'normal')
+        jobs.put('exam0', 'high')
+        jobs.put('exam1', 'high')
+
+        # Then
+        self.assertEqual(jobs.ahead_of('high'), 2)
+        self.assertEqual(jobs.ahead_of('normal'), 3)
+        self.assertEqual(jobs.ahead_of('low'), 4)
+
+    def test_unknown_priority(self):
+        jobs = JobQueue()
+        with self.assertRaises(ValueError):
+            jobs.put('job', 'urgent')
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_least_recently_used_results_are_dropped(self):
+        # Given
+        cache = ResultCache(max_size=2, ttl=60)
+        cache.set('a', 'result a')
+        cache.set('b', 'result b')
+
+        # When
+        cache.get('a')
+        cache.set('c', 'result c')
+
+        # Then
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 'result a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'result c')
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hit_rate(), 0.75)
+
+    def test_old_results_are_not_used(self):
+        # Given
+        cache = ResultCache(max_size=2, ttl=0.1)
+        cache.set('a', 'result a')
+
+        # When
+        time.sleep(0.2)
+
+        # Then
+        self.assertFalse('a' in cache)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_key(self):
+        # Given
+        data = {'metadata': {'user_answer': 'x = 1', 'language': 'python'},
+                'test_case_data': []}
+        same_data = {'test_case_data': [],
+                     'metadata': {'language': 'python',
+                                  'user_answer': 'x = 1'}}
+        other_data = {'metadata': {'user_answer': 'x = 2',
+                                   'language': 'python'},
+                      'test_case_data': []}
+        opt_out = {'metadata': {'user_answer': 'x = 1', 'language': 'python',
+                                'cache_result': False},
+                   'test_case_data': []}
+
+        # Then
+        key = get_cache_key(json.dumps(data))
+        self.assertEqual(key, get_cache_key(json.dumps(same_data)))
+        self.assertNotEqual(key, get_cache_key(json.dumps(other_data)))
+        self.assertIsNone(get_cache_key(json.dumps(opt_out)))
+
+    def test_failures_of_the_server_are_not_cached(self):
+        # Given
+        def make_result(error):
+            return dict(status='done', result=dict(success=False,
+                                                   error=error))
+        wrong = make_result([{'exception': 'AssertionError'}])
+        timed_out = make_result([{'exception': 'TimeoutException'}])
+        killed = make_result(['Process ended with exit code -9.'])
+
+        # Then
+        self.assertTrue(is_cacheable(wrong))
+        self.assertFalse(is_cacheable(timed_out))
+        self.assertFalse(is_cacheable(killed))
+
+
+class TestMemoryBroker(unittest.TestCase):
+
+    def test_urgent_jobs_are_taken_first(self):
+        # Given
+        broker = MemoryBroker(PRIORITIES)
+        broker.put(('0', '{}', '', 0), 'low')
+        broker.put(('1', '{}', '', 0), 'normal')
+        broker.put(('2', '{}', '', 0), 'high')
+
+        # Then
+        self.assertEqual(broker.ahead_of('normal'), 2)
+        self.assertEqual(broker.get(), (('2', '{}', '', 0), 'high'))
+        self.assertEqual(broker.get(), (('1', '{}', '', 0), 'normal'))
+        self.assertEqual(broker.get(), (('0', '{}', '', 0), 'low'))
+        self.assertIsNone(broker.get())
+
+    def test_waiting_jobs_are_not_starved(self):
+        # Given
+        broker = MemoryBroker(PRIORITIES, starvation_limit=2)
+        for i in range(4):
+            broker.put((str(i), '{}', '', 0), 'high')
+        broker.put(('low', '{}', '', 0), 'low')
+
+        # When
+        taken = [broker.get()[1] for i in range(5)]
+
+        # Then
+        self.assertEqual(taken, ['high', 'high', 'low', 'high', 'high'])
+
+    def test_old_results_are_dropped(self):
+        # Given
+        broker = MemoryBroker(PRIORITIES, result_ttl=0.1)
+        broker.set_result('0', dict(status='done', result='{}'))
+        broker.set_result(1, dict(status='running', result=None))
+
+        # Then
+        self.assertEqual(broker.get_result(0)['status'], 'done')
+        self.assertEqual(broker.get_result('1')['status'], 'running')
+        broker.delete_result('1')
+        self.assertIsNone(broker.get_result('1'))
+
+        # When
+        time.sleep(0.2)
+
+        # Then
+        self.assertIsNone(broker.get_result('0'))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        # Given
+        histogram = Histogram(['language'], buckets=(0.1, 1))
+
+        # When
+        histogram.observe(['python'], 0.05)
+        histogram.observe(['python'], 0.5)
+        histogram.observe(['python'], 5)
+
+        # Then
+        samples = histogram.samples('latency')
+        self.assertEqual(samples, [
+            ('latency_bucket', [('language', 'python'), ('le', '0.1')], 1),
+            ('latency_bucket', [('language', 'python'), ('le', '1')], 2),
+            ('latency_bucket', [('language', 'python'), ('le', '+Inf')], 3),
+            ('latency_sum', [('language', 'python')], 5.55),
+            ('latency_count', [('language', 'python')], 3),
+        ])
+
+    def test_format_metric(self):
+        # When
+        text = format_metric('jobs', 'gauge', 'Jobs.',
+                             [('jobs', [('lane', 'a"b')], 2), ('jobs', [], 1)])
+
+        # Then
+        self.assertEqual(text, '# HELP jobs Jobs.\n# TYPE jobs gauge\n'
+                               'jobs{lane="a\\"b"} 2.0\njobs 1.0\n')
+
+
+class TestClient(unittest.TestCase):
+
+    @patch('yaksh.code_server.SERVER_CLIENT_RETRY_DELAY', 1)
+    def test_retry_delay_doubles_with_jitter(self):
+        for attempt in range(4):
+            delay = get_retry_delay(attempt)
+            self.assertTrue(0.5 * 2 ** attempt <= delay <= 1.5 * 2 ** attempt)
+
+    @patch('yaksh.code_server.time.sleep')
+    @patch('yaksh.code_server.get_session')
+    def test_failed_connections_are_retried(self, get_session, sleep):
+        # Given
+        session = get_session.return_value
+        refused = MaxRetryError(None, '/', NewConnectionError(None, 'refused'))
+        session.request.side_effect = [
+            requests.ConnectionError(refused), requests.ConnectTimeout(),
+            'reply'
+        ]
+
+        # When
+        reply = send_request('POST', 'http://localhost')
+
+        # Then
+        self.assertEqual(reply, 'reply')
+        self.assertEqual(session.request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @patch('yaksh.code_server.time.sleep', MagicMock())
+    @patch('yaksh.code_server.get_session')
+    def test_submissions_which_may_have_been_sent_are_not_retried(
+            self, get_session):
+        # Given
+        session = get_session.return_value
+        session.request.side_effect = [
+            requests.ConnectionError('Connection reset by peer'), 'reply'
+        ]
+
+        # Then
+        with self.assertRaises(requests.ConnectionError):
+            send_request('POST', 'http://localhost')
+        self.assertEqual(session.request.call_count, 1)
+
+        # When
+        session.request.side_effect = [
+            requests.ConnectionError('Connection reset by peer'), 'reply'
+        ]
+        reply = send_request('GET', 'http://localhost')
+
+        # Then
+        self.assertEqual(reply, 'reply')
+
+    @patch('yaksh.code_server.SERVER_CLIENT_RETRIES', 2)
+    @patch('yaksh.code_server.time.sleep', MagicMock())
+    @patch('yaksh.code_server.get_session')
+    def test_retries_are_bounded(self, get_session):
+        # Given
+        session = get_session.return_value
+        session.request.side_effect = requests.ReadTimeout()
+
+        # Then
+        with self.assertRaises(requests.ReadTimeout):
+            send_request('GET', 'http://localhost')
+        self.assertEqual(session.request.call_count, 3)
+
+        # A submission which timed out may have been taken.
+        session.request.reset_mock()
+        with self.assertRaises(requests.ReadTimeout):
+            send_request('POST', 'http://localhost')
+        self.assertEqual(session.request.call_count, 1)
+
+    @patch('yaksh.code_server._client_pid', None)
+    @patch('yaksh.code_server._session', None)
+    def test_requests_do_not_wait_for_a_free_connection(self):
+        # When
+        adapter = get_session().get_adapter('http://localhost')
+
+        # Then
+        self.assertFalse(adapter._pool_block)
+
+    def test_jobs_are_encoded_once(self):
+        # Given
+        data = {'metadata': {'user_answer': 'print("\\u00e9")'},
+                'test_case_data': []}
+        jobs = [(1, json.dumps(data), ''), ('2', json.dumps(data), 'dir')]
+
+        # When
+        body = json.loads(encode_jobs(jobs, 'normal'))
+
+        # Then
+        self.assertEqual(body['jobs'], [
+            dict(uid='1', data=data, user_dir='', priority='normal'),
+            dict(uid='2', data=data, user_dir='dir', priority='normal'),
+        ])
+
+
 class TestCodeServer(unittest.TestCase):
 
     @classmethod
@@ -63,6 +439,40 @@ class TestCodeServer(unittest.TestCase):
         self.assertFalse(data['success'])
         self.assertTrue('infinite loop' in data['error'][0]['message'])
 
+    def test_long_poll_result(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'while True: pass',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [
+                {'test_case': 'assert 1==2',
+                 'test_case_type': 'standardtestcase',
+                 'weight': 0.0}
+            ]
+        }
+        submit(self.url, '0', json.dumps(testdata), '')
+
+        # When
+        start = time.time()
+        r = requests.get(self.url + '/0', params=dict(timeout=0.5))
+
+        # Then
+        self.assertTrue(time.time() - start >= 0.5)
+        self.assertIn(json.loads(r.text).get('status'),
+                      ['running', 'not started'])
+
+        # When
+        r = requests.get(self.url + '/0', params=dict(timeout=10))
+
+        # Then
+        result = json.loads(r.text)
+        self.assertEqual(result.get('status'), 'done')
+        data = json.loads(result.get('result'))
+        self.assertTrue('infinite loop' in data['error'][0]['message'])
+
     def test_correct_answer(self):
         # Given
         testdata = {
@@ -84,6 +494,96 @@ class TestCodeServer(unittest.TestCase):
         data = json.loads(result.get('result'))
         self.assertTrue(data['success'])
 
+    def test_resource_usage_is_reported(self):
+        # Given
+        # Results answered from the cache carry no resources.
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False,
+                'cache_result': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        url = "http://localhost:%s/" % SERVER_POOL_PORT
+
+        # When
+        submit(self.url, '0', json.dumps(testdata), '')
+        result = get_result(self.url, '0', block=True)
+        status = urllib.request.urlopen(url).read().decode('utf-8')
+
+        # Then
+        resources = json.loads(result.get('result'))['resources']
+        self.assertEqual(
+            sorted(resources),
+            ['cpu_time', 'max_rss', 'queue_wait', 'wall_time']
+        )
+        self.assertGreaterEqual(resources['queue_wait'], 0)
+        self.assertIn('python: ', status)
+        self.assertIn('kB peak RSS', status)
+
+    def test_metrics(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        url = "http://localhost:%s/metrics" % SERVER_POOL_PORT
+
+        # When
+        submit(self.url, '0', json.dumps(testdata), '')
+        get_result(self.url, '0', block=True)
+        response = requests.get(url)
+
+        # Then
+        self.assertTrue(response.headers['Content-Type'].startswith(
+            'text/plain'
+        ))
+        self.assertIn('yaksh_queue_depth{priority="high"} 0.0',
+                      response.text)
+        self.assertIn('yaksh_job_run_seconds_count{language="python",'
+                      'test_case_type="standardtestcase"}', response.text)
+        self.assertIn('# TYPE yaksh_job_queue_wait_seconds histogram',
+                      response.text)
+        self.assertIn('yaksh_worker_restarts_total', response.text)
+
+    def test_async_client(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 3',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 3',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        async def check():
+            await async_submit(self.url, '0', json.dumps(testdata), '')
+            return await async_get_result(self.url, '0', block=True)
+
+        # When
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(check())
+        finally:
+            loop.close()
+
+        # Then
+        self.assertEqual(result['status'], 'done')
+        self.assertTrue(json.loads(result['result'])['success'])
+
     def test_wrong_answer(self):
         # Given
         testdata = {
@@ -168,7 +668,7 @@ class TestCodeServer(unittest.TestCase):
             t.start()
 
         for t in threads:
-            if t.isAlive():
+            if t.is_alive():
                 t.join()
 
         # Then
@@ -178,6 +678,142 @@ class TestCodeServer(unittest.TestCase):
             self.assertFalse(data['success'])
             self.assertTrue('infinite loop' in data['error'][0]['message'])
 
+    def test_batch_submit_and_results(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        wrong_data = dict(testdata, test_case_data=[
+            {'test_case': 'assert f() == 2',
+             'test_case_type': 'standardtestcase',
+             'weight': 0.0}
+        ])
+        jobs = [(10, json.dumps(testdata), ''),
+                (11, json.dumps(wrong_data), ''),
+                (12, json.dumps(testdata), '')]
+
+        # When
+        submit_batch(self.url, jobs)
+        results = get_results(self.url, [10, 11, 12], block=True)
+
+        # Then
+        self.assertEqual(sorted(results.keys()), ['10', '11', '12'])
+        self.assertTrue(json.loads(results['10']['result'])['success'])
+        self.assertFalse(json.loads(results['11']['result'])['success'])
+        self.assertTrue(json.loads(results['12']['result'])['success'])
+
+        # When
+        results = get_results(self.url, [10, 13])
+
+        # Then
+        self.assertEqual(results['10']['status'], 'unknown')
+        self.assertEqual(results['13']['status'], 'unknown')
+
+    def test_unknown_jobs_are_not_waited_for(self):
+        # When
+        start = time.time()
+        result = get_result(self.url, 'lost', block=True)
+        results = get_results(self.url, ['lost'], block=True)
+        fetched = fetch_results(self.url, ['lost'], block=True)
+
+        # Then
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(result['status'], 'unknown')
+        self.assertEqual(results['lost']['status'], 'unknown')
+        self.assertEqual(fetched['lost']['status'], 'unknown')
+
+    def test_results_are_sent_as_objects(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 4',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 4',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        submit(self.url, '20', json.dumps(testdata), '')
+        result = fetch_result(self.url, '20', block=True)
+
+        # Then
+        self.assertEqual(result['status'], 'done')
+        self.assertTrue(result['result']['success'])
+
+        # When
+        submit(self.url, '21', json.dumps(testdata), '')
+        result = get_result(self.url, '21', block=True)
+
+        # Then
+        self.assertTrue(json.loads(result['result'])['success'])
+
+    def test_large_submission_is_compressed(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 5\n' + '#' * 1000,
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 5',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        with patch('yaksh.code_server.SERVER_CLIENT_COMPRESS_SIZE', 100):
+            submit_batch(self.url, [(22, json.dumps(testdata), '')])
+        results = fetch_results(self.url, [22], block=True)
+
+        # Then
+        self.assertTrue(results['22']['result']['success'])
+
+    def test_malformed_jobs_are_rejected(self):
+        # When
+        r = requests.post(self.url + '/v2/jobs', data='{"jobs": [')
+
+        # Then
+        self.assertEqual(r.status_code, 400)
+
+    def test_submit_with_priority(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        submit(self.url, '0', json.dumps(testdata), '', priority='low')
+        result = get_result(self.url, '0', block=True)
+
+        # Then
+        self.assertTrue(json.loads(result.get('result'))['success'])
+
+        # When
+        r = requests.post(self.url, data=dict(
+            uid='0', json_data=json.dumps(testdata), user_dir='',
+            priority='urgent'
+        ))
+
+        # Then
+        self.assertEqual(r.status_code, 400)
+
     def test_server_pool_status(self):
         # Given
         url = "http://localhost:%s/" % SERVER_POOL_PORT
@@ -189,6 +825,7 @@ class TestCodeServer(unittest.TestCase):
         # Then
         expect = '5 processes, 0 running, 0 queued'
         self.assertTrue(expect in data)
+        self.assertTrue('0 expired, 0 evicted' in data)
 
     def test_killing_process_revives_it(self):
         # Given
@@ -224,6 +861,306 @@ class TestCodeServer(unittest.TestCase):
         expect = '5 processes, 0 running, 0 queued'
         self.assertTrue(expect in data)
 
+    def test_identical_submission_is_answered_from_cache(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def g(): return 7',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert g() == 7',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        submit(self.url, '60', json.dumps(testdata), '')
+        first = get_result(self.url, '60', block=True)
+        hits = self.server_pool.cache.hits
+
+        # When
+        submit(self.url, '61', json.dumps(testdata), '')
+        result = get_result(self.url, '61')
+
+        # Then
+        self.assertEqual(result['status'], 'done')
+        data = json.loads(result['result'])
+        first_data = json.loads(first['result'])
+        self.assertTrue(data.pop('cached'))
+        self.assertIn('resources', first_data)
+        first_data.pop('resources')
+        self.assertEqual(data, first_data)
+        self.assertEqual(self.server_pool.cache.hits - hits, 1)
+
+        # When
+        testdata['metadata']['cache_result'] = False
+        submit(self.url, '62', json.dumps(testdata), '')
+        result = get_result(self.url, '62', block=True)
+
+        # Then
+        self.assertTrue(json.loads(result['result'])['success'])
+        self.assertEqual(self.server_pool.cache.hits - hits, 1)
+
+    @patch('yaksh.code_server.SERVER_MAX_QUEUE_DEPTH', 2)
+    def test_submissions_rejected_when_queue_is_full(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'import time; time.sleep(1)',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': '',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        uids = list(range(50, 57))
+        submit_batch(self.url, [(uid, json.dumps(testdata), '')
+                                for uid in uids])
+
+        # When
+        r = requests.post(self.url, data=dict(
+            uid='57', json_data=json.dumps(testdata), user_dir=''
+        ))
+
+        # Then
+        self.assertEqual(r.status_code, 503)
+        self.assertTrue(int(r.headers['Retry-After']) >= 1)
+        with self.assertRaises(ServerBusyError):
+            submit(self.url, '57', json.dumps(testdata), '')
+
+        # When
+        results = get_results(self.url, uids, block=True)
+        submit(self.url, '57', json.dumps(testdata), '')
+        result = get_result(self.url, '57', block=True)
+
+        # Then
+        for uid in uids:
+            self.assertTrue(json.loads(results[str(uid)]['result'])['success'])
+        self.assertTrue(json.loads(result['result'])['success'])
+
+    @patch('yaksh.code_server.SERVER_HUNG_GRACE', 0)
+    @patch('yaksh.code_server.SERVER_TIMEOUT', 1)
+    def test_hung_process_is_stopped_and_replaced(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': ('import signal\n'
+                                'signal.signal(signal.SIGALRM, '
+                                'signal.SIG_IGN)\n'
+                                'while True: pass'),
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': '',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        restarted = self.server_pool.restarted
+        hung = self.server_pool.hung
+
+        # When
+        submit(self.url, '40', json.dumps(testdata), '')
+        result = get_result(self.url, '40', block=True)
+
+        # Then
+        data = json.loads(result.get('result'))
+        self.assertFalse(data['success'])
+        self.assertTrue('was stopped' in data['error'][0])
+        self.assertEqual(self.server_pool.restarted - restarted, 1)
+        self.assertEqual(self.server_pool.hung - hung, 1)
+
+        # When
+        url = "http://localhost:%s/" % SERVER_POOL_PORT
+        response = urllib.request.urlopen(url)
+        data = response.read().decode('utf-8')
+
+        # Then
+        self.assertTrue('5 processes, 0 running, 0 queued' in data)
+
+    @patch('yaksh.code_server.SERVER_MAX_JOBS_PER_WORKER', 1)
+    def test_workers_are_recycled_after_max_jobs(self):
+        # Given
+        def testdata(uid):
+            return {
+                'metadata': {
+                    'user_answer': 'def f(): return %d' % uid,
+                    'language': 'python',
+                    'partial_grading': False
+                },
+                'test_case_data': [{'test_case': 'assert f() == %d' % uid,
+                                    'test_case_type': 'standardtestcase',
+                                    'weight': 0.0}]
+            }
+        uids = list(range(20, 32))
+        recycled = self.server_pool.recycled
+
+        # When
+        submit_batch(self.url, [(uid, json.dumps(testdata(uid)), '')
+                                for uid in uids])
+        results = get_results(self.url, uids, block=True)
+
+        # Then
+        for uid in uids:
+            self.assertTrue(json.loads(results[str(uid)]['result'])['success'])
+        self.assertEqual(self.server_pool.recycled - recycled, len(uids))
+
+        # When
+        url = "http://localhost:%s/" % SERVER_POOL_PORT
+        response = urllib.request.urlopen(url)
+        data = response.read().decode('utf-8')
+
+        # Then
+        self.assertTrue('5 processes, 0 running, 0 queued' in data)
+
+
+class TestAutoscaling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "yaksh.python_assertion_evaluator.PythonAssertionEvaluator"
+        cls.patches = [
+            patch('yaksh.code_server.SERVER_SCALE_INTERVAL', 0.2),
+            patch('yaksh.code_server.SERVER_SCALE_DOWN_DELAY', 1),
+        ]
+        for p in cls.patches:
+            p.start()
+        cls.port = SERVER_POOL_PORT + 1
+        server_pool = ServerPool(n=1, pool_port=cls.port, min_workers=1,
+                                 max_workers=3)
+        cls.server_pool = server_pool
+        cls.server_thread = t = Thread(target=server_pool.run)
+        t.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server_pool.stop()
+        cls.server_thread.join()
+        for p in cls.patches:
+            p.stop()
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "python_assertion_evaluator.PythonAssertionEvaluator"
+
+    def test_workers_follow_the_queue(self):
+        # Given
+        def testdata(uid):
+            return {
+                'metadata': {
+                    'user_answer': 'import time; time.sleep(1); x = %d' % uid,
+                    'language': 'python',
+                    'partial_grading': False
+                },
+                'test_case_data': [{'test_case': '',
+                                    'test_case_type': 'standardtestcase',
+                                    'weight': 0.0}]
+            }
+        url = 'http://localhost:%s' % self.port
+        uids = list(range(6))
+
+        # When
+        submit_batch(url, [(uid, json.dumps(testdata(uid)), '')
+                           for uid in uids])
+        results = get_results(url, uids, block=True)
+
+        # Then
+        for uid in uids:
+            self.assertTrue(json.loads(results[str(uid)]['result'])['success'])
+        self.assertEqual(self.server_pool.scaled_up, 2)
+
+        # When
+        for i in range(50):
+            if self.server_pool.n == 1:
+                break
+            time.sleep(0.2)
+
+        # Then
+        self.assertEqual(self.server_pool.n, 1)
+        self.assertEqual(self.server_pool.scaled_down, 2)
+        response = urllib.request.urlopen(url)
+        self.assertTrue('1 processes, 0 running, 0 queued' in
+                        response.read().decode('utf-8'))
+
+
+class TestSharedBroker(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "yaksh.python_assertion_evaluator.PythonAssertionEvaluator"
+        broker = MemoryBroker(PRIORITIES)
+        cls.ports = (SERVER_POOL_PORT + 2, SERVER_POOL_PORT + 3)
+        cls.server_pools = [ServerPool(n=1, pool_port=port, broker=broker)
+                            for port in cls.ports]
+
+        def run():
+            cls.server_pools[1].start()
+            cls.server_pools[0].run()
+        cls.server_thread = t = Thread(target=run)
+        t.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for server_pool in cls.server_pools:
+            server_pool.stop()
+        cls.server_thread.join()
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "python_assertion_evaluator.PythonAssertionEvaluator"
+
+    def setUp(self):
+        self.urls = ['http://localhost:%s' % port for port in self.ports]
+
+    def make_testdata(self, uid):
+        return json.dumps({
+            'metadata': {
+                'user_answer': 'import time; time.sleep(0.5); x = %d' % uid,
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert x == %d' % uid,
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        })
+
+    def test_result_is_fetched_from_another_pool(self):
+        # When
+        submit(self.urls[0], '0', self.make_testdata(0), '')
+        result = get_result(self.urls[1], '0', block=True)
+
+        # Then
+        self.assertEqual(result['status'], 'done')
+        self.assertTrue(json.loads(result['result'])['success'])
+        self.assertEqual(get_result(self.urls[0], '0')['status'], 'unknown')
+
+    def test_pools_share_the_jobs(self):
+        # Given
+        uids = list(range(10, 14))
+        jobs_done = [sum(pool.jobs_done) for pool in self.server_pools]
+
+        # When
+        submit_batch(self.urls[0], [(uid, self.make_testdata(uid), '')
+                                    for uid in uids])
+        results = get_results(self.urls[1], uids, block=True)
+
+        # Then
+        for uid in uids:
+            self.assertTrue(json.loads(results[str(uid)]['result'])['success'])
+        for pool, done in zip(self.server_pools, jobs_done):
+            self.assertGreater(sum(pool.jobs_done), done)
+
+    def test_result_is_cached_by_the_pool_running_the_job(self):
+        # Given
+        data = self.make_testdata(20)
+
+        # When
+        submit(self.urls[0], '20', data, '')
+        get_result(self.urls[1], '20', block=True)
+
+        # Then
+        for pool in self.server_pools:
+            self.assertNotIn('20', pool.cache_keys)
+        self.assertTrue(any(pool.is_cached(json.loads(data))
+                            for pool in self.server_pools))
+
 
 if __name__ == '__main__':
     unittest.main()
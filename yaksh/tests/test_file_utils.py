@@ -0,0 +1,143 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import zipfile
+
+from yaksh.file_utils import FileCache, copy_files, get_file_cache
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self.job_dir = os.path.join(self.tmp, 'job')
+        os.mkdir(self.job_dir)
+        self.data_path = os.path.join(self.tmp, 'data.txt')
+        with open(self.data_path, 'w') as f:
+            f.write('2\n')
+        self.zip_path = os.path.join(self.tmp, 'data.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as zip_file:
+            zip_file.writestr('data/input.txt', '1 2\n')
+            zip_file.writestr('expected.txt', '3\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_file_is_kept_once(self):
+        # Given
+        cache = FileCache(self.cache_dir, 1024 * 1024)
+
+        # When
+        entry = cache.get(self.data_path)
+        same_entry = cache.get(shutil.copy(self.data_path,
+                                           os.path.join(self.tmp, 'b.txt')))
+
+        # Then
+        self.assertEqual(entry, same_entry)
+        self.assertEqual(
+            [name for name in os.listdir(self.cache_dir)
+             if not name.startswith('.')],
+            [os.path.basename(entry)]
+        )
+
+    def test_extracted_files_are_put_in_job_directory(self):
+        # Given
+        cache = FileCache(self.cache_dir, 1024 * 1024)
+        cache.copy_to(self.zip_path, True, self.job_dir)
+        os.remove(os.path.join(self.job_dir, 'expected.txt'))
+
+        # When
+        with patch('zipfile.ZipFile') as zip_file:
+            files = cache.copy_to(self.zip_path, True, self.job_dir)
+
+        # Then
+        zip_file.assert_not_called()
+        self.assertEqual(
+            sorted(files),
+            ['data', 'data.zip', 'data/input.txt', 'expected.txt']
+        )
+        with open(os.path.join(self.job_dir, 'data/input.txt')) as f:
+            self.assertEqual(f.read(), '1 2\n')
+
+    def test_copies_are_writable_and_do_not_change_the_cache(self):
+        # Given
+        cache = FileCache(self.cache_dir, 1024 * 1024)
+
+        # When
+        cache.copy_to(self.data_path, False, self.job_dir)
+        with open(os.path.join(self.job_dir, 'data.txt'), 'w') as f:
+            f.write('changed')
+        entry = cache.get(self.data_path)
+
+        # Then
+        with open(os.path.join(entry, 'file')) as f:
+            self.assertEqual(f.read(), '2\n')
+
+    def test_hard_links_are_used_when_asked(self):
+        # Given
+        cache = FileCache(self.cache_dir, 1024 * 1024, hardlinks=True)
+
+        # When
+        cache.copy_to(self.data_path, False, self.job_dir)
+        entry = cache.get(self.data_path)
+
+        # Then
+        self.assertTrue(os.path.samefile(
+            os.path.join(entry, 'file'), os.path.join(self.job_dir, 'data.txt')
+        ))
+
+    def test_least_recently_used_files_are_removed(self):
+        # Given
+        cache = FileCache(self.cache_dir, 5)
+        first = cache.get(self.data_path)
+        os.utime(first, (0, 0))
+
+        # When
+        second = cache.get(self.zip_path)
+
+        # Then
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+        # When
+        entry = cache.get(self.data_path)
+
+        # Then
+        self.assertEqual(entry, first)
+        self.assertTrue(os.path.exists(first))
+
+    def test_copy_files_uses_the_cache(self):
+        # Given
+        cache = FileCache(self.cache_dir, 1024 * 1024)
+        cur_dir = os.getcwd()
+
+        # When
+        os.chdir(self.job_dir)
+        try:
+            with patch('yaksh.file_utils.get_file_cache',
+                       return_value=cache):
+                files = copy_files([(self.data_path, False)])
+        finally:
+            os.chdir(cur_dir)
+
+        # Then
+        self.assertEqual(files, ['data.txt'])
+        self.assertTrue(os.path.exists(os.path.join(self.job_dir,
+                                                    'data.txt')))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir,
+                                                     '.paths'))), 1)
+
+    def test_cache_is_off_by_default(self):
+        # When
+        cache = get_file_cache()
+
+        # Then
+        self.assertIsNone(cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
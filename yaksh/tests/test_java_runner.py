@@ -0,0 +1,260 @@
+from __future__ import unicode_literals
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from yaksh.grader import OutputLimitExceeded, TimeoutException
+from yaksh.java_code_evaluator import JavaCodeEvaluator
+from yaksh.java_runner import JavaRunner, JavaRunnerError
+from yaksh.settings import MAX_OUTPUT_SIZE
+
+
+def encode(status, *fields):
+    data = [status.encode('utf-8'), b'\n']
+    for field in fields:
+        data.extend([str(len(field)).encode('utf-8'), b'\n', field])
+    return b''.join(data)
+
+
+class Pipe(io.BytesIO):
+    """Standard input of the fake JVM, kept readable once closed."""
+    def close(self):
+        pass
+
+
+class FakeProcess(object):
+    """Stands in for the JVM running YakshJavaRunner, replying with
+    `reply` and ending with `exit_code` when waited for."""
+    def __init__(self, reply, exit_code=0):
+        self.stdin = Pipe()
+        self.stdout = io.BytesIO(reply)
+        self.exit_code = exit_code
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self.exit_code = -9
+
+    def wait(self):
+        self.returncode = self.exit_code
+        return self.returncode
+
+
+class TestJavaRunner(unittest.TestCase):
+
+    def make_runner(self, reply, exit_code=0):
+        runner = JavaRunner()
+        runner.proc = proc = FakeProcess(reply, exit_code)
+        return runner, proc
+
+    def test_commands_are_framed(self):
+        # Given
+        runner, proc = self.make_runner(encode('ok', b''))
+
+        # When
+        result = runner.compile('Test', '\nclass Test {}')
+
+        # Then
+        self.assertEqual(proc.stdin.getvalue(),
+                         b'compile\n4\nTest13\nclass Test {}')
+        self.assertEqual(result[0].returncode, 0)
+        self.assertEqual(result[2], '')
+
+    def test_compilation_errors_are_returned(self):
+        # Given
+        runner, proc = self.make_runner(encode('error', b'Test:1: error'))
+
+        # When
+        proc_result, stdout, stderr = runner.compile('Test', 'class')
+
+        # Then
+        self.assertEqual(proc_result.returncode, 1)
+        self.assertEqual(stderr, 'Test:1: error')
+
+    def test_run_returns_status_and_output(self):
+        # Given
+        runner, proc = self.make_runner(
+            encode('ok', b'1', 'é'.encode('utf-8'), b'err')
+        )
+
+        # When
+        proc_result, stdout, stderr = runner.run('main', b'5', timeout=2)
+
+        # Then
+        self.assertEqual(proc.stdin.getvalue(), encode(
+            'run', b'main', b'5', b'2000', str(MAX_OUTPUT_SIZE).encode()
+        ))
+        self.assertEqual(proc_result.returncode, 1)
+        self.assertEqual(stdout, 'é')
+        self.assertEqual(stderr, 'err')
+        self.assertTrue(runner.is_running())
+
+    def test_runner_stops_when_threads_are_left_running(self):
+        # Given
+        runner, proc = self.make_runner(encode('stopped', b'0', b'out', b''))
+
+        # When
+        proc_result, stdout, stderr = runner.run('main')
+
+        # Then
+        self.assertEqual(proc_result.returncode, 0)
+        self.assertEqual(stdout, 'out')
+        self.assertFalse(runner.is_running())
+
+    def test_exit_status_is_that_of_the_jvm(self):
+        # Given
+        runner, proc = self.make_runner(encode('exit', b'out', b''),
+                                        exit_code=3)
+
+        # When
+        proc_result, stdout, stderr = runner.run('main')
+
+        # Then
+        self.assertEqual(proc_result.returncode, 3)
+        self.assertEqual(stdout, 'out')
+        self.assertFalse(runner.is_running())
+
+    def test_timeout(self):
+        # Given
+        runner, proc = self.make_runner(encode('timeout'))
+
+        # When / Then
+        with self.assertRaises(TimeoutException):
+            runner.run('main')
+        self.assertFalse(runner.is_running())
+
+    def test_output_limit(self):
+        # Given
+        runner, proc = self.make_runner(encode('toolong'))
+
+        # When / Then
+        with self.assertRaises(OutputLimitExceeded):
+            runner.run('main')
+        self.assertFalse(runner.is_running())
+
+    def test_runner_ending_unexpectedly(self):
+        # Given
+        runner, proc = self.make_runner(b'')
+
+        # When / Then
+        with self.assertRaises(JavaRunnerError):
+            runner.reset()
+        self.assertFalse(runner.is_running())
+
+    def test_runner_out_of_step_is_stopped(self):
+        # Given
+        # The ready line of a start interrupted before reading it is left
+        # in front of the replies to the next commands.
+        runner, proc = self.make_runner(
+            b'ready\n' + encode('ok') + encode('ok', b'')
+        )
+
+        # When / Then
+        with self.assertRaises(JavaRunnerError):
+            runner.reset()
+        self.assertFalse(runner.is_running())
+
+    def test_bad_replies_are_runner_errors(self):
+        # Given
+        runner, proc = self.make_runner(encode('ok') + b'ok\n')
+
+        # When / Then
+        with self.assertRaises(JavaRunnerError):
+            runner.compile('Test', 'class Test {}')
+        self.assertFalse(runner.is_running())
+
+    def test_interrupted_start_leaves_no_runner(self):
+        # Given
+        runner = JavaRunner()
+        runner.class_dir = 'classes'
+        proc = FakeProcess(b'')
+        proc.stdout = MagicMock()
+        proc.stdout.readline.side_effect = TimeoutException('timeout')
+
+        # When
+        with patch('yaksh.java_runner.subprocess.Popen', return_value=proc):
+            with self.assertRaises(TimeoutException):
+                runner.start()
+
+        # Then
+        self.assertIsNone(runner.proc)
+        self.assertEqual(proc.returncode, -9)
+
+    def test_interrupted_build_leaves_no_classes(self):
+        # Given
+        runner = JavaRunner()
+        proc = FakeProcess(b'')
+        proc.communicate = MagicMock(side_effect=TimeoutException('timeout'))
+
+        # When
+        with patch('yaksh.java_runner.subprocess.Popen', return_value=proc):
+            with self.assertRaises(TimeoutException):
+                runner.start()
+
+        # Then
+        self.assertIsNone(runner.class_dir)
+        self.assertIsNone(runner.proc)
+        self.assertEqual(proc.returncode, -9)
+
+
+class TestJavaRunnerFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.cur_dir = os.getcwd()
+        self.in_dir = tempfile.mkdtemp()
+        os.chdir(self.in_dir)
+        self.evaluator = JavaCodeEvaluator(
+            {'user_answer': 'class Test {}', 'file_paths': None,
+             'partial_grading': False},
+            {'test_case': 'class main {}', 'weight': 0.0, 'hidden': False}
+        )
+
+    def tearDown(self):
+        os.chdir(self.cur_dir)
+        shutil.rmtree(self.in_dir)
+
+    def test_javac_is_used_when_runner_fails_to_compile(self):
+        # Given
+        runner = MagicMock()
+        runner.reset.side_effect = JavaRunnerError('gone')
+
+        # When
+        with patch('yaksh.java_code_evaluator.get_java_runner',
+                   return_value=runner), \
+                patch.object(JavaCodeEvaluator, '_compile_with_javac',
+                             return_value='compiled') as compile_with_javac:
+            result = self.evaluator.compile_code()
+
+        # Then
+        self.assertEqual(result, 'compiled')
+        compile_with_javac.assert_called_once_with()
+        self.assertIsNone(self.evaluator.runner)
+
+    def test_java_is_used_when_runner_fails_to_run(self):
+        # Given
+        self.evaluator.runner = runner = MagicMock()
+        runner.run.side_effect = JavaRunnerError('gone')
+        self.evaluator.ref_class_name = 'main'
+        self.evaluator.run_command_args = 'java -cp . main'
+
+        # When
+        with patch.object(JavaCodeEvaluator, '_compile_with_javac') as \
+                compile_with_javac, \
+                patch.object(JavaCodeEvaluator, '_run_command',
+                             return_value='ran') as run_command:
+            result = self.evaluator._run_test_code()
+
+        # Then
+        self.assertEqual(result, 'ran')
+        compile_with_javac.assert_called_once_with()
+        self.assertEqual(run_command.call_args[0][0], 'java -cp . main')
+        self.assertIsNone(self.evaluator.runner)
+
+
+if __name__ == '__main__':
+    unittest.main()
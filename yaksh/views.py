@@ -39,7 +39,7 @@ try:
 except (ImportError, ModuleNotFoundError):
     # Celery not available, set app to None
     app = None
-from yaksh.code_server import get_result as get_result_from_code_server
+from yaksh.code_server import fetch_result as get_result_from_code_server
 from yaksh.models import (
     Answer, AnswerPaper, AssignmentUpload, Course, FileUpload, FloatTestCase,
     HookTestCase, IntegerTestCase, McqTestCase, Profile,
@@ -926,13 +926,16 @@ def check(request, q_id, attempt_num=None, questionpaper_id=None,
         result = paper.validate_answer(
             user_answer, current_question, json_data, uid
         )
+        if 'retry_after' in result:
+            # The code server is too busy, ask the user to try again.
+            return JsonResponse(result)
         if current_question.type == 'code':
             if (paper.time_left() <= 0 and not
                     paper.question_paper.quiz.is_exercise):
                 url = '{0}:{1}'.format(SERVER_HOST_NAME, SERVER_POOL_PORT)
                 result_details = get_result_from_code_server(url, uid,
                                                              block=True)
-                result = json.loads(result_details.get('result'))
+                result = result_details.get('result')
                 next_question, error_message, paper = _update_paper(
                     request, uid, result)
                 return show_question(request, next_question, paper,
@@ -960,7 +963,7 @@ def get_result(request, uid, course_id, module_id):
     result_state = get_result_from_code_server(url, uid)
     result['status'] = result_state.get('status')
     if result['status'] == 'done':
-        result = json.loads(result_state.get('result'))
+        result = result_state.get('result')
         template_path = os.path.join(*[os.path.dirname(__file__),
                                        'templates', 'yaksh',
                                        'error_template.html'
@@ -989,6 +992,7 @@ def _update_paper(request, uid, result):
     new_answer = Answer.objects.get(id=uid)
     current_question = new_answer.question
     paper = new_answer.answerpaper_set.first()
+    new_answer.set_resource_usage(result)
 
     if result.get('success'):
         new_answer.marks = (current_question.points * result['weight'] /